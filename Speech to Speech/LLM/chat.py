@@ -6,6 +6,8 @@ class Chat:
     def __init__(self, size):
         self.size = size
         self.init_chat_message = None
+        # what the assistant said to open the conversation, before the first user turn
+        self.opening_message = None
         # maxlen is necessary pair, since a each new step we add an prompt and assitant answer
         self.buffer = []
 
@@ -15,11 +17,32 @@ class Chat:
             self.buffer.pop(0)
             self.buffer.pop(0)
 
+    def checkpoint(self):
+        """Returns the state of the history, to `rollback` to if the turn being answered is discarded."""
+        return list(self.buffer)
+
+    def rollback(self, checkpoint):
+        self.buffer = list(checkpoint)
+
+    def fork(self):
+        """
+        Returns an empty chat with the same size and initial message.
+        """
+        chat = Chat(self.size)
+        chat.init_chat(self.init_chat_message)
+        chat.opening_message = self.opening_message
+        return chat
+
     def init_chat(self, init_chat_message):
         self.init_chat_message = init_chat_message
 
+    def open_with(self, text):
+        """Seeds the conversation with the first assistant turn, kept however long the history grows."""
+        self.opening_message = {"role": "assistant", "content": text}
+
     def to_list(self):
-        if self.init_chat_message:
-            return [self.init_chat_message] + self.buffer
+        prefix = [message for message in (self.init_chat_message, self.opening_message) if message]
+        if prefix:
+            return prefix + self.buffer
         else:
             return self.buffer
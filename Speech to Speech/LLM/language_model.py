@@ -3,11 +3,14 @@ from transformers import (
     AutoModelForCausalLM,
     AutoTokenizer,
     pipeline,
+    StoppingCriteria,
+    StoppingCriteriaList,
     TextIteratorStreamer,
 )
 import torch
 
 from LLM.chat import Chat
+from LLM.word_chunker import WordChunker
 from baseHandler import BaseHandler
 from rich.console import Console
 import logging
@@ -33,11 +36,27 @@ WHISPER_LANGUAGE_TO_LLM_LANGUAGE = {
     "nl": "dutch",
 }
 
+class TurnCancelledCriteria(StoppingCriteria):
+    """Stops the generation as soon as the turn being answered is cancelled."""
+
+    def __init__(self, handler):
+        self.handler = handler
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.full(
+            (input_ids.shape[0],), self.handler.turn_cancelled, dtype=torch.bool, device=input_ids.device
+        )
+
+
 class LanguageModelHandler(BaseHandler):
     """
     Handles the language model part.
     """
 
+    trace_event = "first_sentence"
+    waits_for_commit = True
+    joins_segments = True
+
     def setup(
         self,
         model_name="microsoft/Phi-3-mini-4k-instruct",
@@ -48,8 +67,10 @@ class LanguageModelHandler(BaseHandler):
         chat_size=1,
         init_chat_role=None,
         init_chat_prompt="You are a helpful AI assistant.",
+        stream_deltas=False,
     ):
         self.device = device
+        self.stream_deltas = stream_deltas
         self.torch_dtype = getattr(torch, torch_dtype)
 
         self.tokenizer = AutoTokenizer.from_pretrained(model_name)
@@ -66,9 +87,11 @@ class LanguageModelHandler(BaseHandler):
         )
         self.gen_kwargs = {
             "streamer": self.streamer,
+            "stopping_criteria": StoppingCriteriaList([TurnCancelledCriteria(self)]),
             "return_full_text": False,
             **gen_kwargs,
         }
+        self.streaming = False
 
         self.chat = Chat(chat_size)
         if init_chat_role:
@@ -116,6 +139,20 @@ class LanguageModelHandler(BaseHandler):
                 f"{self.__class__.__name__}:  warmed up! time: {start_event.elapsed_time(end_event) * 1e-3:.3f} s"
             )
 
+    def setup_session(self):
+        # the streamer is a queue of generated text, each conversation needs its own
+        self.streamer = TextIteratorStreamer(
+            self.tokenizer,
+            skip_prompt=True,
+            skip_special_tokens=True,
+        )
+        self.gen_kwargs = {
+            **self.gen_kwargs,
+            "streamer": self.streamer,
+            "stopping_criteria": StoppingCriteriaList([TurnCancelledCriteria(self)]),
+        }
+        self.chat = self.chat.fork()
+
     def process(self, prompt):
         logger.debug("infering language model...")
         language_code = None
@@ -125,28 +162,58 @@ class LanguageModelHandler(BaseHandler):
                 language_code = language_code[:-5]
                 prompt = f"Please reply to my message in {WHISPER_LANGUAGE_TO_LLM_LANGUAGE[language_code]}. " + prompt
 
-        self.chat.append({"role": self.user_role, "content": prompt})
+        self.chat_checkpoint = self.chat.checkpoint()
+        self.user_message = {"role": self.user_role, "content": prompt}
+        self.generated_text = ""
+        self.chat.append(self.user_message)
         thread = Thread(
             target=self.pipe, args=(self.chat.to_list(),), kwargs=self.gen_kwargs
         )
         thread.start()
         if self.device == "mps":
-            generated_text = ""
             for new_text in self.streamer:
-                generated_text += new_text
-            printable_text = generated_text
+                self.mark("first_llm_token")
+                self.generated_text += new_text
+            printable_text = self.generated_text
             torch.mps.empty_cache()
         else:
-            generated_text, printable_text = "", ""
+            printable_text = ""
+            words = WordChunker()
+            self.streaming = True
             for new_text in self.streamer:
-                generated_text += new_text
+                self.mark("first_llm_token")
+                self.generated_text += new_text
+                if self.stream_deltas:
+                    completed = words.push(new_text)
+                    if completed:
+                        yield (completed, language_code, False)
+                    continue
                 printable_text += new_text
                 sentences = sent_tokenize(printable_text)
                 if len(sentences) > 1:
                     yield (sentences[0], language_code)
                     printable_text = new_text
+            self.streaming = False
+            if self.stream_deltas:
+                printable_text = words.flush()
+
+        self.chat.append({"role": "assistant", "content": self.generated_text})
 
-        self.chat.append({"role": "assistant", "content": generated_text})
+        if self.stream_deltas:
+            yield (printable_text, language_code, True)
+        else:
+            # don't forget last sentence
+            yield (printable_text, language_code)
 
-        # don't forget last sentence
-        yield (printable_text, language_code)
+    def on_turn_cancelled(self):
+        if self.streaming:
+            # the generation stops at the next token, flush what it streamed so the next turn starts clean
+            for _ in self.streamer:
+                pass
+            self.streaming = False
+        # a discarded speculative turn leaves no trace in the history
+        self.chat.rollback(self.chat_checkpoint)
+        if self.current_trace.committed:
+            # the user barged in: keep what was said so far, so that user and assistant messages still alternate
+            self.chat.append(self.user_message)
+            self.chat.append({"role": "assistant", "content": self.generated_text})
@@ -1,5 +1,6 @@
 import logging
 from LLM.chat import Chat
+from LLM.word_chunker import WordChunker
 from baseHandler import BaseHandler
 from mlx_lm import load, stream_generate, generate
 from rich.console import Console
@@ -29,6 +30,10 @@ class MLXLanguageModelHandler(BaseHandler):
     Handles the language model part.
     """
 
+    trace_event = "first_sentence"
+    waits_for_commit = True
+    joins_segments = True
+
     def setup(
         self,
         model_name="microsoft/Phi-3-mini-4k-instruct",
@@ -39,8 +44,10 @@ class MLXLanguageModelHandler(BaseHandler):
         chat_size=1,
         init_chat_role=None,
         init_chat_prompt="You are a helpful AI assistant.",
+        stream_deltas=False,
     ):
         self.model_name = model_name
+        self.stream_deltas = stream_deltas
         self.model, self.tokenizer = load(self.model_name)
         self.gen_kwargs = gen_kwargs
 
@@ -73,6 +80,9 @@ class MLXLanguageModelHandler(BaseHandler):
                 verbose=False,
             )
 
+    def setup_session(self):
+        self.chat = self.chat.fork()
+
     def process(self, prompt):
         logger.debug("infering language model...")
         language_code = None
@@ -83,7 +93,10 @@ class MLXLanguageModelHandler(BaseHandler):
                 language_code = language_code[:-5]
                 prompt = f"Please reply to my message in {WHISPER_LANGUAGE_TO_LLM_LANGUAGE[language_code]}. " + prompt
 
-        self.chat.append({"role": self.user_role, "content": prompt})
+        self.chat_checkpoint = self.chat.checkpoint()
+        self.user_message = {"role": self.user_role, "content": prompt}
+        self.generated_text = ""
+        self.chat.append(self.user_message)
 
         # Remove system messages if using a Gemma model
         if "gemma" in self.model_name.lower():
@@ -96,20 +109,36 @@ class MLXLanguageModelHandler(BaseHandler):
         prompt = self.tokenizer.apply_chat_template(
             chat_messages, tokenize=False, add_generation_prompt=True
         )
-        output = ""
         curr_output = ""
+        words = WordChunker()
         for t in stream_generate(
             self.model,
             self.tokenizer,
             prompt,
             max_tokens=self.gen_kwargs["max_new_tokens"],
         ):
-            output += t.text
+            self.mark("first_llm_token")
+            new_text = t.text.replace("<|end|>", "")
+            self.generated_text += new_text
+            if self.stream_deltas:
+                completed = words.push(new_text)
+                if completed:
+                    yield (completed, language_code, False)
+                continue
             curr_output += t.text
             if curr_output.endswith((".", "?", "!", "<|end|>")):
                 yield (curr_output.replace("<|end|>", ""), language_code)
                 curr_output = ""
-        generated_text = output.replace("<|end|>", "")
         torch.mps.empty_cache()
 
-        self.chat.append({"role": "assistant", "content": generated_text})
+        self.chat.append({"role": "assistant", "content": self.generated_text})
+        if self.stream_deltas:
+            yield (words.flush(), language_code, True)
+
+    def on_turn_cancelled(self):
+        # a discarded speculative turn leaves no trace in the history
+        self.chat.rollback(self.chat_checkpoint)
+        if self.current_trace.committed:
+            # the user barged in: keep what was said so far, so that user and assistant messages still alternate
+            self.chat.append(self.user_message)
+            self.chat.append({"role": "assistant", "content": self.generated_text})
@@ -3,10 +3,11 @@ import time
 
 from nltk import sent_tokenize
 from rich.console import Console
-from openai import OpenAI
+from openai import AsyncOpenAI
 
-from baseHandler import BaseHandler
+from baseHandler import AsyncBaseHandler
 from LLM.chat import Chat
+from LLM.word_chunker import WordChunker
 
 logger = logging.getLogger(__name__)
 
@@ -21,10 +22,18 @@ WHISPER_LANGUAGE_TO_LLM_LANGUAGE = {
     "ko": "korean",
 }
 
-class OpenApiModelHandler(BaseHandler):
+class OpenApiModelHandler(AsyncBaseHandler):
     """
-    Handles the language model part.
+    Handles the language model part, through an OpenAI compatible API.
+    Requests are made with the async client, so the handlers of every session share the event loop and the
+    connection pool.
+    With `stream_deltas`, the reply is yielded word by word as it streams rather than sentence by sentence
+    (see `WordChunker`).
     """
+
+    trace_event = "first_sentence"
+    waits_for_commit = True
+    joins_segments = True
     def setup(
         self,
         model_name="deepseek-chat",
@@ -37,9 +46,11 @@ class OpenApiModelHandler(BaseHandler):
         chat_size=1,
         init_chat_role="system",
         init_chat_prompt="You are a helpful AI assistant.",
+        stream_deltas=False,
     ):
         self.model_name = model_name
         self.stream = stream
+        self.stream_deltas = stream_deltas
         self.chat = Chat(chat_size)
         if init_chat_role:
             if not init_chat_prompt:
@@ -48,13 +59,14 @@ class OpenApiModelHandler(BaseHandler):
                 )
             self.chat.init_chat({"role": init_chat_role, "content": init_chat_prompt})
         self.user_role = user_role
-        self.client = OpenAI(api_key=api_key, base_url=base_url)
-        self.warmup()
+        self.client = AsyncOpenAI(api_key=api_key, base_url=base_url)
+        # the client must be used on the loop that runs the handler
+        self.run_sync(self.warmup())
 
-    def warmup(self):
+    async def warmup(self):
         logger.info(f"Warming up {self.__class__.__name__}")
         start = time.time()
-        response = self.client.chat.completions.create(
+        response = await self.client.chat.completions.create(
             model=self.model_name,
             messages=[
                 {"role": "system", "content": "You are a helpful assistant"},
@@ -66,7 +78,11 @@ class OpenApiModelHandler(BaseHandler):
         logger.info(
             f"{self.__class__.__name__}:  warmed up! time: {(end - start):.3f} s"
         )
-    def process(self, prompt):
+
+    def setup_session(self):
+        self.chat = self.chat.fork()
+
+    async def process(self, prompt):
             logger.debug("call api language model...")
             
 
@@ -77,28 +93,60 @@ class OpenApiModelHandler(BaseHandler):
                     language_code = language_code[:-5]
                     prompt = f"Please reply to my message in {WHISPER_LANGUAGE_TO_LLM_LANGUAGE[language_code]}. " + prompt
             
-            self.chat.append({"role": self.user_role, "content": prompt})
+            self.chat_checkpoint = self.chat.checkpoint()
+            self.user_message = {"role": self.user_role, "content": prompt}
+            self.generated_text = ""
+            self.chat.append(self.user_message)
 
-            response = self.client.chat.completions.create(
+            response = await self.client.chat.completions.create(
                 model=self.model_name,
                 messages=self.chat.to_list(),
                 stream=self.stream
             )
             if self.stream:
-                generated_text, printable_text = "", ""
-                for chunk in response:
-                    new_text = chunk.choices[0].delta.content or ""
-                    generated_text += new_text
-                    printable_text += new_text
-                    sentences = sent_tokenize(printable_text)
-                    if len(sentences) > 1:
-                        yield sentences[0], language_code
-                        printable_text = new_text
-                self.chat.append({"role": "assistant", "content": generated_text})
-                # don't forget last sentence
-                yield printable_text, language_code
+                printable_text = ""
+                words = WordChunker()
+                try:
+                    async for chunk in response:
+                        if self.turn_cancelled:
+                            self.on_turn_cancelled()
+                            return
+                        self.mark("first_llm_token")
+                        new_text = chunk.choices[0].delta.content or ""
+                        self.generated_text += new_text
+                        if self.stream_deltas:
+                            completed = words.push(new_text)
+                            if completed:
+                                yield completed, language_code, False
+                            continue
+                        printable_text += new_text
+                        sentences = sent_tokenize(printable_text)
+                        if len(sentences) > 1:
+                            yield sentences[0], language_code
+                            printable_text = new_text
+                finally:
+                    # also reached when the handler closes the generator on a cancelled turn: stop the server
+                    # generating rather than leaving the HTTP stream open until it finishes
+                    await response.close()
+                self.chat.append({"role": "assistant", "content": self.generated_text})
+                if self.stream_deltas:
+                    yield words.flush(), language_code, True
+                else:
+                    # don't forget last sentence
+                    yield printable_text, language_code
             else:
-                generated_text = response.choices[0].message.content
-                self.chat.append({"role": "assistant", "content": generated_text})
-                yield generated_text, language_code
+                self.mark("first_llm_token")
+                self.generated_text = response.choices[0].message.content
+                self.chat.append({"role": "assistant", "content": self.generated_text})
+                if self.stream_deltas:
+                    yield self.generated_text, language_code, True
+                else:
+                    yield self.generated_text, language_code
 
+    def on_turn_cancelled(self):
+        # a discarded speculative turn leaves no trace in the history
+        self.chat.rollback(self.chat_checkpoint)
+        if self.current_trace.committed:
+            # the user barged in: keep what was said so far, so that user and assistant messages still alternate
+            self.chat.append(self.user_message)
+            self.chat.append({"role": "assistant", "content": self.generated_text})
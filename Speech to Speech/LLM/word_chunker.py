@@ -0,0 +1,20 @@
+class WordChunker:
+    """
+    Cuts the text streamed by an LLM at word boundaries, for a TTS synthesizing the text as it comes rather than
+    sentence by sentence (`--elevenlabs_tts_websocket`). `push` returns the words completed by a delta, so that a word
+    split across deltas is never sent in two parts, and `flush` what is left at the end of the reply.
+    The LLM handlers then yield `(text, language_code, end_of_turn)` items, `end_of_turn` being True for the last one.
+    """
+
+    def __init__(self):
+        self.pending = ""
+
+    def push(self, text):
+        self.pending += text
+        end = max(self.pending.rfind(" "), self.pending.rfind("\n")) + 1
+        chunk, self.pending = self.pending[:end], self.pending[end:]
+        return chunk
+
+    def flush(self):
+        chunk, self.pending = self.pending, ""
+        return chunk
@@ -7,10 +7,10 @@ from typing import Union
 
 import numpy as np
 from rich.console import Console
-from baseHandler import BaseHandler
+from baseHandler import AsyncBaseHandler
 
 try:
-    from elevenlabs.client import ElevenLabs
+    from elevenlabs.client import AsyncElevenLabs
 except Exception as e:
     raise ImportError("elevenlabs package not installed. Run `pip install elevenlabs`") from e
 
@@ -20,15 +20,18 @@ logger = logging.getLogger(__name__)
 __all__ = ["ElevenLabsSTTHandler"]
 
 
-class ElevenLabsSTTHandler(BaseHandler):
+class ElevenLabsSTTHandler(AsyncBaseHandler):
     """
     Speech-to-Text via ElevenLabs Scribe (remote service).
+    Runs on the shared event loop with the async client.
 
     setup(model_name="scribe_v1", device="cpu", compute_type="auto", gen_kwargs={})
     process(audio) -> yields transcript string
     cleanup()
     """
 
+    trace_event = "transcript_ready"
+
     def setup(
         self,
         model_name: str = "scribe_v1",
@@ -44,9 +47,9 @@ class ElevenLabsSTTHandler(BaseHandler):
         base_url = self.gen_kwargs.pop("base_url", "https://api.elevenlabs.io")
         if not api_key:
             logger.warning("ELEVENLABS_API_KEY not set; provide via env or gen_kwargs['api_key']")
-        self.client = ElevenLabs(api_key=api_key, base_url=base_url)
+        self.client = AsyncElevenLabs(api_key=api_key, base_url=base_url)
 
-    def process(self, audio: Union[bytes, bytearray, np.ndarray, str, BytesIO]):
+    async def process(self, audio: Union[bytes, bytearray, np.ndarray, str, BytesIO]):
         logger.debug("Inferring ElevenLabs STT...")
         pipeline_start = perf_counter()
 
@@ -56,7 +59,7 @@ class ElevenLabsSTTHandler(BaseHandler):
             kwargs["file_format"] = file_format  # e.g., "pcm_s16le_16"
 
         try:
-            resp = self.client.speech_to_text.convert(
+            resp = await self.client.speech_to_text.convert(
                 file=file_obj,
                 model_id=self.model_id,
                 **kwargs,
@@ -1,6 +1,5 @@
 import logging
 import os
-from time import perf_counter
 
 from faster_whisper import WhisperModel
 from rich.console import Console
@@ -17,6 +16,8 @@ class FasterWhisperSTTHandler(BaseHandler):
     Handles the Speech To Text generation using a Whisper model.
     """
 
+    trace_event = "transcript_ready"
+
     def setup(
         self,
         model_name: str = "tiny.en",
@@ -32,9 +33,6 @@ class FasterWhisperSTTHandler(BaseHandler):
     def process(self, audio):
         logger.debug("infering faster whisper...")
 
-        global pipeline_start
-        pipeline_start = perf_counter()
-
         segments, info = self.model.transcribe(audio, **self.gen_kwargs)
         output_text = []
 
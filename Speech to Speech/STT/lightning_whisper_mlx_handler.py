@@ -1,5 +1,4 @@
 import logging
-from time import perf_counter
 from baseHandler import BaseHandler
 from lightning_whisper_mlx import LightningWhisperMLX
 import numpy as np
@@ -32,6 +31,8 @@ class LightningWhisperSTTHandler(BaseHandler):
     Handles the Speech To Text generation using a Whisper model.
     """
 
+    trace_event = "transcript_ready"
+
     def setup(
         self,
         model_name="distil-large-v3",
@@ -63,9 +64,6 @@ class LightningWhisperSTTHandler(BaseHandler):
     def process(self, spoken_prompt):
         logger.debug("infering whisper...")
 
-        global pipeline_start
-        pipeline_start = perf_counter()
-
         if self.start_language != 'auto':
             transcription_dict = self.model.transcribe(spoken_prompt, language=self.start_language)
         else:
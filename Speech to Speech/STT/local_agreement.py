@@ -0,0 +1,58 @@
+import re
+
+
+def normalize(word):
+    """Words are compared without case and punctuation, which Whisper revises as the context grows."""
+    return re.sub(r"[^\w']", "", word.lower())
+
+
+class LocalAgreement:
+    """
+    Incremental transcription of a growing utterance with the local agreement policy: the words on which two
+    consecutive hypotheses agree are stable, i.e. they will not change however the utterance goes on.
+    Hypotheses are lists of segments, `(text, end)` with `end` in seconds from `offset`, the start of the audio that
+    is still transcribed. Once every word of a segment is stable, the segment is committed and the audio before its end
+    is no longer transcribed: at the end of the utterance, only the audio after the last committed segment is left.
+    """
+
+    def __init__(self, sample_rate=16000):
+        self.sample_rate = sample_rate
+        self.reset()
+
+    def reset(self, utterance_id=None):
+        self.utterance_id = utterance_id
+        # first sample of the audio left to transcribe
+        self.offset = 0
+        # words of the committed segments
+        self.committed = []
+        # words of the last hypothesis, for the audio from `offset`
+        self.previous = []
+
+    def update(self, segments):
+        """Takes the hypothesis for the audio from `offset`, returns the stable words of the whole utterance."""
+        words = [word for text, _ in segments for word in text.split()]
+        agreed = 0
+        for previous, word in zip(self.previous, words):
+            if normalize(previous) != normalize(word):
+                break
+            agreed += 1
+
+        consumed = 0
+        committed_end = None
+        # the last segment runs to the end of the audio, where the last word may be cut
+        for text, end in segments[:-1]:
+            segment_words = text.split()
+            if consumed + len(segment_words) > agreed or end is None:
+                break
+            self.committed += segment_words
+            consumed += len(segment_words)
+            committed_end = end
+        if committed_end is not None:
+            self.offset += int(committed_end * self.sample_rate)
+
+        self.previous = words[consumed:]
+        return self.committed + words[consumed:agreed]
+
+    def transcript(self, tail):
+        """Full transcript of the utterance, given the transcript of its audio from `offset`."""
+        return " ".join(self.committed + tail.split())
@@ -1,5 +1,4 @@
 import logging
-from time import perf_counter
 
 from baseHandler import BaseHandler
 from funasr import AutoModel
@@ -22,6 +21,8 @@ class ParaformerSTTHandler(BaseHandler):
     This model was contributed by @wuhongsheng.
     """
 
+    trace_event = "transcript_ready"
+
     def setup(
         self,
         model_name="paraformer-zh",
@@ -47,9 +48,6 @@ class ParaformerSTTHandler(BaseHandler):
     def process(self, spoken_prompt):
         logger.debug("infering paraformer...")
 
-        global pipeline_start
-        pipeline_start = perf_counter()
-
         pred_text = (
             self.model.generate(spoken_prompt)[0]["text"].strip().replace(" ", "")
         )
@@ -1,9 +1,10 @@
-from time import perf_counter
 from transformers import AutoProcessor, AutoModelForSpeechSeq2Seq
 import torch
 
 from copy import copy
 from baseHandler import BaseHandler
+from STT.local_agreement import LocalAgreement
+from utils.utterance import Utterance
 from rich.console import Console
 import logging
 
@@ -29,8 +30,12 @@ SUPPORTED_LANGUAGES = [
 class WhisperSTTHandler(BaseHandler):
     """
     Handles the Speech To Text generation using a Whisper model.
+    With partial transcription, the utterance is transcribed while the user speaks and stable words are committed
+    with a local agreement policy (see `STT.local_agreement`).
     """
 
+    trace_event = "transcript_ready"
+
     def setup(
         self,
         model_name="distil-whisper/distil-large-v3",
@@ -45,6 +50,7 @@ class WhisperSTTHandler(BaseHandler):
         self.compile_mode = compile_mode
         self.gen_kwargs = gen_kwargs
         self.start_language = language
+        self.agreement = LocalAgreement()
         self.last_language = language if language != "auto" else None
         if self.last_language is not None:
             self.gen_kwargs["language"] = self.last_language
@@ -63,6 +69,9 @@ class WhisperSTTHandler(BaseHandler):
             )
         self.warmup()
 
+    def setup_session(self):
+        self.agreement = LocalAgreement()
+
     def prepare_model_inputs(self, spoken_prompt):
         input_features = self.processor(
             spoken_prompt, sampling_rate=16000, return_tensors="pt"
@@ -113,10 +122,41 @@ class WhisperSTTHandler(BaseHandler):
             )
 
     def process(self, spoken_prompt):
-        logger.debug("infering whisper...")
+        if isinstance(spoken_prompt, Utterance):
+            yield from self.process_utterance(spoken_prompt)
+            return
 
-        global pipeline_start
-        pipeline_start = perf_counter()
+        pred_text, language_code = self.transcribe(spoken_prompt)
+        console.print(f"[yellow]USER: {pred_text}")
+        yield (pred_text, language_code)
+
+    def process_utterance(self, utterance):
+        """
+        Partial transcription: partial utterances advance the local agreement, so that at the end of the utterance
+        only the audio after its last stable segment is transcribed.
+        """
+        if utterance.utterance_id != self.agreement.utterance_id:
+            self.agreement.reset(utterance.utterance_id)
+        audio = utterance.audio[self.agreement.offset :]
+
+        if not utterance.final:
+            if self.queue_in.qsize() > 0:
+                # a newer partial, or the end of the utterance, is already waiting
+                return
+            stable = self.agreement.update(self.transcribe_segments(audio))
+            logger.debug(f"Stable transcript: {' '.join(stable)}")
+            return
+
+        logger.debug(
+            f"Transcribing the last {len(audio) / 16000:.2f} s of a {len(utterance.audio) / 16000:.2f} s utterance"
+        )
+        tail, language_code = self.transcribe(audio)
+        pred_text = self.agreement.transcript(tail)
+        console.print(f"[yellow]USER: {pred_text}")
+        yield (pred_text, language_code)
+
+    def transcribe(self, spoken_prompt):
+        logger.debug("infering whisper...")
 
         input_features = self.prepare_model_inputs(spoken_prompt)
         pred_ids = self.model.generate(input_features, **self.gen_kwargs)
@@ -141,10 +181,19 @@ class WhisperSTTHandler(BaseHandler):
         ]  # remove "<|" and "|>"
 
         logger.debug("finished whisper inference")
-        console.print(f"[yellow]USER: {pred_text}")
         logger.debug(f"Language Code Whisper: {language_code}")
 
         if self.start_language == "auto":
             language_code += "-auto"
 
-        yield (pred_text, language_code)
+        return pred_text, language_code
+
+    def transcribe_segments(self, spoken_prompt):
+        """Transcribes with timestamps, returns the `(text, end)` segments of the local agreement."""
+        input_features = self.prepare_model_inputs(spoken_prompt)
+        gen_kwargs = {**self.gen_kwargs, "return_timestamps": True}
+        if self.last_language is not None:
+            gen_kwargs["language"] = self.last_language
+        pred_ids = self.model.generate(input_features, **gen_kwargs)
+        decoded = self.processor.tokenizer.decode(pred_ids[0], output_offsets=True)
+        return [(offset["text"], offset["timestamp"][1]) for offset in decoded["offsets"]]
@@ -1,11 +1,12 @@
 import ChatTTS
 import logging
 from baseHandler import BaseHandler
-import librosa
 import numpy as np
 from rich.console import Console
 import torch
 
+from utils.audio import FrameBuilder, StreamingResampler, float32_to_pcm16, split_frames
+
 logging.basicConfig(
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
 )
@@ -14,7 +15,13 @@ logger = logging.getLogger(__name__)
 console = Console()
 
 
+# sampling rate of the audio generated by ChatTTS
+CHAT_TTS_SAMPLE_RATE = 24000
+
+
 class ChatTTSHandler(BaseHandler):
+    trace_event = "first_tts_audio"
+
     def setup(
         self,
         should_listen,
@@ -29,6 +36,8 @@ class ChatTTSHandler(BaseHandler):
         self.model.load(compile=False)  # Doesn't work for me with True
         self.chunk_size = chunk_size
         self.stream = stream
+        self.resampler = StreamingResampler(CHAT_TTS_SAMPLE_RATE, 16000)
+        self.frames = FrameBuilder(self.chunk_size)
         rnd_spk_emb = self.model.sample_random_speaker()
         self.params_infer_code = ChatTTS.Chat.InferCodeParams(
             spk_emb=rnd_spk_emb,
@@ -39,6 +48,11 @@ class ChatTTSHandler(BaseHandler):
         logger.info(f"Warming up {self.__class__.__name__}")
         _ = self.model.infer("text")
 
+    def setup_session(self, should_listen):
+        self.should_listen = should_listen
+        self.resampler = StreamingResampler(CHAT_TTS_SAMPLE_RATE, 16000)
+        self.frames = FrameBuilder(self.chunk_size)
+
     def process(self, llm_sentence):
         console.print(f"[green]ASSISTANT: {llm_sentence}")
         if self.device == "mps":
@@ -57,26 +71,22 @@ class ChatTTSHandler(BaseHandler):
 
         if self.stream:
             wavs = [np.array([])]
+            self.resampler.reset()
+            self.frames.reset()
             for gen in wavs_gen:
                 if gen[0] is None or len(gen[0]) == 0:
-                    self.should_listen.set()
-                    return
-                audio_chunk = librosa.resample(gen[0], orig_sr=24000, target_sr=16000)
-                audio_chunk = (audio_chunk * 32768).astype(np.int16)[0]
-                while len(audio_chunk) > self.chunk_size:
-                    yield audio_chunk[: self.chunk_size]  # Return the first chunk_size samples of the audio data
-                    audio_chunk = audio_chunk[self.chunk_size :]  # Remove the samples that have already been returned
-                yield np.pad(audio_chunk, (0, self.chunk_size - len(audio_chunk)))
+                    break
+                # the chunks of the sentence are resampled and framed as one stream, padded only at its end
+                audio_chunk = float32_to_pcm16(self.resampler.process(np.reshape(gen[0], -1)))
+                yield from self.frames.push(audio_chunk)
+            # the last samples, held back by the filter
+            yield from self.frames.push(float32_to_pcm16(self.resampler.flush()))
+            yield from self.frames.flush()
         else:
             wavs = wavs_gen
             if len(wavs[0]) == 0:
                 self.should_listen.set()
                 return
-            audio_chunk = librosa.resample(wavs[0], orig_sr=24000, target_sr=16000)
-            audio_chunk = (audio_chunk * 32768).astype(np.int16)
-            for i in range(0, len(audio_chunk), self.chunk_size):
-                yield np.pad(
-                    audio_chunk[i : i + self.chunk_size],
-                    (0, self.chunk_size - len(audio_chunk[i : i + self.chunk_size])),
-                )
+            audio_chunk = float32_to_pcm16(self.resampler.process_all(np.reshape(wavs[0], -1)))
+            yield from split_frames(audio_chunk, self.chunk_size)
         self.should_listen.set()
@@ -1,25 +1,62 @@
 # elevenlabs_handler.py
+import asyncio
+import base64
+import json
 import os
 import logging
+import uuid
+from time import perf_counter
 import numpy as np
+import websockets
 from typing import Tuple, Union, Dict, Any
 from rich.console import Console
-from baseHandler import BaseHandler
+from baseHandler import AsyncBaseHandler
+from utils.audio import FrameBuilder, split_frames
+from utils.bounded_queue import async_put
+from utils.phrase_cache import PhraseCache, new_phrase_cache
+from utils.turn_trace import TracedItem
 
-from elevenlabs.client import ElevenLabs  # pip install elevenlabs
+from elevenlabs.client import AsyncElevenLabs  # pip install elevenlabs
 
 logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 console = Console()
 
 
-class ElevenLabsTTSHandler(BaseHandler):
+class SpeechContext:
+    """
+    A context of the multi-context WebSocket, i.e. the speech of one turn: the text of the whole reply is sent to the
+    same context, so that the voice carries on from one sentence to the next. It is closed at the end of the turn.
+    """
+
+    def __init__(self, trace, frame_size):
+        self.context_id = uuid.uuid4().hex
+        self.trace = trace
+        self.sent_time = None
+        self.first_audio = True
+        self.closed = False
+        # carries the samples that do not fill a frame from one audio message to the next
+        self.frames = FrameBuilder(frame_size)
+
+    @property
+    def cancelled(self):
+        return self.trace is not None and self.trace.cancelled
+
+
+class ElevenLabsTTSHandler(AsyncBaseHandler):
     """
     Drop-in replacement for ChatTTSHandler that uses ElevenLabs TTS.
 
     - Streams PCM 16 kHz (S16LE) audio so no resampling needed.
     - Yields fixed-size np.int16 chunks of length `chunk_size`.
     - Supports streaming and non-streaming modes, like your original.
+    - Runs on the shared event loop with the async client, no thread is held while waiting for audio.
+    - With `phrase_cache_dir`, phrases already synthesized with the same voice, model and format are replayed
+      from a PhraseCache instead of calling the API.
+    - With `websocket`, each call keeps one multi-context input-streaming WebSocket open instead of making an HTTP
+      request per sentence: the LLM sends the reply word by word, `(text, lang, end_of_turn)` items (see
+      `LLM.word_chunker`), the words are sent to the context of the turn as they come and it is flushed and closed
+      at the end of the turn. The audio is relayed to the output queue as it arrives, by a reader task of the session.
 
     Config via gen_kwargs:
       - api_key (str, optional)         : falls back to ELEVENLABS_API_KEY env
@@ -30,6 +67,11 @@ class ElevenLabsTTSHandler(BaseHandler):
       - warmup_text (str, optional)     : small text to preflight the API (None to skip)
     """
 
+    trace_event = "first_tts_audio"
+    # characters buffered by the server before it generates the audio of a context, the first chunk is kept short
+    # so that the first words are spoken before the LLM gets much further
+    CHUNK_LENGTH_SCHEDULE = [50, 120, 160, 250]
+
     def setup(
         self,
         should_listen,
@@ -37,6 +79,10 @@ class ElevenLabsTTSHandler(BaseHandler):
         gen_kwargs=None,
         stream=True,
         chunk_size=512,
+        websocket=False,
+        phrase_cache_dir=None,
+        phrase_cache_memory_mb=64,
+        phrase_cache_disk_mb=1024,
     ):
         self.should_listen = should_listen
         self.device = device
@@ -55,11 +101,17 @@ class ElevenLabsTTSHandler(BaseHandler):
         # IMPORTANT: request raw PCM 16k so we can yield int16 frames directly
         self.output_format = gen_kwargs.get("output_format", "pcm_16000")
         self.warmup_text = gen_kwargs.get("warmup_text", None)
+        self.phrase_cache = new_phrase_cache(phrase_cache_dir, phrase_cache_memory_mb, phrase_cache_disk_mb)
+
+        self.websocket = websocket
+        self.api_key = api_key
+        self.base_url = base_url
+        self.reset_connection()
 
-        self.client = ElevenLabs(api_key=api_key, base_url=base_url)
-        self.warmup()
+        self.client = AsyncElevenLabs(api_key=api_key, base_url=base_url)
+        self.run_sync(self.warmup())
 
-    def warmup(self):
+    async def warmup(self):
         """Optional tiny request to ensure credentials/network are good."""
         if not self.warmup_text:
             logger.info(f"Skipping warmup for {self.__class__.__name__}")
@@ -67,27 +119,20 @@ class ElevenLabsTTSHandler(BaseHandler):
         try:
             logger.info(f"Warming up {self.__class__.__name__}")
             # Non-streaming convert avoids keeping a stream open during warmup.
-            _ = self.client.text_to_speech.convert(
+            async for _ in self.client.text_to_speech.convert(
                 text=self.warmup_text,
                 voice_id=self.voice_id,
                 model_id=self.model_id,
                 output_format=self.output_format,  # "pcm_16000"
-            )
+            ):
+                pass
         except Exception as e:
             logger.warning(f"ElevenLabs warmup failed: {e}")
 
-    def _yield_pcm_chunks(self, pcm_bytes: bytes):
-        """Convert raw little-endian PCM bytes to int16 and yield fixed-size frames."""
-        # Ensure even number of bytes (2 bytes per sample)
-        if len(pcm_bytes) % 2:
-            pcm_bytes += b"\x00"
-        samples = np.frombuffer(pcm_bytes, dtype="<i2")  # little-endian int16
-        for i in range(0, len(samples), self.chunk_size):
-            frame = samples[i : i + self.chunk_size]
-            if len(frame) < self.chunk_size:
-                yield np.pad(frame, (0, self.chunk_size - len(frame)))
-            else:
-                yield frame
+    @staticmethod
+    def _is_delta(x: Any) -> bool:
+        """Whether an item is part of a reply sent word by word, a `(text, lang, end_of_turn)` tuple."""
+        return isinstance(x, (tuple, list)) and len(x) > 2
 
     @staticmethod
     def _normalize_text(x: Any) -> Tuple[str, str]:
@@ -197,10 +242,169 @@ class ElevenLabsTTSHandler(BaseHandler):
             console.print(f"[red]Error saving JSON: {e}")
             logger.error(f"Failed to save JSON: {e}")
 
-    def process(self, llm_sentence):
+    def setup_session(self, should_listen):
+        self.should_listen = should_listen
+        self.reset_connection()
+
+    def reset_connection(self):
+        # the WebSocket of the session, its reader task, and the contexts still receiving audio
+        self.connection = None
+        self.reader = None
+        self.contexts = {}
+        self.context = None
+        # the words of the turn held until it ends, see `hold_text`
+        self.held_text = None
+        self.held_trace = None
+
+    @property
+    def websocket_url(self):
+        base_url = self.base_url.replace("https://", "wss://").replace("http://", "ws://")
+        return (
+            f"{base_url}/v1/text-to-speech/{self.voice_id}/multi-stream-input"
+            f"?model_id={self.model_id}&output_format={self.output_format}&inactivity_timeout=180"
+        )
+
+    async def connect(self):
+        if self.connection is not None:
+            return
+        self.connection = await websockets.connect(
+            self.websocket_url, additional_headers={"xi-api-key": self.api_key}
+        )
+        self.reader = asyncio.create_task(self.read_audio(self.connection))
+        logger.debug(f"{self.__class__.__name__}: WebSocket connected")
+
+    async def send(self, message):
+        await self.connection.send(json.dumps(message))
+
+    async def close_context(self, context):
+        if context.closed:
+            return
+        context.closed = True
+        if context.cancelled:
+            # its audio is dropped, whatever is still in flight
+            self.contexts.pop(context.context_id, None)
+        try:
+            await self.send({"context_id": context.context_id, "close_context": True})
+        except websockets.ConnectionClosed:
+            pass
+
+    async def process_websocket(self, text, end_of_turn=True):
+        """
+        Sends the text to the context of the turn, the audio is relayed by `read_audio`. The context is flushed at the
+        end of each sentence, so that it does not wait for more text, and closed at the end of the turn.
+        """
+        if not text.endswith(" "):
+            text += " "
+        for attempt in range(2):
+            await self.connect()
+            context = self.context
+            if (
+                context is None
+                or context.closed
+                or context.trace is None
+                or context.trace is not self.current_trace
+            ):
+                # a new turn, the previous one gets no more text
+                if context is not None:
+                    await self.close_context(context)
+                context = self.context = SpeechContext(self.current_trace, self.chunk_size)
+                self.contexts[context.context_id] = context
+                message = {
+                    "text": text,
+                    "context_id": context.context_id,
+                    "generation_config": {"chunk_length_schedule": self.CHUNK_LENGTH_SCHEDULE},
+                }
+            else:
+                message = {"text": text, "context_id": context.context_id}
+            message["try_trigger_generation"] = True
+            if end_of_turn or text.rstrip().endswith((".", "?", "!")):
+                # a complete sentence is spoken without waiting for the next length of the schedule
+                message["flush"] = True
+            try:
+                await self.send(message)
+                break
+            except websockets.ConnectionClosed:
+                # e.g. closed by the server after inactivity, reconnect once
+                logger.info(f"{self.__class__.__name__}: WebSocket closed, reconnecting")
+                self.reset_connection()
+        if context.sent_time is None:
+            context.sent_time = perf_counter()
+        if end_of_turn:
+            await self.close_context(context)
+
+    def hold_text(self, text, end_of_turn):
+        """
+        Holds the words of a turn from the first one that may start the END CALL trigger or the JSON analysis, which
+        are only recognized whole. Returns the text to speak now, None while it is held.
+        """
+        if self.held_trace is not self.current_trace:
+            self.held_text, self.held_trace = None, self.current_trace
+        if self.held_text is None and "[" not in text and "{" not in text:
+            return text
+        self.held_text = (self.held_text or "") + text
+        if not end_of_turn:
+            return None
+        text, self.held_text = self.held_text, None
+        return text
+
+    async def read_audio(self, connection):
+        """
+        Relays the audio of every context to the output queue, as frames of `chunk_size` samples. The samples that
+        do not fill a frame are carried to the next audio message of the context, they are only padded once it is
+        final, so that no silence is inserted while the server waits for more text.
+        """
+        try:
+            async for message in connection:
+                data = json.loads(message)
+                context = self.contexts.get(data.get("contextId"))
+                if context is None:
+                    continue
+                if context.cancelled:
+                    await self.close_context(context)
+                    continue
+                if data.get("audio"):
+                    for frame in context.frames.push(base64.b64decode(data["audio"])):
+                        await async_put(self.queue_out, self.traced_for(context, frame))
+                if data.get("isFinal"):
+                    # taken at once, the context is dropped right after
+                    for frame in list(context.frames.flush()):
+                        await async_put(self.queue_out, self.traced_for(context, frame))
+                    self.contexts.pop(context.context_id, None)
+        except websockets.ConnectionClosed as e:
+            logger.info(f"{self.__class__.__name__}: WebSocket closed: {e}")
+        finally:
+            if self.connection is connection:
+                self.reset_connection()
+
+    def traced_for(self, context, frame):
+        """Attaches the trace of the turn of a context to one of its frames."""
+        if context.first_audio:
+            context.first_audio = False
+            if context.sent_time is not None:
+                self.latency.record(perf_counter() - context.sent_time)
+        if context.trace is None:
+            return frame
+        context.trace.mark(self.trace_event)
+        return TracedItem(frame, context.trace)
+
+    def cleanup(self):
+        if self.connection is not None:
+            self.reader.cancel()
+            # cleanup runs on the shared loop, at the end of `run_async`
+            asyncio.get_running_loop().create_task(self.connection.close())
+            self.reset_connection()
+
+    async def process(self, llm_sentence):
         # Normalize first so we don't print tuple/list/dict representations
         text, lang = self._normalize_text(llm_sentence)
-        console.print(f"[green]ASSISTANT: {text}")
+        end_of_turn = True
+        if self._is_delta(llm_sentence):
+            end_of_turn = bool(llm_sentence[2])
+            text = self.hold_text(text, end_of_turn)
+            if text is None:
+                return
+        if text.strip():
+            console.print(f"[green]ASSISTANT: {text}")
 
         # Check for END CALL trigger
         if '["END CALL"]' in text or '["END CALL"]' in str(llm_sentence):
@@ -212,7 +416,8 @@ class ElevenLabsTTSHandler(BaseHandler):
                 start_idx = text.find("{")
                 json_part = text[start_idx:]
                 if json_part.strip():
-                    self._save_json_to_file(json_part)
+                    # saving posts the analysis with a blocking request
+                    await asyncio.to_thread(self._save_json_to_file, json_part)
 
             # Trigger call termination by setting stop event
             self.stop_event.set()
@@ -220,13 +425,29 @@ class ElevenLabsTTSHandler(BaseHandler):
 
         # Check if this is JSON output (after END CALL)
         if text.strip().startswith("{") and text.strip().endswith("}"):
-            self._save_json_to_file(text)
+            await asyncio.to_thread(self._save_json_to_file, text)
             # Now terminate the call after JSON is saved
             console.print("[red]JSON saved! Terminating call...")
             self.stop_event.set()
             return
         voice_id = self._voice_for_lang(lang)
 
+        if self.websocket:
+            await self.process_websocket(text, end_of_turn)
+            self.should_listen.set()
+            return
+
+        cache_key = None
+        if self.phrase_cache is not None:
+            cache_key = PhraseCache.key(text, voice_id, self.model_id, self.output_format)
+            audio = self.phrase_cache.get(cache_key)
+            if audio is not None:
+                for frame in split_frames(audio, self.chunk_size):
+                    yield frame
+                self.should_listen.set()
+                return
+        frames = []
+
         if self.stream:
             # Stream raw bytes as they’re generated by ElevenLabs
             # We request output_format="pcm_16000" so chunks are already raw PCM at 16k.
@@ -237,30 +458,44 @@ class ElevenLabsTTSHandler(BaseHandler):
                 output_format=self.output_format,  # "pcm_16000"
             )
 
-            remainder = b""
+            # the network chunks end anywhere, only the end of the phrase is padded
+            frame_builder = FrameBuilder(self.chunk_size)
             try:
-                for chunk in audio_stream:
+                async for chunk in audio_stream:
+                    if self.turn_cancelled:
+                        break
                     # SDK yields bytes (audio) and sometimes other events; keep only bytes.
                     if not isinstance(chunk, (bytes, bytearray)):
                         continue
-                    data = remainder + bytes(chunk)
-                    # keep even number of bytes; convert what we can, stash the rest
-                    usable_len = (len(data) // 2) * 2
-                    if usable_len:
-                        yield from self._yield_pcm_chunks(data[:usable_len])
-                    remainder = data[usable_len:]
+                    for frame in frame_builder.push(chunk):
+                        frames.append(frame)
+                        yield frame
             finally:
-                # Flush any tail bytes
-                if remainder:
-                    yield from self._yield_pcm_chunks(remainder)
+                # also when the generator is closed, nothing may be yielded then
                 self.should_listen.set()
+            # Flush the tail samples, unless the user barged in
+            if not self.turn_cancelled:
+                for frame in frame_builder.flush():
+                    frames.append(frame)
+                    yield frame
         else:
             # One-shot generation; returns the full audio buffer
-            audio_bytes = self.client.text_to_speech.convert(
-                text=text,
-                voice_id=voice_id,
-                model_id=self.model_id,
-                output_format=self.output_format,  # "pcm_16000"
+            audio_bytes = b"".join(
+                [
+                    chunk
+                    async for chunk in self.client.text_to_speech.convert(
+                        text=text,
+                        voice_id=voice_id,
+                        model_id=self.model_id,
+                        output_format=self.output_format,  # "pcm_16000"
+                    )
+                ]
             )
-            yield from self._yield_pcm_chunks(bytes(audio_bytes))
+            for frame in split_frames(audio_bytes, self.chunk_size):
+                frames.append(frame)
+                yield frame
             self.should_listen.set()
+
+        # only whole phrases are cached, not those cut by a barge-in; the file is written off the event loop
+        if cache_key is not None and frames and not self.turn_cancelled:
+            await asyncio.to_thread(self.phrase_cache.put, cache_key, np.concatenate(frames))
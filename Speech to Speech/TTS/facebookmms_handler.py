@@ -1,9 +1,8 @@
 from transformers import VitsModel, AutoTokenizer
 import torch
-import numpy as np
-import librosa
 from rich.console import Console
 from baseHandler import BaseHandler
+from utils.audio import StreamingResampler, float32_to_pcm16, split_frames
 import logging
 
 logging.basicConfig(
@@ -57,6 +56,8 @@ WHISPER_LANGUAGE_TO_FACEBOOK_LANGUAGE = {
 }
 
 class FacebookMMSTTSHandler(BaseHandler):
+    trace_event = "first_tts_audio"
+
     def setup(
         self,
         should_listen,
@@ -73,6 +74,8 @@ class FacebookMMSTTSHandler(BaseHandler):
         self.stream = stream
         self.chunk_size = chunk_size
         self.language = language
+        # built for the sampling rate of the model on first use
+        self.resampler = None
 
         self.load_model(self.language)
         self.warmup()
@@ -123,6 +126,10 @@ class FacebookMMSTTSHandler(BaseHandler):
             logger.exception("Full traceback:")
             return None
 
+    def setup_session(self, should_listen):
+        self.should_listen = should_listen
+        self.resampler = None
+
     def process(self, llm_sentence):
         language_code = None
 
@@ -151,21 +158,18 @@ class FacebookMMSTTSHandler(BaseHandler):
         audio_numpy = audio_output.cpu().numpy().squeeze()
         logger.debug(f"Raw audio shape: {audio_numpy.shape}, dtype: {audio_numpy.dtype}")
         
-        audio_resampled = librosa.resample(audio_numpy, orig_sr=self.model.config.sampling_rate, target_sr=16000)
+        sampling_rate = self.model.config.sampling_rate
+        if sampling_rate == 16000:
+            audio_resampled = audio_numpy
+        else:
+            if self.resampler is None or self.resampler.orig_sr != sampling_rate:
+                self.resampler = StreamingResampler(sampling_rate, 16000)
+            audio_resampled = self.resampler.process_all(audio_numpy)
         logger.debug(f"Resampled audio shape: {audio_resampled.shape}, dtype: {audio_resampled.dtype}")
         
-        audio_int16 = (audio_resampled * 32768).astype(np.int16)
+        audio_int16 = float32_to_pcm16(audio_resampled)
         logger.debug(f"Final audio shape: {audio_int16.shape}, dtype: {audio_int16.dtype}")
 
-        if self.stream:
-            for i in range(0, len(audio_int16), self.chunk_size):
-                chunk = audio_int16[i:i + self.chunk_size]
-                yield np.pad(chunk, (0, self.chunk_size - len(chunk)))
-        else:
-            for i in range(0, len(audio_int16), self.chunk_size):
-                yield np.pad(
-                    audio_int16[i : i + self.chunk_size],
-                    (0, self.chunk_size - len(audio_int16[i : i + self.chunk_size])),
-                )
+        yield from split_frames(audio_int16, self.chunk_size)
 
         self.should_listen.set()
\ No newline at end of file
@@ -1,11 +1,13 @@
 from melo.api import TTS
 import logging
 from baseHandler import BaseHandler
-import librosa
 import numpy as np
 from rich.console import Console
 import torch
 
+from utils.audio import StreamingResampler, float32_to_pcm16, split_frames
+from utils.phrase_cache import PhraseCache, new_phrase_cache
+
 logger = logging.getLogger(__name__)
 
 console = Console()
@@ -30,6 +32,8 @@ WHISPER_LANGUAGE_TO_MELO_SPEAKER = {
 
 
 class MeloTTSHandler(BaseHandler):
+    trace_event = "first_tts_audio"
+
     def setup(
         self,
         should_listen,
@@ -38,6 +42,9 @@ class MeloTTSHandler(BaseHandler):
         speaker_to_id="en",
         gen_kwargs={},  # Unused
         blocksize=512,
+        phrase_cache_dir=None,
+        phrase_cache_memory_mb=64,
+        phrase_cache_disk_mb=1024,
     ):
         self.should_listen = should_listen
         self.device = device
@@ -49,12 +56,18 @@ class MeloTTSHandler(BaseHandler):
             WHISPER_LANGUAGE_TO_MELO_SPEAKER[speaker_to_id]
         ]
         self.blocksize = blocksize
+        self.resampler = StreamingResampler(self.model.hps.data.sampling_rate, 16000)
+        self.phrase_cache = new_phrase_cache(phrase_cache_dir, phrase_cache_memory_mb, phrase_cache_disk_mb)
         self.warmup()
 
     def warmup(self):
         logger.info(f"Warming up {self.__class__.__name__}")
         _ = self.model.tts_to_file("text", self.speaker_id, quiet=True)
 
+    def setup_session(self, should_listen):
+        self.should_listen = should_listen
+        self.resampler = StreamingResampler(self.model.hps.data.sampling_rate, 16000)
+
     def process(self, llm_sentence):
         language_code = None
 
@@ -78,6 +91,15 @@ class MeloTTSHandler(BaseHandler):
                     f"[red]Language {language_code} not supported by Melo. Using {self.language} instead."
                 )
 
+        cache_key = None
+        if self.phrase_cache is not None:
+            cache_key = PhraseCache.key(llm_sentence, self.speaker_id, f"melo-{self.language}", "pcm_16000")
+            audio = self.phrase_cache.get(cache_key)
+            if audio is not None:
+                yield from split_frames(audio, self.blocksize)
+                self.should_listen.set()
+                return
+
         if self.device == "mps":
             import time
 
@@ -98,12 +120,9 @@ class MeloTTSHandler(BaseHandler):
         if len(audio_chunk) == 0:
             self.should_listen.set()
             return
-        audio_chunk = librosa.resample(audio_chunk, orig_sr=44100, target_sr=16000)
-        audio_chunk = (audio_chunk * 32768).astype(np.int16)
-        for i in range(0, len(audio_chunk), self.blocksize):
-            yield np.pad(
-                audio_chunk[i : i + self.blocksize],
-                (0, self.blocksize - len(audio_chunk[i : i + self.blocksize])),
-            )
+        audio_chunk = float32_to_pcm16(self.resampler.process_all(audio_chunk))
+        if cache_key is not None:
+            self.phrase_cache.put(cache_key, audio_chunk)
+        yield from split_frames(audio_chunk, self.blocksize)
 
         self.should_listen.set()
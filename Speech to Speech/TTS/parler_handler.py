@@ -1,5 +1,4 @@
 from threading import Thread
-from time import perf_counter
 from baseHandler import BaseHandler
 import numpy as np
 import torch
@@ -7,9 +6,10 @@ from transformers import (
     AutoTokenizer,
 )
 from parler_tts import ParlerTTSForConditionalGeneration, ParlerTTSStreamer
-import librosa
 import logging
 from rich.console import Console
+from utils.audio import FrameBuilder, StreamingResampler, float32_to_pcm16, split_frames
+from utils.phrase_cache import PhraseCache, new_phrase_cache
 from utils.utils import next_power_of_2
 from transformers.utils.import_utils import (
     is_flash_attn_2_available,
@@ -44,6 +44,8 @@ WHISPER_LANGUAGE_TO_PARLER_SPEAKER = {
 
 
 class ParlerTTSHandler(BaseHandler):
+    trace_event = "first_tts_audio"
+
     def setup(
         self,
         should_listen,
@@ -59,6 +61,9 @@ class ParlerTTSHandler(BaseHandler):
         play_steps_s=1,
         blocksize=512,
         use_default_speakers_list=True,
+        phrase_cache_dir=None,
+        phrase_cache_memory_mb=64,
+        phrase_cache_disk_mb=1024,
     ):
         self.should_listen = should_listen
         self.device = device
@@ -72,6 +77,8 @@ class ParlerTTSHandler(BaseHandler):
 
         self.speaker = "Jason"
         self.description = description
+        self.model_name = model_name
+        self.phrase_cache = new_phrase_cache(phrase_cache_dir, phrase_cache_memory_mb, phrase_cache_disk_mb)
 
         self.model = ParlerTTSForConditionalGeneration.from_pretrained(
             model_name, torch_dtype=self.torch_dtype
@@ -82,8 +89,11 @@ class ParlerTTSHandler(BaseHandler):
 
 
         framerate = self.model.audio_encoder.config.frame_rate
+        self.sampling_rate = self.model.audio_encoder.config.sampling_rate
+        self.resampler = StreamingResampler(self.sampling_rate, 16000)
         self.play_steps = int(framerate * play_steps_s)
         self.blocksize = blocksize
+        self.frames = FrameBuilder(blocksize)
 
         if self.compile_mode not in (None, "default"):
             logger.warning(
@@ -169,12 +179,30 @@ class ParlerTTSHandler(BaseHandler):
                 f"{self.__class__.__name__}:  warmed up! time: {start_event.elapsed_time(end_event) * 1e-3:.3f} s"
             )
 
+    def setup_session(self, should_listen):
+        self.should_listen = should_listen
+        # the resampler and the frame builder carry the state of the stream being synthesized
+        self.resampler = StreamingResampler(self.sampling_rate, 16000)
+        self.frames = FrameBuilder(self.blocksize)
+
     def process(self, llm_sentence):
         if isinstance(llm_sentence, tuple):
             llm_sentence, language_code = llm_sentence
             self.speaker = WHISPER_LANGUAGE_TO_PARLER_SPEAKER.get(language_code, "Jason")
             
         console.print(f"[green]ASSISTANT: {llm_sentence}")
+
+        cache_key = None
+        if self.phrase_cache is not None:
+            cache_key = PhraseCache.key(
+                llm_sentence, f"{self.speaker} {self.description}", self.model_name, "pcm_16000"
+            )
+            audio = self.phrase_cache.get(cache_key)
+            if audio is not None:
+                yield from split_frames(audio, self.blocksize)
+                self.should_listen.set()
+                return
+
         nb_tokens = len(self.prompt_tokenizer(llm_sentence).input_ids)
 
         pad_args = {}
@@ -198,18 +226,19 @@ class ParlerTTSHandler(BaseHandler):
         thread = Thread(target=self.model.generate, kwargs=tts_gen_kwargs)
         thread.start()
 
-        for i, audio_chunk in enumerate(streamer):
-            global pipeline_start
-            if i == 0 and "pipeline_start" in globals():
-                logger.info(
-                    f"Time to first audio: {perf_counter() - pipeline_start:.3f}"
-                )
-            audio_chunk = librosa.resample(audio_chunk, orig_sr=44100, target_sr=16000)
-            audio_chunk = (audio_chunk * 32768).astype(np.int16)
-            for i in range(0, len(audio_chunk), self.blocksize):
-                yield np.pad(
-                    audio_chunk[i : i + self.blocksize],
-                    (0, self.blocksize - len(audio_chunk[i : i + self.blocksize])),
-                )
-
+        frames = []
+        # the chunks are resampled as one stream, without artifacts at their boundaries, and framed as one stream,
+        # without silence between them; the streamer may yield an empty last chunk, which is skipped
+        audio_chunks = (
+            float32_to_pcm16(audio_chunk)
+            for audio_chunk in self.resampler.stream(chunk for chunk in streamer if len(chunk))
+        )
+        for frame in self.frames.stream(audio_chunks):
+            if cache_key is not None:
+                frames.append(frame)
+            yield frame
+
+        # not reached when the turn is cancelled, only whole phrases are cached
+        if cache_key is not None and frames:
+            self.phrase_cache.put(cache_key, np.concatenate(frames))
         self.should_listen.set()
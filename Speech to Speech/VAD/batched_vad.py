@@ -0,0 +1,179 @@
+import logging
+import threading
+from time import perf_counter
+
+import numpy as np
+import torch
+
+from utils.metrics import LatencyHistogram, metrics
+
+logger = logging.getLogger(__name__)
+
+
+class VADRequest:
+    __slots__ = ("session", "x", "done", "prob")
+
+    def __init__(self, session, x):
+        self.session = session
+        self.x = x
+        self.done = threading.Event()
+        self.prob = None
+
+
+class VADSession:
+    """
+    The view of a BatchedVAD given to the VADIterator of a session, in place of its own copy of the model.
+    It holds the recurrent state of the session between two batches.
+    """
+
+    def __init__(self, batcher):
+        self.batcher = batcher
+        self.state = None
+        self.context = None
+
+    def __call__(self, x, sr):
+        return torch.tensor(self.batcher.submit(self, x, sr))
+
+    def reset_states(self):
+        self.state = None
+        self.context = None
+
+    def close(self):
+        self.batcher.close_session(self)
+
+
+class BatchedVAD:
+    """
+    Runs the Silero VAD of every session in batches: the windows submitted by the sessions are gathered, for at most
+    `max_wait_ms` after the first one or until every session has submitted one, their recurrent states are stacked,
+    and a single forward pass computes all the speech probabilities, which are then scattered back.
+    With many concurrent calls this replaces one tiny inference per call every 32 ms by one per batch.
+    """
+
+    def __init__(self, model, sample_rate=16000, max_wait_ms=5):
+        self.model = model
+        self.sample_rate = sample_rate
+        self.max_wait = max_wait_ms / 1000
+        self.condition = threading.Condition()
+        self.pending = []
+        self.sessions = 0
+        self.thread = None
+        self.latency = LatencyHistogram()
+
+    def session(self):
+        with self.condition:
+            self.sessions += 1
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="BatchedVAD", daemon=True)
+                self.thread.start()
+                metrics.register(self.__class__.__name__, None, self.latency)
+        return VADSession(self)
+
+    def close_session(self, session):
+        with self.condition:
+            self.sessions -= 1
+            # the batch being gathered may have been waiting for this session
+            self.condition.notify()
+
+    def submit(self, session, x, sr):
+        if sr != self.sample_rate:
+            raise ValueError(f"BatchedVAD runs at {self.sample_rate} Hz, got a window at {sr} Hz.")
+        request = VADRequest(session, x)
+        with self.condition:
+            self.pending.append(request)
+            self.condition.notify()
+        request.done.wait()
+        return request.prob
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.pending:
+                    self.condition.wait()
+                deadline = perf_counter() + self.max_wait
+                while len(self.pending) < self.sessions:
+                    remaining = deadline - perf_counter()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                batch, self.pending = self.pending, []
+
+            start_time = perf_counter()
+            try:
+                probs = self.forward(batch)
+            except Exception:
+                logger.exception("Batched VAD inference failed")
+                probs = [0.0] * len(batch)
+            self.latency.record(perf_counter() - start_time)
+            for request, prob in zip(batch, probs):
+                request.prob = prob
+                request.done.set()
+
+    def forward(self, batch):
+        """One forward pass for the whole batch."""
+        if hasattr(self.model, "forward_batch"):
+            return self.forward_onnx(batch)
+        return self.forward_torch(batch)
+
+    def forward_onnx(self, batch):
+        """The ONNX model takes the states and contexts of the batch as inputs and returns the new ones."""
+        context_size = self.model.context_size(self.sample_rate)
+        x = np.stack([np.asarray(request.x, dtype=np.float32).reshape(-1) for request in batch])
+        state = np.concatenate(
+            [
+                request.session.state
+                if request.session.state is not None
+                else np.zeros((2, 1, 128), dtype=np.float32)
+                for request in batch
+            ],
+            axis=1,
+        )
+        context = np.concatenate(
+            [
+                request.session.context
+                if request.session.context is not None
+                else np.zeros((1, context_size), dtype=np.float32)
+                for request in batch
+            ]
+        )
+        probs, state, context = self.model.forward_batch(x, state, context, self.sample_rate)
+        for i, request in enumerate(batch):
+            request.session.state = state[:, i : i + 1]
+            request.session.context = context[i : i + 1]
+        return probs.tolist()
+
+    @torch.no_grad()
+    def forward_torch(self, batch):
+        """
+        The TorchScript Silero wrapper keeps the recurrent state and the audio context of
+        its batch in `_state` (2, batch, 128) and `_context` (batch, context): those of each session are stacked
+        before the pass and split again after it.
+        """
+        model = self.model
+        context_size = 64 if self.sample_rate == 16000 else 32
+        x = torch.stack([request.x.reshape(-1) for request in batch])
+        model._state = torch.cat(
+            [
+                request.session.state if request.session.state is not None else torch.zeros(2, 1, 128)
+                for request in batch
+            ],
+            dim=1,
+        )
+        model._context = torch.cat(
+            [
+                request.session.context
+                if request.session.context is not None
+                else torch.zeros(1, context_size)
+                for request in batch
+            ]
+        )
+        # otherwise the wrapper resets the states of a batch whose size changed
+        model._last_sr = self.sample_rate
+        model._last_batch_size = len(batch)
+
+        probs = model(x, self.sample_rate).reshape(-1).tolist()
+
+        for i, request in enumerate(batch):
+            request.session.state = model._state[:, i : i + 1].clone()
+            request.session.context = model._context[i : i + 1].clone()
+        return probs
@@ -0,0 +1,69 @@
+import numpy as np
+
+
+class EnergyGate:
+    """
+    Cheap pre-gate telling whether a window may contain speech, so that the neural VAD can skip obvious silence.
+    The energy of each window is compared to the noise floor of the call, which follows the quietest windows down
+    at once and rises slowly. The gate opens when the energy exceeds the floor by `open_db`, unless the window is
+    marginal and has the zero-crossing rate of broadband noise, and closes `hangover_ms` after it falls below
+    `close_db` above the floor.
+    """
+
+    # floor of digital silence, in dBFS
+    MIN_DB = -90.0
+
+    def __init__(
+        self,
+        sample_rate=16000,
+        open_db=9.0,
+        close_db=6.0,
+        hangover_ms=300,
+        floor_rise_db_per_s=1.0,
+        max_noise_zcr=0.35,
+    ):
+        self.open_db = open_db
+        self.close_db = close_db
+        self.hangover_ms = hangover_ms
+        self.floor_rise_db_per_s = floor_rise_db_per_s
+        self.max_noise_zcr = max_noise_zcr
+        self.sample_rate = sample_rate
+        self.floor_db = None
+        self.is_open = True
+        self.closing_samples = 0
+        self.frames = 0
+        self.skipped = 0
+
+    def __call__(self, audio_float32):
+        """Updates the gate with a window, returns False when it is silence for sure."""
+        n_samples = len(audio_float32)
+        energy = np.dot(audio_float32, audio_float32) / n_samples
+        level_db = max(10 * np.log10(energy) if energy > 0 else self.MIN_DB, self.MIN_DB)
+        signs = np.signbit(audio_float32)
+        zcr = np.count_nonzero(signs[1:] != signs[:-1]) / n_samples
+
+        if self.floor_db is None or level_db < self.floor_db:
+            self.floor_db = level_db
+        else:
+            self.floor_db += self.floor_rise_db_per_s * n_samples / self.sample_rate
+
+        above_db = level_db - self.floor_db
+        noise_like = zcr > self.max_noise_zcr and above_db < self.open_db + 6
+        if above_db >= self.open_db and not noise_like:
+            self.is_open = True
+            self.closing_samples = 0
+        elif self.is_open and above_db < self.close_db:
+            self.closing_samples += n_samples
+            if self.closing_samples >= self.hangover_ms * self.sample_rate / 1000:
+                self.is_open = False
+
+        self.frames += 1
+        return self.is_open
+
+    def skip(self):
+        """Counts a window on which the neural VAD was skipped."""
+        self.skipped += 1
+
+    @property
+    def skipped_fraction(self):
+        return self.skipped / self.frames if self.frames else 0.0
@@ -0,0 +1,53 @@
+import numpy as np
+import onnxruntime
+
+
+class OnnxSileroVAD:
+    """
+    Silero VAD (v5 ONNX export, `silero_vad.onnx`) run with onnxruntime, loaded from a local file.
+    A drop-in replacement for the TorchScript model in VADIterator: calling it on a window returns the speech
+    probability, and the recurrent state and audio context of the stream are kept between calls.
+    The session runs on a single thread, windows of 512 samples are too small to gain from more.
+    """
+
+    def __init__(self, path, session=None):
+        if session is None:
+            options = onnxruntime.SessionOptions()
+            options.intra_op_num_threads = 1
+            options.inter_op_num_threads = 1
+            options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+            options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+            session = onnxruntime.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.path = path
+        self.session = session
+        self.reset_states()
+
+    def __deepcopy__(self, memo):
+        # a new stream on the same session, which onnxruntime allows to run from several threads
+        return OnnxSileroVAD(self.path, self.session)
+
+    @staticmethod
+    def context_size(sr):
+        return 64 if sr == 16000 else 32
+
+    def reset_states(self):
+        self.state = np.zeros((2, 1, 128), dtype=np.float32)
+        self.context = None
+
+    def __call__(self, x, sr):
+        x = np.asarray(x, dtype=np.float32).reshape(1, -1)
+        if self.context is None:
+            self.context = np.zeros((1, self.context_size(sr)), dtype=np.float32)
+        probs, self.state, self.context = self.forward_batch(x, self.state, self.context, sr)
+        return probs[0]
+
+    def forward_batch(self, x, state, context, sr):
+        """
+        Runs windows `x` (batch, samples) of independent streams, given their states (2, batch, 128) and contexts
+        (batch, context). Returns the speech probabilities (batch,) with the new states and contexts.
+        """
+        x = np.concatenate([context, x], axis=1)
+        out, state = self.session.run(
+            None, {"input": x, "state": state, "sr": np.array(sr, dtype=np.int64)}
+        )
+        return out.reshape(-1), state, x[:, -self.context_size(sr) :]
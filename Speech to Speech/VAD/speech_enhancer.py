@@ -0,0 +1,93 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+import torchaudio
+from df.enhance import enhance, init_df
+
+
+class SpeechEnhancer:
+    """
+    DeepFilterNet enhancement of audio at `sample_rate`, run on a worker thread shared by every session: the model
+    and its DF state are loaded once and used by one thread at a time.
+    """
+
+    def __init__(self, sample_rate):
+        self.sample_rate = sample_rate
+        self.model, self.df_state, _ = init_df()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=self.__class__.__name__)
+
+    def enhance(self, array):
+        if self.sample_rate != self.df_state.sr():
+            audio_float32 = torchaudio.functional.resample(
+                torch.from_numpy(array),
+                orig_freq=self.sample_rate,
+                new_freq=self.df_state.sr(),
+            )
+            enhanced = enhance(self.model, self.df_state, audio_float32.unsqueeze(0))
+            enhanced = torchaudio.functional.resample(
+                enhanced,
+                orig_freq=self.df_state.sr(),
+                new_freq=self.sample_rate,
+            )
+        else:
+            enhanced = enhance(self.model, self.df_state, torch.from_numpy(array).unsqueeze(0))
+        return enhanced.numpy().squeeze()
+
+    def submit(self, array):
+        return self.executor.submit(self.enhance, array)
+
+    def stream(self, block_ms=1000, context_ms=500, lookahead_ms=100):
+        return EnhancementStream(self, block_ms, context_ms, lookahead_ms)
+
+
+class EnhancementStream:
+    """
+    Enhancement of an utterance while it is spoken. Each time `block_ms` of new speech, plus `lookahead_ms`, are
+    buffered, the block is enhanced on the worker, preceded by `context_ms` of the audio before it, so the recurrent
+    state of the model and the resampling filters are settled when the block starts; the enhanced context is dropped.
+    At the end of speech only the audio after the last block is left to enhance.
+
+    This stands in for the frame-by-frame streaming state of DeepFilterNet, which `df.enhance` does not expose: each
+    call starts the model from a fresh state. The cost is that every block also enhances its context and lookahead,
+    (block_ms + context_ms + lookahead_ms) / block_ms times the model work of streaming each sample once, 1.6 times
+    with the defaults, plus a resampling and a model call per block. A block also only reaches the worker once
+    block_ms + lookahead_ms of it are spoken, where streaming would lag by one 10 ms hop.
+    """
+
+    def __init__(self, enhancer, block_ms, context_ms, lookahead_ms):
+        self.enhancer = enhancer
+        sample_rate = enhancer.sample_rate
+        self.block_samples = block_ms * sample_rate // 1000
+        self.context_samples = context_ms * sample_rate // 1000
+        self.lookahead_samples = lookahead_ms * sample_rate // 1000
+        self.reset()
+
+    def reset(self):
+        # (future, offset of the block in the enhanced audio, block length) of each block
+        self.blocks = []
+        # the audio of the utterance before this sample has been submitted
+        self.submitted = 0
+
+    def feed(self, buffer, length):
+        """Submits the blocks of `buffer[:length]`, the utterance so far, that are complete."""
+        while length - self.submitted >= self.block_samples + self.lookahead_samples:
+            self.blocks.append(self.submit(buffer, self.submitted, self.submitted + self.block_samples))
+            self.submitted += self.block_samples
+
+    def submit(self, audio, start, end, lookahead=None):
+        context_start = max(0, start - self.context_samples)
+        stop = end + (self.lookahead_samples if lookahead is None else lookahead)
+        # the buffer is overwritten by later speech, the worker gets a copy
+        future = self.enhancer.submit(np.array(audio[context_start:stop], dtype=np.float32))
+        return future, start - context_start, end - start
+
+    def result(self, array):
+        """The enhanced `array`, the whole utterance so far. Waits for the blocks still on the worker."""
+        blocks = list(self.blocks)
+        if len(array) > self.submitted:
+            blocks.append(self.submit(array, self.submitted, len(array), lookahead=0))
+        enhanced = [future.result()[offset : offset + length] for future, offset, length in blocks]
+        if not enhanced:
+            return array
+        return np.concatenate(enhanced)[: len(array)]
@@ -1,23 +1,36 @@
+from copy import deepcopy
+
 import torchaudio
+from VAD.batched_vad import BatchedVAD, VADSession
+from VAD.energy_gate import EnergyGate
+from VAD.speech_enhancer import SpeechEnhancer
 from VAD.vad_iterator import VADIterator
 from baseHandler import BaseHandler
 import numpy as np
 import torch
 from rich.console import Console
 
-from utils.utils import int2float
-from df.enhance import enhance, init_df
+from utils.turn_trace import TurnTrace
+from utils.utterance import Utterance
 import logging
 
 logger = logging.getLogger(__name__)
 
 console = Console()
 
+STT_SAMPLE_RATE = 16000
+
 
 class VADHandler(BaseHandler):
     """
     Handles voice activity detection. When voice activity is detected, audio will be accumulated until the end of speech is detected and then passed
     to the following part.
+    In speculative mode, the audio is passed as soon as silence begins, in a speculative turn that the following parts
+    start working on. The turn is committed once the silence lasts `min_silence_ms`, or cancelled if speech resumes,
+    so the endpointing delay overlaps with transcription and generation.
+    With `partial_interval_ms`, the audio of the utterance so far is also sent every `partial_interval_ms` while the
+    user speaks, as partial `Utterance`s, for the STT to transcribe it incrementally.
+    Speech reaching `max_speech_ms` is sent in segments while the user goes on, the last one completing the turn.
     """
 
     def setup(
@@ -30,62 +43,259 @@ class VADHandler(BaseHandler):
         max_speech_ms=float("inf"),
         speech_pad_ms=30,
         audio_enhancement=False,
+        barge_in=False,
+        barge_in_min_ms=200,
+        speculative=False,
+        partial_interval_ms=0,
+        batch_sessions=False,
+        batch_max_wait_ms=5,
+        onnx_path=None,
+        energy_gate=False,
+        energy_gate_open_db=9.0,
+        energy_gate_close_db=6.0,
+        energy_gate_hangover_ms=300,
     ):
         self.should_listen = should_listen
         self.sample_rate = sample_rate
         self.min_silence_ms = min_silence_ms
         self.min_speech_ms = min_speech_ms
         self.max_speech_ms = max_speech_ms
-        self.model, _ = torch.hub.load("snakers4/silero-vad", "silero_vad")
-        self.iterator = VADIterator(
-            self.model,
-            threshold=thresh,
-            sampling_rate=sample_rate,
-            min_silence_duration_ms=min_silence_ms,
-            speech_pad_ms=speech_pad_ms,
+        self.thresh = thresh
+        self.speech_pad_ms = speech_pad_ms
+        if onnx_path is not None:
+            from VAD.onnx_vad import OnnxSileroVAD
+
+            self.model = OnnxSileroVAD(onnx_path)
+        else:
+            self.model, _ = torch.hub.load("snakers4/silero-vad", "silero_vad")
+        # the sessions forked from this handler share a single model, run in batches
+        self.batcher = BatchedVAD(self.model, sample_rate, batch_max_wait_ms) if batch_sessions else None
+        self.iterator = self.new_iterator()
+        self.energy_gate_kwargs = (
+            {
+                "sample_rate": sample_rate,
+                "open_db": energy_gate_open_db,
+                "close_db": energy_gate_close_db,
+                "hangover_ms": energy_gate_hangover_ms,
+            }
+            if energy_gate
+            else None
         )
+        self.energy_gate = self.new_energy_gate()
+        # float32 copy of the current window, reused across chunks
+        self.scratch = None
+        self.barge_in = barge_in
+        self.barge_in_min_ms = barge_in_min_ms
+        # trace of the last turn handed to the rest of the pipeline, cancelled if the user barges in before its audio
+        # was played
+        self.active_trace = None
+        self.speculative = speculative
+        # speculative turn started at the onset of the current silence, if any
+        self.speculative_trace = None
+        self.partial_interval_samples = partial_interval_ms * sample_rate // 1000
+        self.utterance_id = None
+        # length of the utterance when its last partial was sent
+        self.partial_samples = 0
+        # trace of the turn being spoken, once a first segment of it was sent because it reached `max_speech_ms`
+        self.split_trace = None
         self.audio_enhancement = audio_enhancement
-        if audio_enhancement:
-            self.enhanced_model, self.df_state, _ = init_df()
+        # the speech is enhanced while it is spoken, see EnhancementStream
+        self.enhancer = SpeechEnhancer(sample_rate) if audio_enhancement else None
+        self.enhancement = self.enhancer.stream() if audio_enhancement else None
+
+    def new_iterator(self):
+        return VADIterator(
+            self.model,
+            threshold=self.thresh,
+            sampling_rate=self.sample_rate,
+            min_silence_duration_ms=self.min_silence_ms,
+            speech_pad_ms=self.speech_pad_ms,
+            max_speech_duration_ms=self.max_speech_ms,
+        )
+
+    def new_energy_gate(self):
+        if self.energy_gate_kwargs is None:
+            return None
+        return EnergyGate(**self.energy_gate_kwargs)
+
+    def setup_session(self, should_listen):
+        self.should_listen = should_listen
+        if self.batcher is not None:
+            self.model = self.batcher.session()
+        else:
+            # silero keeps its recurrent state inside the model, so each conversation gets its own copy
+            self.model = deepcopy(self.model)
+        self.iterator = self.new_iterator()
+        self.energy_gate = self.new_energy_gate()
+        self.enhancement = self.enhancer.stream() if self.enhancer is not None else None
+        self.scratch = None
+        self.active_trace = None
+        self.speculative_trace = None
+        self.utterance_id = None
+        self.partial_samples = 0
+        self.split_trace = None
 
     def process(self, audio_chunk):
-        audio_int16 = np.frombuffer(audio_chunk, dtype=np.int16)
-        audio_float32 = int2float(audio_int16)
+        # windows read from an AudioRingBuffer are already int16 arrays
+        if isinstance(audio_chunk, np.ndarray):
+            audio_int16 = audio_chunk.reshape(-1)
+        else:
+            audio_int16 = np.frombuffer(audio_chunk, dtype=np.int16)
+        if self.scratch is None or len(self.scratch) != len(audio_int16):
+            self.scratch = np.empty(len(audio_int16), dtype=np.float32)
+        audio_float32 = np.multiply(audio_int16, 1 / 32768, out=self.scratch, casting="unsafe")
+        if self.energy_gate is not None and not self.energy_gate(audio_float32) and not self.iterator.triggered:
+            # obvious silence, the model only runs again once the gate opens
+            self.energy_gate.skip()
+            self.iterator.skip(audio_float32)
+            return
+        was_pausing = self.iterator.temp_end != 0
+        was_triggered = self.iterator.triggered
         vad_output = self.iterator(torch.from_numpy(audio_float32))
-        if vad_output is not None and len(vad_output) != 0:
+        if self.iterator.triggered and not was_triggered:
+            self.start_utterance()
+        if self.barge_in and self.iterator.triggered:
+            self.check_barge_in()
+        if vad_output is not None and self.iterator.triggered:
+            yield from self.split(vad_output)
+        elif self.partial_interval_samples:
+            yield from self.send_partial()
+        if self.speculative:
+            yield from self.speculate(was_pausing)
+        if vad_output is not None and not self.iterator.triggered:
             logger.debug("VAD: end of speech detected")
-            array = torch.cat(vad_output).cpu().numpy()
-            duration_ms = len(array) / self.sample_rate * 1000
-            if duration_ms < self.min_speech_ms or duration_ms > self.max_speech_ms:
+            array = vad_output
+            if self.split_trace is None and not self.valid_duration(array):
                 logger.debug(
                     f"audio input of duration: {len(array) / self.sample_rate}s, skipping"
                 )
+                self.cancel_speculation()
             else:
                 self.should_listen.clear()
                 logger.debug("Stop listening")
+                if self.speculative_trace is not None:
+                    # the silence held, the speculative turn becomes the turn
+                    logger.debug(f"VAD: committing speculative turn {self.speculative_trace.turn_id}")
+                    self.speculative_trace.commit()
+                    self.active_trace = self.speculative_trace
+                    self.speculative_trace = None
+                    return
                 if self.audio_enhancement:
-                    if self.sample_rate != self.df_state.sr():
-                        audio_float32 = torchaudio.functional.resample(
-                            torch.from_numpy(array),
-                            orig_freq=self.sample_rate,
-                            new_freq=self.df_state.sr(),
-                        )
-                        enhanced = enhance(
-                            self.enhanced_model,
-                            self.df_state,
-                            audio_float32.unsqueeze(0),
-                        )
-                        enhanced = torchaudio.functional.resample(
-                            enhanced,
-                            orig_freq=self.df_state.sr(),
-                            new_freq=self.sample_rate,
-                        )
-                    else:
-                        enhanced = enhance(
-                            self.enhanced_model, self.df_state, audio_float32
-                        )
-                    array = enhanced.numpy().squeeze()
-                yield array
+                    array = self.enhancement.result(array)
+                # the last segment of a split turn is sent whatever its duration, it completes the turn
+                self.current_trace = self.split_trace or TurnTrace(self.session_id)
+                self.split_trace = None
+                self.current_trace.mark("end_of_speech")
+                self.active_trace = self.current_trace
+                yield self.utterance(array)
+        if self.audio_enhancement and self.iterator.triggered:
+            self.enhancement.feed(self.iterator.buffer, self.iterator.speech_samples)
+
+    def start_utterance(self):
+        if self.partial_interval_samples:
+            self.utterance_id = Utterance.new_id()
+            self.partial_samples = 0
+        if self.audio_enhancement:
+            self.enhancement.reset()
+
+    def split(self, array):
+        """
+        Sends a segment of speech that reached `max_speech_ms` while the user goes on. The segments of a turn share
+        its trace and are not final, the following parts of the pipeline join them with the last one.
+        """
+        logger.debug(f"VAD: speech reached {self.max_speech_ms} ms, sending a segment")
+        if self.split_trace is None:
+            self.split_trace = TurnTrace(self.session_id)
+        # a speculation on the speech before the segment would never complete the turn
+        self.cancel_speculation()
+        self.current_trace = self.split_trace
+        self.current_final = False
+        if self.audio_enhancement:
+            array = self.enhancement.result(array)
+        segment = self.utterance(array)
+        # the rest of the speech is a new utterance
+        self.start_utterance()
+        yield segment
+
+    def send_partial(self):
+        if not self.iterator.triggered or self.iterator.temp_end != 0:
+            return
+        samples = self.iterator.speech_samples
+        if samples - self.partial_samples < self.partial_interval_samples:
+            return
+        self.partial_samples = samples
+        yield Utterance(self.to_stt_rate(self.iterator.utterance()), self.utterance_id)
+
+    def utterance(self, array):
+        """Prepares the audio of a complete utterance for the STT, wrapped in partial transcription mode."""
+        array = self.to_stt_rate(array)
+        if not self.partial_interval_samples:
+            return array
+        return Utterance(array, self.utterance_id, final=True)
+
+    def to_stt_rate(self, array):
+        """The STT runs at 16 kHz: in telephony mode, the speech is upsampled once the VAD has cut it out."""
+        if self.sample_rate == STT_SAMPLE_RATE:
+            return array
+        return torchaudio.functional.resample(
+            torch.from_numpy(array), orig_freq=self.sample_rate, new_freq=STT_SAMPLE_RATE
+        ).numpy()
+
+    def speculate(self, was_pausing):
+        """Starts a speculative turn when silence begins, cancels it if speech resumes."""
+        pausing = self.iterator.triggered and self.iterator.temp_end != 0
+        if pausing and not was_pausing and self.split_trace is None:
+            array = self.iterator.utterance()
+            if not self.valid_duration(array):
+                return
+            if self.audio_enhancement:
+                array = self.enhancement.result(array)
+            self.speculative_trace = TurnTrace(self.session_id, speculative=True)
+            self.speculative_trace.mark("end_of_speech")
+            self.current_trace = self.speculative_trace
+            logger.debug(f"VAD: silence onset, starting speculative turn {self.speculative_trace.turn_id}")
+            yield self.utterance(array)
+        elif was_pausing and self.iterator.triggered and not pausing:
+            logger.debug("VAD: speech resumed")
+            self.cancel_speculation()
+
+    def cancel_speculation(self):
+        if self.speculative_trace is not None:
+            self.speculative_trace.cancel()
+            self.speculative_trace = None
+
+    def valid_duration(self, array):
+        duration_ms = len(array) / self.sample_rate * 1000
+        return self.min_speech_ms <= duration_ms <= self.max_speech_ms
+
+    def check_barge_in(self):
+        """
+        Cancels the turn the pipeline is working on once the user has been speaking for `barge_in_min_ms`:
+        the LLM generation and the synthesis stop, and the audio not yet played is dropped by the connection.
+        A turn the connection has finished playing is over, the user is simply taking the next turn.
+        """
+        if self.active_trace is not None and self.active_trace.finished:
+            self.active_trace = None
+        if self.active_trace is None or self.active_trace.cancelled:
+            return
+        speech_ms = self.iterator.speech_samples / self.sample_rate * 1000
+        if speech_ms < self.barge_in_min_ms:
+            return
+        logger.info(f"Barge-in: cancelling turn {self.active_trace.turn_id}")
+        self.active_trace.cancel()
+        self.active_trace = None
+        self.should_listen.set()
+
+    def cleanup(self):
+        # nothing will commit the pending speculation, let the other parts drop it
+        self.cancel_speculation()
+        if isinstance(self.model, VADSession):
+            self.model.close()
+        if self.energy_gate is not None:
+            logger.info(
+                f"Energy gate: the VAD model was skipped on {self.energy_gate.skipped_fraction:.1%} "
+                f"of {self.energy_gate.frames} windows"
+            )
 
     @property
     def min_time_to_debug(self):
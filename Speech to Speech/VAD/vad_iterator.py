@@ -1,5 +1,9 @@
+import numpy as np
 import torch
 
+# capacity of the utterance buffer when the speech length is not capped, doubled when it is full
+INITIAL_CAPACITY_S = 30
+
 
 class VADIterator:
     def __init__(
@@ -9,6 +13,7 @@ class VADIterator:
         sampling_rate: int = 16000,
         min_silence_duration_ms: int = 100,
         speech_pad_ms: int = 30,
+        max_speech_duration_ms: float = float("inf"),
     ):
         """
         Mainly taken from https://github.com/snakers4/silero-vad
@@ -30,13 +35,16 @@ class VADIterator:
 
         speech_pad_ms: int (default - 30 milliseconds)
             Final speech chunks are padded by speech_pad_ms each side
+
+        max_speech_duration_ms: float (default - inf)
+            Speech is split into segments of at most max_speech_duration_ms, emitted while the speaker goes on.
+            The utterance buffer is preallocated to this size, so it also bounds the memory of a speaker who never pauses.
         """
 
         self.model = model
         self.threshold = threshold
         self.sampling_rate = sampling_rate
         self.is_speaking = False
-        self.buffer = []
 
         if sampling_rate not in [8000, 16000]:
             raise ValueError(
@@ -44,7 +52,17 @@ class VADIterator:
             )
 
         self.min_silence_samples = sampling_rate * min_silence_duration_ms / 1000
-        self.speech_pad_samples = sampling_rate * speech_pad_ms / 1000
+        self.speech_pad_samples = int(sampling_rate * speech_pad_ms / 1000)
+        self.max_speech_samples = sampling_rate * max_speech_duration_ms / 1000
+
+        if self.max_speech_samples != float("inf"):
+            # room for the last window, which may cross the cap
+            capacity = int(self.max_speech_samples) + sampling_rate
+        else:
+            capacity = INITIAL_CAPACITY_S * sampling_rate
+        self.buffer = np.empty(capacity, dtype=np.float32)
+        # audio preceding the speech, to pad its start
+        self.pre_roll = np.zeros(self.speech_pad_samples, dtype=np.float32)
         self.reset_states()
 
     def reset_states(self):
@@ -52,6 +70,61 @@ class VADIterator:
         self.triggered = False
         self.temp_end = 0
         self.current_sample = 0
+        self.reset_buffer()
+        self.pre_roll_end = 0
+        self.pre_roll_length = 0
+
+    def reset_buffer(self):
+        self.length = 0
+        # end of the last window that was not silence
+        self.speech_end = 0
+
+    @property
+    def speech_samples(self):
+        """Number of samples of the current segment."""
+        return self.length
+
+    def utterance(self):
+        """Copy of the current segment, its trailing silence cut to `speech_pad_ms`."""
+        return self.buffer[: min(self.length, self.speech_end + self.speech_pad_samples)].copy()
+
+    def append(self, x):
+        if self.length + len(x) > len(self.buffer):
+            buffer = np.empty(2 * len(self.buffer), dtype=np.float32)
+            buffer[: self.length] = self.buffer[: self.length]
+            self.buffer = buffer
+        self.buffer[self.length : self.length + len(x)] = x
+        self.length += len(x)
+
+    def push_pre_roll(self, x):
+        size = len(self.pre_roll)
+        if size == 0:
+            return
+        x = x[-size:]
+        end = self.pre_roll_end + len(x)
+        if end <= size:
+            self.pre_roll[self.pre_roll_end : end] = x
+        else:
+            split = size - self.pre_roll_end
+            self.pre_roll[self.pre_roll_end :] = x[:split]
+            self.pre_roll[: end - size] = x[split:]
+        self.pre_roll_end = end % size
+        self.pre_roll_length = min(size, self.pre_roll_length + len(x))
+
+    def pop_pre_roll(self):
+        """Moves the pre-roll, in chronological order, to the start of the utterance buffer."""
+        start = self.pre_roll_end - self.pre_roll_length
+        if start < 0:
+            self.append(self.pre_roll[start:])
+            self.append(self.pre_roll[: self.pre_roll_end])
+        else:
+            self.append(self.pre_roll[start : self.pre_roll_end])
+        self.pre_roll_length = 0
+
+    def skip(self, x):
+        """Accounts for a window known to be silence, without running the model. Only valid while not triggered."""
+        self.current_sample += len(x)
+        self.push_pre_roll(x)
 
     @torch.no_grad()
     def __call__(self, x):
@@ -59,8 +132,8 @@ class VADIterator:
         x: torch.Tensor
             audio chunk (see examples in repo)
 
-        return_seconds: bool (default - False)
-            whether return timestamps in seconds (default - samples)
+        Returns the audio of the utterance as a float32 array when it ends, None otherwise.
+        When a segment is emitted because the speech reached max_speech_duration_ms, `triggered` stays True.
         """
 
         if not torch.is_tensor(x):
@@ -73,28 +146,40 @@ class VADIterator:
         self.current_sample += window_size_samples
 
         speech_prob = self.model(x, self.sampling_rate).item()
+        # x may be a view of a reused buffer, it is copied by append and push_pre_roll
+        samples = (x[0] if x.dim() == 2 else x).cpu().numpy()
 
         if (speech_prob >= self.threshold) and self.temp_end:
             self.temp_end = 0
 
-        if (speech_prob >= self.threshold) and not self.triggered:
+        if not self.triggered:
+            if speech_prob < self.threshold:
+                self.push_pre_roll(samples)
+                return None
             self.triggered = True
-            return None
+            self.pop_pre_roll()
 
-        if (speech_prob < self.threshold - 0.15) and self.triggered:
+        self.append(samples)
+        if speech_prob >= self.threshold - 0.15:
+            self.speech_end = self.length
+
+        if speech_prob < self.threshold - 0.15:
             if not self.temp_end:
                 self.temp_end = self.current_sample
-            if self.current_sample - self.temp_end < self.min_silence_samples:
-                return None
-            else:
+            if self.current_sample - self.temp_end >= self.min_silence_samples:
                 # end of speak
+                spoken_utterance = self.utterance()
                 self.temp_end = 0
                 self.triggered = False
-                spoken_utterance = self.buffer
-                self.buffer = []
+                self.reset_buffer()
+                # the silence after the speech pads the start of the next one
+                self.push_pre_roll(samples)
                 return spoken_utterance
 
-        if self.triggered:
-            self.buffer.append(x)
+        if self.length >= self.max_speech_samples:
+            # forced split, the speaker goes on in a new segment
+            spoken_utterance = self.buffer[: self.length].copy()
+            self.reset_buffer()
+            return spoken_utterance
 
         return None
@@ -1,4 +1,5 @@
 from dataclasses import dataclass, field
+from typing import Optional
 
 @dataclass
 class ElevenLabsTTSHandlerArguments:
@@ -6,6 +7,10 @@ class ElevenLabsTTSHandlerArguments:
     elevenlabs_tts_device: str = field(default="cpu")  # ignored by remote service
     elevenlabs_tts_stream: bool = field(default=True)
     elevenlabs_tts_chunk_size: int = field(default=1024)
+    elevenlabs_tts_websocket: bool = field(default=False)  # one input-streaming WebSocket per call
+    elevenlabs_tts_phrase_cache_dir: Optional[str] = field(default=None)  # replay already synthesized phrases
+    elevenlabs_tts_phrase_cache_memory_mb: int = field(default=64)
+    elevenlabs_tts_phrase_cache_disk_mb: int = field(default=1024)
 
     # gen_kwargs
     elevenlabs_tts_gen_voice_id: str = field(default="JBFqnCBsd6RMkjVDRZzb")
@@ -1,4 +1,5 @@
 from dataclasses import dataclass, field
+from typing import Optional
 
 
 @dataclass
@@ -21,3 +22,21 @@ class MeloTTSHandlerArguments:
             "help": "Mapping of speaker names to speaker IDs. Default is ['EN-Newest']."
         },
     )
+    melo_phrase_cache_dir: Optional[str] = field(
+        default=None,
+        metadata={
+            "help": "Directory of the cache of synthesized phrases. When set, phrases already synthesized with the same voice and model are replayed from the cache instead of synthesized again. Default is None (no cache)."
+        },
+    )
+    melo_phrase_cache_memory_mb: int = field(
+        default=64,
+        metadata={
+            "help": "Size of the in-memory tier of the phrase cache, in MB. Default is 64."
+        },
+    )
+    melo_phrase_cache_disk_mb: int = field(
+        default=1024,
+        metadata={
+            "help": "Size of the phrase cache directory, in MB, beyond which the least recently used phrases are deleted. Default is 1024."
+        },
+    )
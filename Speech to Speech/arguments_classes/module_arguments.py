@@ -38,6 +38,42 @@ class ModuleArguments:
             "help": "The TTS to use. Either 'parler', 'melo', 'chatTTS' or 'facebookMMS'. Default is 'parler'"
         },
     )
+    max_sessions: int = field(
+        default=1,
+        metadata={
+            "help": "Maximum number of concurrent conversations sharing the loaded models. Only supported in 'twilio' mode, where each media stream opens its own session. Default is 1."
+        },
+    )
+    process_stages: Optional[str] = field(
+        default=None,
+        metadata={
+            "help": "Comma-separated stages to run in their own worker process, among 'vad', 'stt', 'llm' and 'tts', e.g. 'vad,stt,tts'. CPU-heavy stages then no longer contend for the GIL. Not supported with max_sessions > 1. Default is None, every stage runs as a thread."
+        },
+    )
+    metrics_port: Optional[int] = field(
+        default=None,
+        metadata={
+            "help": "If specified, per-stage and per-call latency percentiles and queue stats are served as JSON on http://0.0.0.0:<metrics_port>/metrics. In 'twilio' mode they are also served on the webhook server."
+        },
+    )
+    opener: bool = field(
+        default=False,
+        metadata={
+            "help": "In 'twilio' mode, prepares the first assistant turn at startup: it is generated by the LLM from the initial chat prompt and opener_prompt (or taken from opener_text), synthesized, and played as soon as a media stream starts. Its text opens the chat history of every call. Default is False."
+        },
+    )
+    opener_text: Optional[str] = field(
+        default=None,
+        metadata={
+            "help": "Text of the call opener, instead of generating it with the LLM. Implies opener."
+        },
+    )
+    opener_prompt: str = field(
+        default="The call has just been answered. Say your first line to the person who picked up.",
+        metadata={
+            "help": "Instruction given to the LLM, after the initial chat prompt, to generate the call opener. It is not kept in the chat history."
+        },
+    )
     log_level: str = field(
         default="info",
         metadata={
@@ -0,0 +1,71 @@
+from dataclasses import dataclass, field
+
+
+@dataclass
+class QueueArguments:
+    recv_audio_ring_buffer_ms: int = field(
+        default=6000,
+        metadata={
+            "help": "Capacity of the preallocated ring buffer carrying the incoming audio to the VAD, in milliseconds. The oldest audio is dropped when it is full. 0 to use a queue of audio chunks instead, configured by recv_audio_chunks_queue_maxsize and recv_audio_chunks_queue_policy. Default is 6000 ms."
+        },
+    )
+    recv_audio_chunks_queue_maxsize: int = field(
+        default=200,
+        metadata={
+            "help": "Maximum number of incoming audio chunks waiting for the VAD. 0 for no limit. Default is 200 (about 6 s of audio)."
+        },
+    )
+    recv_audio_chunks_queue_policy: str = field(
+        default="drop_oldest",
+        metadata={
+            "help": "What to do when the incoming audio queue is full. Either 'block', 'drop_oldest' or 'coalesce'. Default is 'drop_oldest'."
+        },
+    )
+    spoken_prompt_queue_maxsize: int = field(
+        default=0,
+        metadata={
+            "help": "Maximum number of utterances waiting for the STT. 0 for no limit. Default is 0."
+        },
+    )
+    spoken_prompt_queue_policy: str = field(
+        default="block",
+        metadata={
+            "help": "What to do when the utterance queue is full. Either 'block', 'drop_oldest' or 'coalesce'. Default is 'block'."
+        },
+    )
+    text_prompt_queue_maxsize: int = field(
+        default=0,
+        metadata={
+            "help": "Maximum number of transcripts waiting for the LLM. 0 for no limit. Default is 0."
+        },
+    )
+    text_prompt_queue_policy: str = field(
+        default="block",
+        metadata={
+            "help": "What to do when the transcript queue is full. Either 'block', 'drop_oldest' or 'coalesce' (merges transcripts into a single prompt). Default is 'block'."
+        },
+    )
+    lm_response_queue_maxsize: int = field(
+        default=0,
+        metadata={
+            "help": "Maximum number of LLM sentences waiting for the TTS. 0 for no limit. Default is 0."
+        },
+    )
+    lm_response_queue_policy: str = field(
+        default="block",
+        metadata={
+            "help": "What to do when the LLM response queue is full. Either 'block', 'drop_oldest' or 'coalesce' (merges sentences). Default is 'block'."
+        },
+    )
+    send_audio_chunks_queue_maxsize: int = field(
+        default=500,
+        metadata={
+            "help": "Maximum number of synthesized audio chunks waiting to be sent. 0 for no limit. Default is 500 (about 16 s of audio in chunks of 512 samples)."
+        },
+    )
+    send_audio_chunks_queue_policy: str = field(
+        default="drop_oldest",
+        metadata={
+            "help": "What to do when the outgoing audio queue is full. Either 'block', 'drop_oldest' or 'coalesce'. Default is 'drop_oldest', audio that late is stale."
+        },
+    )
@@ -1,4 +1,5 @@
 from dataclasses import dataclass, field
+from typing import Optional
 
 
 @dataclass
@@ -12,7 +13,7 @@ class VADHandlerArguments:
     sample_rate: int = field(
         default=16000,
         metadata={
-            "help": "The sample rate of the audio in Hertz. Default is 16000 Hz, which is a common setting for voice audio."
+            "help": "The sample rate of the audio in Hertz. Default is 16000 Hz, which is a common setting for voice audio. In 'twilio' mode, 8000 runs the VAD directly on the 8 kHz telephony audio and only the detected speech is upsampled to 16 kHz for the STT."
         },
     )
     min_silence_ms: int = field(
@@ -30,7 +31,7 @@ class VADHandlerArguments:
     max_speech_ms: float = field(
         default=float("inf"),
         metadata={
-            "help": "Maximum length of continuous speech before forcing a split. Default is infinite, allowing for uninterrupted speech segments."
+            "help": "Maximum length of continuous speech before forcing a split: the speech is sent in segments of at most max_speech_ms while the user goes on, and the following parts join them once the turn ends. It also bounds the memory used per utterance. Default is infinite, allowing for uninterrupted speech segments."
         },
     )
     speech_pad_ms: int = field(
@@ -42,6 +43,72 @@ class VADHandlerArguments:
     audio_enhancement: bool = field(
         default=False,
         metadata={
-            "help": "improves sound quality by applying techniques like noise reduction, equalization, and echo cancellation. Default is False."
+            "help": "improves sound quality by applying techniques like noise reduction, equalization, and echo cancellation. The speech is enhanced by DeepFilterNet in blocks while the user speaks, on a worker thread, so little is left to enhance at the end of speech. Default is False."
+        },
+    )
+    barge_in: bool = field(
+        default=False,
+        metadata={
+            "help": "Full-duplex mode: when the user starts talking while the agent answers, the LLM generation and the synthesis are cancelled and the pending audio is flushed. Needs a connection streaming the user audio during playback, e.g. Twilio. Not supported with --process_stages. Default is False."
+        },
+    )
+    barge_in_min_ms: int = field(
+        default=200,
+        metadata={
+            "help": "Duration of user speech needed to interrupt the agent in barge-in mode. Measured in milliseconds. Default is 200 ms."
+        },
+    )
+    speculative: bool = field(
+        default=False,
+        metadata={
+            "help": "Speculative endpointing: the speech is sent to the STT and the LLM as soon as silence begins, and the turn is only committed, i.e. its answer played, once the silence lasts min_silence_ms. If speech resumes, the speculative turn is discarded. Hides most of the endpointing delay. Not supported with --process_stages. Default is False."
+        },
+    )
+    partial_interval_ms: int = field(
+        default=0,
+        metadata={
+            "help": "Partial transcription: while the user speaks, the utterance so far is sent to the STT every partial_interval_ms, which transcribes it incrementally, so that only its last seconds are left to transcribe at the end of speech. Only supported by the 'whisper' STT. Measured in milliseconds. Default is 0, disabled."
+        },
+    )
+    batch_sessions: bool = field(
+        default=False,
+        metadata={
+            "help": "With max_sessions > 1, runs the VAD of all the sessions on a single model, in batches: one forward pass computes the speech probabilities of every session, instead of one pass per session every 32 ms. Default is False."
+        },
+    )
+    batch_max_wait_ms: float = field(
+        default=5,
+        metadata={
+            "help": "In batched mode, how long the first window of a batch waits for the windows of the other sessions. Measured in milliseconds. Default is 5 ms."
+        },
+    )
+    onnx_path: Optional[str] = field(
+        default=None,
+        metadata={
+            "help": "Path of a local Silero VAD v5 ONNX model (silero_vad.onnx). When set, the VAD runs with onnxruntime on a single thread instead of the TorchScript model fetched from torch.hub at startup. Requires onnxruntime. Default is None."
+        },
+    )
+    energy_gate: bool = field(
+        default=False,
+        metadata={
+            "help": "Skips the neural VAD on windows that are obviously silent: a cheap energy and zero-crossing gate, relative to the noise floor of the call, runs first, and the model only runs once it opens or while speech is detected. The fraction of skipped windows is logged when the session ends. Default is False."
+        },
+    )
+    energy_gate_open_db: float = field(
+        default=9.0,
+        metadata={
+            "help": "Level above the noise floor at which the energy gate opens. Measured in dB. Default is 9 dB."
+        },
+    )
+    energy_gate_close_db: float = field(
+        default=6.0,
+        metadata={
+            "help": "Level above the noise floor under which the energy gate starts closing. Measured in dB. Default is 6 dB."
+        },
+    )
+    energy_gate_hangover_ms: int = field(
+        default=300,
+        metadata={
+            "help": "How long the level has to stay under energy_gate_close_db for the energy gate to close. Measured in milliseconds. Default is 300 ms."
         },
     )
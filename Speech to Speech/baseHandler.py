@@ -1,9 +1,25 @@
+from copy import copy
 from time import perf_counter
+import asyncio
 import logging
 
+from utils.bounded_queue import async_get, async_put
+from utils.event_loop import run_on_shared_loop
+from utils.metrics import LatencyHistogram, metrics
+from utils.turn_trace import TracedItem, unwrap
+
 logger = logging.getLogger(__name__)
 
 
+def join_segments(first, second):
+    """Joins the transcripts of two segments of a turn, plain strings or (text, language_code) tuples."""
+    if isinstance(first, tuple):
+        first = first[0]
+    if isinstance(second, tuple):
+        return (f"{first} {second[0]}", second[1])
+    return f"{first} {second}"
+
+
 class BaseHandler:
     """
     Base class for pipeline parts. Each part of the pipeline has an input and an output queue.
@@ -11,46 +27,198 @@ class BaseHandler:
     To stop a handler properly, set the stop_event and, to avoid queue deadlocks, place b"END" in the input queue.
     Objects placed in the input queue will be processed by the `process` method, and the yielded results will be placed in the output queue.
     The cleanup method handles stopping the handler, and b"END" is placed in the output queue.
+    The time taken to produce each output is recorded in a constant-size latency histogram, registered in `utils.metrics`
+    under the handler class name and its session while the handler runs.
+    Items may carry the TurnTrace of the conversation turn they belong to: `process` receives the bare payload, the trace
+    is available as `current_trace` and is attached again to every output. `trace_event` is marked on the trace when the
+    first output of a turn is produced. Inputs of a cancelled turn are skipped, and processing stops as soon as the turn
+    is cancelled, after which `on_turn_cancelled` is called. Handlers with `waits_for_commit` hold the outputs of a
+    speculative turn until it is committed.
+    The outputs of an input that is not the last segment of its turn are not final either (see `TracedItem`).
+    Handlers with `joins_segments` hold such inputs and process them joined with the last segment of the turn.
     """
 
+    trace_event = None
+    waits_for_commit = False
+    joins_segments = False
+
     def __init__(self, stop_event, queue_in, queue_out, setup_args=(), setup_kwargs={}):
         self.stop_event = stop_event
         self.queue_in = queue_in
         self.queue_out = queue_out
+        self.session_id = None
+        self.current_trace = None
+        self.current_final = True
+        # inputs of the current turn held until its last segment, by handlers with `joins_segments`
+        self.segments = None
         self.setup(*setup_args, **setup_kwargs)
-        self._times = []
+        self.latency = LatencyHistogram()
 
     def setup(self):
         pass
 
+    def fork(self, stop_event, queue_in, queue_out, setup_args=(), setup_kwargs={}, session_id=None):
+        """
+        Returns a shallow copy of the handler bound to new queues and a new stop event.
+        Everything loaded in `setup` (models, processors, API clients) is shared with this handler,
+        `setup_session` is then called on the copy to reset the per-conversation state.
+        """
+        handler = copy(self)
+        handler.stop_event = stop_event
+        handler.queue_in = queue_in
+        handler.queue_out = queue_out
+        handler.session_id = session_id
+        handler.latency = LatencyHistogram()
+        handler.segments = None
+        handler.setup_session(*setup_args, **setup_kwargs)
+        return handler
+
+    def setup_session(self):
+        pass
+
     def process(self):
         raise NotImplementedError
 
     def run(self):
+        metrics.register(self.__class__.__name__, self.session_id, self.latency)
         while not self.stop_event.is_set():
             input = self.queue_in.get()
             if isinstance(input, bytes) and input == b"END":
                 # sentinelle signal to avoid queue deadlock
                 logger.debug("Stopping thread")
                 break
+            input = self.receive(input)
+            if input is None:
+                continue
             start_time = perf_counter()
-            for output in self.process(input):
-                self._times.append(perf_counter() - start_time)
+            outputs = self.process(input)
+            for output in outputs:
+                self.latency.record(perf_counter() - start_time)
                 if self.last_time > self.min_time_to_debug:
                     logger.debug(f"{self.__class__.__name__}: {self.last_time: .3f} s")
-                self.queue_out.put(output)
+                if self.waits_for_commit:
+                    self.wait_for_commit()
+                if self.turn_cancelled:
+                    logger.debug(f"{self.__class__.__name__}: turn cancelled")
+                    outputs.close()
+                    self.on_turn_cancelled()
+                    break
+                self.queue_out.put(self.traced(output))
                 start_time = perf_counter()
 
         self.cleanup()
+        metrics.unregister(self.__class__.__name__, self.session_id)
         self.queue_out.put(b"END")
 
+    def receive(self, input):
+        """Unwraps an input. Returns None when there is nothing to process: its turn is cancelled or not complete."""
+        self.current_final = not isinstance(input, TracedItem) or input.final
+        input, self.current_trace = unwrap(input)
+        if self.turn_cancelled:
+            self.segments = None
+            return None
+        if self.joins_segments:
+            if self.segments is not None:
+                input = join_segments(self.segments, input)
+                self.segments = None
+            if not self.current_final:
+                self.segments = input
+                return None
+        return input
+
+    def traced(self, output):
+        """Marks `trace_event` and attaches the trace of the current turn to an output."""
+        if self.current_trace is None:
+            return output
+        if self.trace_event is not None and self.current_final:
+            self.current_trace.mark(self.trace_event)
+        return TracedItem(output, self.current_trace, self.current_final)
+
     @property
     def last_time(self):
-        return self._times[-1]
-    
+        return self.latency.last
+
+    def mark(self, event):
+        """Marks `event` on the trace of the turn being processed, if any."""
+        if self.current_trace is not None:
+            self.current_trace.mark(event)
+
+    @property
+    def turn_cancelled(self):
+        return self.current_trace is not None and self.current_trace.cancelled
+
+    def wait_for_commit(self):
+        """Blocks while the current turn is speculative, until it is committed or cancelled."""
+        if self.current_trace is None:
+            return
+        while not self.current_trace.wait_settled(0.1):
+            if self.stop_event.is_set():
+                self.current_trace.cancel()
+
+    def on_turn_cancelled(self):
+        """Called when the processing of an input stops because its turn was cancelled."""
+        pass
+
     @property
     def min_time_to_debug(self):
         return 0.001
 
     def cleanup(self):
         pass
+
+
+class AsyncBaseHandler(BaseHandler):
+    """
+    Base class for pipeline parts that mostly wait on the network, like remote LLM, STT and TTS APIs.
+    `process` is an async generator and the handler runs as a task of the event loop shared by every async handler of
+    the process (see `utils.event_loop`), so concurrent sessions do not need a thread per stage while their requests
+    are in flight. Queues are the same as for threaded handlers, they are awaited through `async_get` and `async_put`.
+    `setup` still runs synchronously; `run_sync` runs a coroutine on the shared loop from it, e.g. to warm up a client
+    that must then be used on that loop.
+    """
+
+    async def process(self):
+        raise NotImplementedError
+        yield
+
+    def run(self):
+        """Blocking entry point, when the handler is run by a thread or a process rather than scheduled on the loop."""
+        self.run_sync(self.run_async())
+
+    @staticmethod
+    def run_sync(coroutine):
+        return run_on_shared_loop(coroutine)
+
+    async def run_async(self):
+        metrics.register(self.__class__.__name__, self.session_id, self.latency)
+        while not self.stop_event.is_set():
+            input = await async_get(self.queue_in)
+            if isinstance(input, bytes) and input == b"END":
+                logger.debug("Stopping task")
+                break
+            input = self.receive(input)
+            if input is None:
+                continue
+            start_time = perf_counter()
+            outputs = self.process(input)
+            async for output in outputs:
+                self.latency.record(perf_counter() - start_time)
+                if self.last_time > self.min_time_to_debug:
+                    logger.debug(f"{self.__class__.__name__}: {self.last_time: .3f} s")
+                if self.waits_for_commit and self.current_trace is not None:
+                    # polled, not to block the loop shared with the other sessions
+                    while not self.current_trace.settled:
+                        if self.stop_event.is_set():
+                            self.current_trace.cancel()
+                        await asyncio.sleep(0.005)
+                if self.turn_cancelled:
+                    logger.debug(f"{self.__class__.__name__}: turn cancelled")
+                    await outputs.aclose()
+                    self.on_turn_cancelled()
+                    break
+                await async_put(self.queue_out, self.traced(output))
+                start_time = perf_counter()
+
+        self.cleanup()
+        metrics.unregister(self.__class__.__name__, self.session_id)
+        await async_put(self.queue_out, b"END")
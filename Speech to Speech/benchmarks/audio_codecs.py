@@ -0,0 +1,203 @@
+"""
+Micro-benchmark of the audio conversions of the Twilio path: `utils.audio` against the `audioop` code paths it
+replaces, on 20 ms packets like those of Twilio Media Streams (160 mu-law bytes at 8 kHz in, 640 PCM bytes at
+16 kHz out). Reports the time per packet of each conversion. The last one feeds the 44.1 kHz -> 16 kHz resampler of
+the TTS with an empty and a short chunk per packet, as streamers may yield at the end of a reply.
+
+    python -m benchmarks.audio_codecs --codecs_packets 5000
+"""
+
+import json
+import logging
+import timeit
+from dataclasses import dataclass, field
+from typing import Optional
+
+import numpy as np
+from transformers import HfArgumentParser
+
+from utils.audio import (
+    StreamingResampler,
+    float32_to_pcm16,
+    pcm16_to_float32,
+    pcm16_to_ulaw,
+    ulaw_to_float32,
+    ulaw_to_pcm16,
+)
+
+try:
+    import audioop
+except ImportError:  # removed in Python 3.13
+    audioop = None
+
+logger = logging.getLogger(__name__)
+
+TWILIO_SAMPLE_RATE = 8000
+PIPELINE_SAMPLE_RATE = 16000
+# 20 ms
+PACKET_SAMPLES = TWILIO_SAMPLE_RATE // 50
+TTS_SAMPLE_RATE = 44100
+# shorter than the filter of the 44.1 kHz -> 16 kHz resampler, most of these chunks complete no output
+SHORT_CHUNK_SAMPLES = 3
+
+
+@dataclass
+class AudioCodecsArguments:
+    codecs_packets: int = field(
+        default=5000,
+        metadata={"help": "Number of packets converted per measure. Default is 5000, 100 s of audio."},
+    )
+    codecs_repeat: int = field(
+        default=5,
+        metadata={"help": "Number of measures per conversion, the best one is reported. Default is 5."},
+    )
+    codecs_output: Optional[str] = field(
+        default=None,
+        metadata={"help": "If specified, the report is also written to this JSON file."},
+    )
+
+
+def make_packets(n_packets):
+    """Speech-like test signal, as the mu-law packets Twilio sends and the PCM packets the TTS produces."""
+    rng = np.random.default_rng(0)
+    t = np.arange(n_packets * PACKET_SAMPLES) / TWILIO_SAMPLE_RATE
+    signal = 0.3 * np.sin(2 * np.pi * 220 * t) * (1 + np.sin(2 * np.pi * 3 * t)) / 2
+    signal += 0.01 * rng.standard_normal(len(t))
+    ulaw = pcm16_to_ulaw(float32_to_pcm16(signal.astype(np.float32)))
+    ulaw_packets = [ulaw[i * PACKET_SAMPLES : (i + 1) * PACKET_SAMPLES] for i in range(n_packets)]
+    upsampler = StreamingResampler(TWILIO_SAMPLE_RATE, PIPELINE_SAMPLE_RATE)
+    pcm_packets = [float32_to_pcm16(upsampler.process(ulaw_to_float32(packet))).tobytes() for packet in ulaw_packets]
+    return ulaw_packets, pcm_packets
+
+
+def conversions(ulaw_packets, pcm_packets):
+    """(name, audioop implementation or None, utils.audio implementation) of each conversion."""
+    upsampler = StreamingResampler(TWILIO_SAMPLE_RATE, PIPELINE_SAMPLE_RATE)
+    downsampler = StreamingResampler(PIPELINE_SAMPLE_RATE, TWILIO_SAMPLE_RATE)
+    inbound_resampler = StreamingResampler(TWILIO_SAMPLE_RATE, PIPELINE_SAMPLE_RATE)
+    outbound_resampler = StreamingResampler(PIPELINE_SAMPLE_RATE, TWILIO_SAMPLE_RATE)
+    tts_resampler = StreamingResampler(TTS_SAMPLE_RATE, PIPELINE_SAMPLE_RATE)
+    linear_packets = [ulaw_to_pcm16(packet).tobytes() for packet in ulaw_packets]
+    short_packets = [packet[: 2 * SHORT_CHUNK_SAMPLES] for packet in linear_packets]
+
+    def audioop_decode():
+        for packet in ulaw_packets:
+            audioop.ulaw2lin(packet, 2)
+
+    def numpy_decode():
+        for packet in ulaw_packets:
+            ulaw_to_pcm16(packet)
+
+    def audioop_encode():
+        for packet in linear_packets:
+            audioop.lin2ulaw(packet, 2)
+
+    def numpy_encode():
+        for packet in linear_packets:
+            pcm16_to_ulaw(packet)
+
+    def audioop_upsample():
+        state = None
+        for packet in linear_packets:
+            _, state = audioop.ratecv(packet, 2, 1, TWILIO_SAMPLE_RATE, PIPELINE_SAMPLE_RATE, state)
+
+    def numpy_upsample():
+        for packet in linear_packets:
+            upsampler.process(pcm16_to_float32(packet))
+
+    def audioop_downsample():
+        state = None
+        for packet in pcm_packets:
+            _, state = audioop.ratecv(packet, 2, 1, PIPELINE_SAMPLE_RATE, TWILIO_SAMPLE_RATE, state)
+
+    def numpy_downsample():
+        for packet in pcm_packets:
+            downsampler.process(pcm16_to_float32(packet))
+
+    # the inbound path of TwilioHandler before utils.audio: decode, resample with fresh state, then float32 for the VAD
+    def audioop_inbound():
+        for packet in ulaw_packets:
+            pcm, _ = audioop.ratecv(audioop.ulaw2lin(packet, 2), 2, 1, TWILIO_SAMPLE_RATE, PIPELINE_SAMPLE_RATE, None)
+            pcm16_to_float32(pcm)
+
+    def numpy_inbound():
+        for packet in ulaw_packets:
+            inbound_resampler.process_ulaw(packet)
+
+    def audioop_outbound():
+        for packet in pcm_packets:
+            pcm, _ = audioop.ratecv(packet, 2, 1, PIPELINE_SAMPLE_RATE, TWILIO_SAMPLE_RATE, None)
+            audioop.lin2ulaw(pcm, 2)
+
+    def numpy_outbound():
+        for packet in pcm_packets:
+            pcm16_to_ulaw(float32_to_pcm16(outbound_resampler.process(pcm16_to_float32(packet))))
+
+    def audioop_edge_chunks():
+        state = None
+        for packet in short_packets:
+            _, state = audioop.ratecv(b"", 2, 1, TTS_SAMPLE_RATE, PIPELINE_SAMPLE_RATE, state)
+            _, state = audioop.ratecv(packet, 2, 1, TTS_SAMPLE_RATE, PIPELINE_SAMPLE_RATE, state)
+
+    def numpy_edge_chunks():
+        empty = np.zeros(0, dtype=np.float32)
+        for packet in short_packets:
+            tts_resampler.process(empty)
+            tts_resampler.process(pcm16_to_float32(packet))
+
+    return [
+        ("mu-law decode", audioop_decode, numpy_decode),
+        ("mu-law encode", audioop_encode, numpy_encode),
+        ("resample 8k -> 16k", audioop_upsample, numpy_upsample),
+        ("resample 16k -> 8k", audioop_downsample, numpy_downsample),
+        ("inbound: decode + 16k + float32", audioop_inbound, numpy_inbound),
+        ("outbound: 8k + encode", audioop_outbound, numpy_outbound),
+        ("44.1k -> 16k: empty + short chunk", audioop_edge_chunks, numpy_edge_chunks),
+    ]
+
+
+def measure(function, n_packets, repeat):
+    """Best time per packet over `repeat` runs, in microseconds."""
+    return min(timeit.repeat(function, number=1, repeat=repeat)) / n_packets * 1e6
+
+
+def print_report(results):
+    print(f"\n{'conversion':<34}{'audioop us':>12}{'numpy us':>12}{'speedup':>10}")
+    for result in results:
+        reference, numpy_time = result["audioop_us"], result["numpy_us"]
+        print(
+            f"{result['conversion']:<34}"
+            f"{'-' if reference is None else f'{reference:.2f}':>12}"
+            f"{numpy_time:>12.2f}"
+            f"{'-' if reference is None else f'{reference / numpy_time:.1f}x':>10}"
+        )
+
+
+def main():
+    parser = HfArgumentParser(AudioCodecsArguments)
+    (args,) = parser.parse_args_into_dataclasses()
+    logging.basicConfig(level="INFO", format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    if audioop is None:
+        logger.warning("audioop is not available, only utils.audio is measured")
+
+    ulaw_packets, pcm_packets = make_packets(args.codecs_packets)
+    results = []
+    for name, audioop_function, numpy_function in conversions(ulaw_packets, pcm_packets):
+        results.append(
+            {
+                "conversion": name,
+                "audioop_us": None
+                if audioop is None
+                else measure(audioop_function, args.codecs_packets, args.codecs_repeat),
+                "numpy_us": measure(numpy_function, args.codecs_packets, args.codecs_repeat),
+            }
+        )
+    print_report(results)
+    if args.codecs_output:
+        with open(args.codecs_output, "w") as f:
+            json.dump(results, f, indent=2)
+        logger.info(f"Report written to {args.codecs_output}")
+
+
+if __name__ == "__main__":
+    main()
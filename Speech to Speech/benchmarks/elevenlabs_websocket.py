@@ -0,0 +1,236 @@
+"""
+Check and benchmark of the multi-context WebSocket mode of the ElevenLabs TTS (`--elevenlabs_tts_websocket`) against
+the local stand-in (see `benchmarks.stand_ins`), which speaks the same protocol.
+
+The same replies are fed to `ElevenLabsTTSHandler` as the LLM would emit them, at the pace of its tokens: sentence by
+sentence to an HTTP request each, the default, and word by word, `(text, lang, end_of_turn)` items, to the WebSocket.
+For each mode the report gives the delay from the first token of a turn to its first audio frame, and the audio
+received. The run fails if a turn gets no audio, if a frame is not `chunk_size` samples long, or, over the WebSocket,
+if silence padding was inserted anywhere but in the last frame of a turn (each HTTP request pads its own sentence).
+
+    python -m benchmarks.elevenlabs_websocket --websocket_turns 5 --stand_in_llm_token_ms 30
+"""
+
+import json
+import logging
+import re
+import sys
+import time
+from dataclasses import dataclass, field
+from threading import Event, Thread
+from typing import Optional
+
+import numpy as np
+from transformers import HfArgumentParser
+
+from benchmarks.stand_ins import StandInArguments, serve_stand_ins
+from LLM.word_chunker import WordChunker
+from TTS.elevenlabs_handler import ElevenLabsTTSHandler
+from utils.bounded_queue import BoundedQueue, is_end
+from utils.thread_manager import ThreadManager
+from utils.turn_trace import TracedItem, TurnTrace, unwrap
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+
+
+@dataclass
+class WebSocketBenchmarkArguments:
+    websocket_turns: int = field(
+        default=5,
+        metadata={"help": "Number of turns spoken in each mode. Default is 5."},
+    )
+    websocket_chunk_size: int = field(
+        default=1024,
+        metadata={"help": "Size of the audio frames of the TTS handler, in samples. Default is 1024."},
+    )
+    websocket_idle_s: float = field(
+        default=1.0,
+        metadata={"help": "A turn is over when no audio came out for this long. Default is 1 s."},
+    )
+    websocket_timeout_s: float = field(
+        default=30.0,
+        metadata={"help": "Maximum time to wait for the audio of a turn. Default is 30 s."},
+    )
+    websocket_stand_ins_port: int = field(
+        default=8766,
+        metadata={"help": "Port of the local API stand-ins. Default is 8766."},
+    )
+    websocket_output: Optional[str] = field(
+        default=None,
+        metadata={"help": "If specified, the report is also written to this JSON file."},
+    )
+
+
+class FrameSink:
+    """Collects the frames of each turn along with the time the first one arrived."""
+
+    def __init__(self, queue_in):
+        self.queue_in = queue_in
+        self.frames = {}
+        self.first_frame = {}
+        self.last_output = time.perf_counter()
+
+    def run(self):
+        while True:
+            frame, trace = unwrap(self.queue_in.get())
+            if is_end(frame):
+                break
+            self.last_output = time.perf_counter()
+            self.first_frame.setdefault(trace.turn_id, self.last_output)
+            self.frames.setdefault(trace.turn_id, []).append(frame)
+
+
+def tokens_of(reply):
+    """The reply cut like the tokens of the LLM stand-in, words keeping their leading space."""
+    return [word if i == 0 else f" {word}" for i, word in enumerate(reply.split())]
+
+
+def sentences_of(tokens):
+    """Yields the sentences of the reply as they are completed by the tokens, like the LLM handlers do."""
+    sentence = ""
+    for token in tokens:
+        sentence += token
+        if re.search(r"[.?!]$", token):
+            yield sentence.strip(), True
+            sentence = ""
+        else:
+            yield None, False
+    if sentence.strip():
+        yield sentence.strip(), True
+
+
+def feed_turn(queue_out, trace, tokens, token_s, websocket):
+    """Puts the items of a turn in the input queue of the TTS at the pace of the tokens. Returns the first token time."""
+    first_token = time.perf_counter()
+    if websocket:
+        words = WordChunker()
+        for token in tokens:
+            completed = words.push(token)
+            if completed:
+                queue_out.put(TracedItem((completed, "en", False), trace))
+            time.sleep(token_s)
+        queue_out.put(TracedItem((words.flush(), "en", True), trace))
+    else:
+        for sentence, complete in sentences_of(tokens):
+            if complete:
+                queue_out.put(TracedItem((sentence, "en"), trace))
+            time.sleep(token_s)
+    return first_token
+
+
+def frame_errors(frames, chunk_size, padded_once):
+    """Describes the frames of a turn of the wrong size and, if `padded_once`, silence padding before its last frame."""
+    errors = [f"frame of {len(frame)} samples" for frame in frames if len(frame) != chunk_size]
+    if padded_once and len(frames) > 1:
+        audio = np.concatenate(frames[:-1])
+        # the tone of the stand-in has no zero sample, padding does
+        zeros = np.flatnonzero(audio == 0)
+        if len(zeros):
+            errors.append(f"silence padding at sample {zeros[0]} of {len(audio) + len(frames[-1])}")
+    return errors
+
+
+def run_mode(args, stand_in_kwargs, websocket):
+    stop_event = Event()
+    text_queue = BoundedQueue(name="lm_response_queue")
+    audio_queue = BoundedQueue(name="send_audio_chunks_queue")
+    tts = ElevenLabsTTSHandler(
+        stop_event,
+        queue_in=text_queue,
+        queue_out=audio_queue,
+        setup_args=(Event(),),
+        setup_kwargs={
+            "chunk_size": args.websocket_chunk_size,
+            "websocket": websocket,
+            "gen_kwargs": {
+                "base_url": f"http://127.0.0.1:{args.websocket_stand_ins_port}",
+                "api_key": "stand-in",
+            },
+        },
+    )
+    sink = FrameSink(audio_queue)
+    sink_thread = Thread(target=sink.run)
+    sink_thread.start()
+    manager = ThreadManager([tts])
+    manager.start()
+
+    tokens = tokens_of(stand_in_kwargs.stand_in_reply)
+    token_s = stand_in_kwargs.stand_in_llm_token_ms / 1000
+    first_tokens = {}
+    for _ in range(args.websocket_turns):
+        trace = TurnTrace()
+        first_tokens[trace.turn_id] = feed_turn(text_queue, trace, tokens, token_s, websocket)
+        # let the audio of the turn come out before the next one, like a caller listening
+        deadline = time.perf_counter() + args.websocket_timeout_s
+        while time.perf_counter() < deadline and (
+            trace.turn_id not in sink.first_frame or time.perf_counter() - sink.last_output < args.websocket_idle_s
+        ):
+            time.sleep(0.05)
+
+    text_queue.put(b"END")
+    manager.stop()
+    sink_thread.join()
+
+    errors = []
+    first_audio_ms = []
+    audio_s = []
+    for turn_id, first_token in first_tokens.items():
+        frames = sink.frames.get(turn_id)
+        if not frames:
+            errors.append(f"turn {turn_id}: no audio")
+            continue
+        first_audio_ms.append((sink.first_frame[turn_id] - first_token) * 1000)
+        audio_s.append(sum(len(frame) for frame in frames) / SAMPLE_RATE)
+        errors.extend(
+            f"turn {turn_id}: {error}" for error in frame_errors(frames, args.websocket_chunk_size, websocket)
+        )
+    return {
+        "mode": "websocket" if websocket else "http",
+        "turns": len(first_tokens),
+        "first_audio_ms_p50": float(np.percentile(first_audio_ms, 50)) if first_audio_ms else None,
+        "first_audio_ms_max": max(first_audio_ms, default=None),
+        "audio_s_per_turn": float(np.mean(audio_s)) if audio_s else None,
+        "errors": errors,
+    }
+
+
+def format_value(value, spec):
+    return "-" if value is None else format(value, spec)
+
+
+def print_report(results):
+    print(f"\n{'mode':<12}{'turns':>7}{'first audio p50 ms':>20}{'max ms':>10}{'audio s/turn':>14}{'errors':>8}")
+    for result in results:
+        values = [
+            format_value(result["first_audio_ms_p50"], ".1f"),
+            format_value(result["first_audio_ms_max"], ".1f"),
+            format_value(result["audio_s_per_turn"], ".2f"),
+        ]
+        print(
+            f"{result['mode']:<12}{result['turns']:>7}{values[0]:>20}{values[1]:>10}{values[2]:>14}"
+            f"{len(result['errors']):>8}"
+        )
+        for error in result["errors"]:
+            print(f"  {result['mode']}: {error}")
+
+
+def main():
+    parser = HfArgumentParser((WebSocketBenchmarkArguments, StandInArguments))
+    args, stand_in_kwargs = parser.parse_args_into_dataclasses()
+    logging.basicConfig(level="INFO", format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    serve_stand_ins(stand_in_kwargs, port=args.websocket_stand_ins_port)
+    results = [run_mode(args, stand_in_kwargs, websocket) for websocket in (False, True)]
+    print_report(results)
+    if args.websocket_output:
+        with open(args.websocket_output, "w") as f:
+            json.dump(results, f, indent=2)
+        logger.info(f"Report written to {args.websocket_output}")
+    if any(result["errors"] for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
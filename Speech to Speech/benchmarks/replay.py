@@ -0,0 +1,292 @@
+"""
+Offline replay benchmark of the pipeline.
+
+Recorded conversations (WAV files of the caller side) are fed to the real VAD and the chosen STT handler, in real time
+or faster, while the OpenAI LLM and the ElevenLabs TTS handlers talk to local stand-ins (see `benchmarks.stand_ins`).
+Per-stage and end-to-end latency percentiles are read from the metrics registry, along with the throughput.
+
+    python -m benchmarks.replay --replay_wav_files call1.wav call2.wav --replay_speed 1 --stt faster-whisper
+"""
+
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import librosa
+import numpy as np
+from transformers import HfArgumentParser
+
+from arguments_classes.elevenlabs_stt_arguments import ElevenLabsSTTHandlerArguments
+from arguments_classes.elevenlabs_tts_arguments import ElevenLabsTTSHandlerArguments
+from arguments_classes.faster_whisper_stt_arguments import FasterWhisperSTTHandlerArguments
+from arguments_classes.module_arguments import ModuleArguments
+from arguments_classes.open_api_language_model_arguments import OpenApiLanguageModelHandlerArguments
+from arguments_classes.paraformer_stt_arguments import ParaformerSTTHandlerArguments
+from arguments_classes.queue_arguments import QueueArguments
+from arguments_classes.vad_arguments import VADHandlerArguments
+from arguments_classes.whisper_stt_arguments import WhisperSTTHandlerArguments
+from benchmarks.stand_ins import StandInArguments, serve_stand_ins
+from LLM.openai_api_language_model import OpenApiModelHandler
+from s2s_pipeline import (
+    get_stt_handler,
+    initialize_queues_and_events,
+    prepare_module_args,
+    rename_args,
+    setup_logger,
+)
+from TTS.elevenlabs_handler import ElevenLabsTTSHandler
+from utils.bounded_queue import is_end
+from utils.metrics import metrics
+from utils.thread_manager import ThreadManager
+from utils.turn_trace import unwrap
+from VAD.vad_handler import VADHandler
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+CHUNK_SAMPLES = 512
+
+
+@dataclass
+class ReplayArguments:
+    replay_wav_files: List[str] = field(
+        default_factory=list,
+        metadata={"help": "Recorded conversations to replay, one after the other. Resampled to 16 kHz mono."},
+    )
+    replay_speed: float = field(
+        default=1.0,
+        metadata={"help": "Feeding speed relative to real time, e.g. 1 for real time, 4 for 4x. 0 feeds as fast as possible."},
+    )
+    replay_trailing_silence_ms: int = field(
+        default=1500,
+        metadata={"help": "Silence fed after each file, so that the VAD closes the last utterance. Default is 1500 ms."},
+    )
+    replay_idle_s: float = field(
+        default=3.0,
+        metadata={"help": "Once everything is fed, the replay ends when no audio came out for this long. Default is 3 s."},
+    )
+    replay_timeout_s: float = field(
+        default=60.0,
+        metadata={"help": "Maximum time to wait for the pending turns once everything is fed. Default is 60 s."},
+    )
+    replay_stand_ins_port: int = field(
+        default=8765,
+        metadata={"help": "Port of the local API stand-ins. Default is 8765."},
+    )
+    replay_output: Optional[str] = field(
+        default=None,
+        metadata={"help": "If specified, the report is also written to this JSON file."},
+    )
+
+
+class ReplaySink:
+    """
+    Consumes the synthesized audio like a connection would, marking the first byte of each turn as sent.
+    """
+
+    def __init__(self, stop_event, queue_in):
+        self.stop_event = stop_event
+        self.queue_in = queue_in
+        self.turns = 0
+        self.samples = 0
+        self.last_output = time.perf_counter()
+
+    def run(self):
+        while True:
+            audio_chunk, trace = unwrap(self.queue_in.get())
+            if is_end(audio_chunk):
+                break
+            if trace is not None and trace.cancelled:
+                continue
+            self.samples += len(audio_chunk) // 2 if isinstance(audio_chunk, bytes) else len(audio_chunk)
+            self.last_output = time.perf_counter()
+            if trace is not None and trace.mark("first_byte_sent"):
+                trace.report()
+                self.turns += 1
+
+
+def load_wav(path):
+    audio, _ = librosa.load(path, sr=SAMPLE_RATE, mono=True)
+    return (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16)
+
+
+def feed(queue, audio, speed, start_time, fed_samples):
+    """Puts `audio` in the queue chunk by chunk, at `speed` times real time. Returns the number of samples fed."""
+    for start in range(0, len(audio), CHUNK_SAMPLES):
+        chunk = audio[start : start + CHUNK_SAMPLES]
+        if len(chunk) < CHUNK_SAMPLES:
+            chunk = np.pad(chunk, (0, CHUNK_SAMPLES - len(chunk)))
+        if speed > 0:
+            # absolute schedule, so that sleeping late does not accumulate
+            delay = start_time + fed_samples / SAMPLE_RATE / speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        queue.put(chunk.tobytes())
+        fed_samples += CHUNK_SAMPLES
+    return fed_samples
+
+
+def print_report(report):
+    print(
+        f"\n{report['turns']} turns, {report['audio_s']:.1f} s of audio replayed in {report['wall_s']:.1f} s "
+        f"({report['realtime_factor']:.2f}x real time), {report['turns_per_minute']:.1f} turns per minute"
+    )
+    print(f"\n{'stage':<32}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for stage, summary in sorted(report["stages"].items()):
+        values = [summary[key] for key in ("p50_ms", "p95_ms", "p99_ms", "max_ms")]
+        print(
+            f"{stage:<32}{summary['count']:>8}"
+            + "".join(f"{'-' if value is None else f'{value:.1f}':>10}" for value in values)
+        )
+
+
+def main():
+    parser = HfArgumentParser(
+        (
+            ReplayArguments,
+            StandInArguments,
+            ModuleArguments,
+            VADHandlerArguments,
+            WhisperSTTHandlerArguments,
+            ParaformerSTTHandlerArguments,
+            FasterWhisperSTTHandlerArguments,
+            ElevenLabsSTTHandlerArguments,
+            OpenApiLanguageModelHandlerArguments,
+            ElevenLabsTTSHandlerArguments,
+            QueueArguments,
+        )
+    )
+    (
+        replay_kwargs,
+        stand_in_kwargs,
+        module_kwargs,
+        vad_handler_kwargs,
+        whisper_stt_handler_kwargs,
+        paraformer_stt_handler_kwargs,
+        faster_whisper_stt_handler_kwargs,
+        elevenlabs_stt_handler_kwargs,
+        open_api_language_model_handler_kwargs,
+        elevenlabs_tts_handler_kwargs,
+        queue_kwargs,
+    ) = parser.parse_args_into_dataclasses()
+    if not replay_kwargs.replay_wav_files:
+        parser.error("--replay_wav_files is required")
+
+    setup_logger(module_kwargs.log_level)
+    prepare_module_args(
+        module_kwargs,
+        whisper_stt_handler_kwargs,
+        paraformer_stt_handler_kwargs,
+        faster_whisper_stt_handler_kwargs,
+    )
+
+    # every remote API is served by the stand-ins
+    stand_ins_url = f"http://127.0.0.1:{replay_kwargs.replay_stand_ins_port}"
+    open_api_language_model_handler_kwargs.open_api_base_url = f"{stand_ins_url}/v1"
+    open_api_language_model_handler_kwargs.open_api_api_key = "stand-in"
+    open_api_language_model_handler_kwargs.open_api_stream = True
+    elevenlabs_tts_handler_kwargs.elevenlabs_tts_gen_base_url = stand_ins_url
+    elevenlabs_tts_handler_kwargs.elevenlabs_tts_gen_api_key = "stand-in"
+    elevenlabs_stt_handler_kwargs.elevenlabs_stt_gen_base_url = stand_ins_url
+    elevenlabs_stt_handler_kwargs.elevenlabs_stt_gen_api_key = "stand-in"
+
+    rename_args(whisper_stt_handler_kwargs, "stt")
+    rename_args(faster_whisper_stt_handler_kwargs, "faster_whisper_stt")
+    rename_args(paraformer_stt_handler_kwargs, "paraformer_stt")
+    rename_args(elevenlabs_stt_handler_kwargs, "elevenlabs_stt")
+    rename_args(open_api_language_model_handler_kwargs, "open_api")
+    rename_args(elevenlabs_tts_handler_kwargs, "elevenlabs_tts")
+    # as in `build_pipeline`, the WebSocket is sent the reply word by word
+    open_api_language_model_handler_kwargs.stream_deltas = elevenlabs_tts_handler_kwargs.websocket
+
+    serve_stand_ins(stand_in_kwargs, port=replay_kwargs.replay_stand_ins_port)
+
+    queues_and_events = initialize_queues_and_events(queue_kwargs)
+    metrics.register_queues(None, queues_and_events)
+    stop_event = queues_and_events["stop_event"]
+    should_listen = queues_and_events["should_listen"]
+
+    vad = VADHandler(
+        stop_event,
+        queue_in=queues_and_events["recv_audio_chunks_queue"],
+        queue_out=queues_and_events["spoken_prompt_queue"],
+        setup_args=(should_listen,),
+        setup_kwargs=vars(vad_handler_kwargs),
+    )
+    stt = get_stt_handler(
+        module_kwargs,
+        stop_event,
+        queues_and_events["spoken_prompt_queue"],
+        queues_and_events["text_prompt_queue"],
+        whisper_stt_handler_kwargs,
+        faster_whisper_stt_handler_kwargs,
+        paraformer_stt_handler_kwargs,
+        elevenlabs_stt_handler_kwargs,
+    )
+    lm = OpenApiModelHandler(
+        stop_event,
+        queue_in=queues_and_events["text_prompt_queue"],
+        queue_out=queues_and_events["lm_response_queue"],
+        setup_kwargs=vars(open_api_language_model_handler_kwargs),
+    )
+    tts = ElevenLabsTTSHandler(
+        stop_event,
+        queue_in=queues_and_events["lm_response_queue"],
+        queue_out=queues_and_events["send_audio_chunks_queue"],
+        setup_args=(should_listen,),
+        setup_kwargs=vars(elevenlabs_tts_handler_kwargs),
+    )
+    sink = ReplaySink(stop_event, queues_and_events["send_audio_chunks_queue"])
+
+    pipeline_manager = ThreadManager([vad, stt, lm, tts, sink])
+    pipeline_manager.start()
+    should_listen.set()
+
+    silence = np.zeros(SAMPLE_RATE * replay_kwargs.replay_trailing_silence_ms // 1000, dtype=np.int16)
+    recv_audio_chunks_queue = queues_and_events["recv_audio_chunks_queue"]
+    start_time = time.perf_counter()
+    fed_samples = 0
+    for path in replay_kwargs.replay_wav_files:
+        logger.info(f"Replaying {path}")
+        audio = load_wav(path)
+        fed_samples = feed(recv_audio_chunks_queue, audio, replay_kwargs.replay_speed, start_time, fed_samples)
+        fed_samples = feed(recv_audio_chunks_queue, silence, replay_kwargs.replay_speed, start_time, fed_samples)
+
+    fed_time = time.perf_counter()
+    sink.last_output = max(sink.last_output, fed_time)
+    while time.perf_counter() - fed_time < replay_kwargs.replay_timeout_s:
+        if time.perf_counter() - sink.last_output >= replay_kwargs.replay_idle_s:
+            break
+        time.sleep(0.1)
+    # the replay is over when the last audio came out, not when we noticed
+    wall_s = max(sink.last_output, fed_time) - start_time
+
+    recv_audio_chunks_queue.put(b"END")
+    pipeline_manager.stop()
+
+    snapshot = metrics.snapshot()
+    audio_s = fed_samples / SAMPLE_RATE
+    report = {
+        "files": replay_kwargs.replay_wav_files,
+        "speed": replay_kwargs.replay_speed,
+        "stt": module_kwargs.stt,
+        "turns": sink.turns,
+        "audio_s": audio_s,
+        "wall_s": wall_s,
+        "realtime_factor": audio_s / wall_s,
+        "turns_per_minute": sink.turns / wall_s * 60,
+        "output_audio_s": sink.samples / SAMPLE_RATE,
+        "stages": snapshot["stages"],
+        "queues": snapshot["queues"],
+    }
+    print_report(report)
+    if replay_kwargs.replay_output:
+        with open(replay_kwargs.replay_output, "w") as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Report written to {replay_kwargs.replay_output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""
+Local stand-ins for the remote APIs used by the pipeline, so that benchmarks are repeatable and free.
+They answer like the real services, with configurable delays:
+- OpenAI chat completions (`POST /v1/chat/completions`), streamed as server-sent events or not
+- ElevenLabs text to speech (`POST /v1/text-to-speech/{voice_id}[/stream]`), raw 16 kHz PCM
+- ElevenLabs multi-context input streaming (`WS /v1/text-to-speech/{voice_id}/multi-stream-input`), base64 16 kHz PCM
+- ElevenLabs speech to text (`POST /v1/speech-to-text`)
+
+Run on their own with `python -m benchmarks.stand_ins --port 8765`, then point the handlers to
+`--open_api_base_url http://127.0.0.1:8765/v1`, `--elevenlabs_tts_gen_base_url http://127.0.0.1:8765` and
+`--elevenlabs_stt_gen_base_url http://127.0.0.1:8765`.
+"""
+
+import asyncio
+import base64
+import json
+import logging
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class StandInArguments:
+    stand_in_reply: str = field(
+        default="Sure, I can help with that. Let me look at your account. Is there anything else I can do for you?",
+        metadata={"help": "Answer of the LLM stand-in to every prompt."},
+    )
+    stand_in_llm_ttft_ms: int = field(
+        default=300,
+        metadata={"help": "Delay before the first token of the LLM stand-in, in milliseconds. Default is 300 ms."},
+    )
+    stand_in_llm_token_ms: int = field(
+        default=20,
+        metadata={"help": "Delay between two tokens of the LLM stand-in, in milliseconds. Default is 20 ms."},
+    )
+    stand_in_tts_ttfb_ms: int = field(
+        default=200,
+        metadata={"help": "Delay before the first audio bytes of the TTS stand-in, in milliseconds. Default is 200 ms."},
+    )
+    stand_in_tts_speed: float = field(
+        default=4.0,
+        metadata={"help": "How much faster than real time the TTS stand-in produces audio. Default is 4."},
+    )
+    stand_in_tts_chars_per_second: float = field(
+        default=15.0,
+        metadata={"help": "Speaking rate of the TTS stand-in, which sets the duration of the audio. Default is 15."},
+    )
+    stand_in_stt_latency_ms: int = field(
+        default=300,
+        metadata={"help": "Delay of the STT stand-in, in milliseconds. Default is 300 ms."},
+    )
+    stand_in_stt_text: str = field(
+        default="Hello, I would like to check my account.",
+        metadata={"help": "Transcript returned by the STT stand-in."},
+    )
+
+
+SAMPLE_RATE = 16000
+# characters buffered before the nth generation of a context, when it does not set its own `chunk_length_schedule`
+CHUNK_LENGTH_SCHEDULE = [120, 160, 250, 290]
+# 100 ms of audio per streamed chunk
+TTS_CHUNK_SAMPLES = SAMPLE_RATE // 10
+
+
+def synthesize(text, chars_per_second):
+    """A tone lasting as long as `text` would take to be spoken, as 16 kHz int16 PCM."""
+    n_samples = max(1, int(len(text) / chars_per_second * SAMPLE_RATE))
+    # half a sample off, so that no sample is zero and the silence padded by the handlers stands out
+    t = (np.arange(n_samples) + 0.5) / SAMPLE_RATE
+    return (np.sin(2 * np.pi * 220 * t) * 8000).astype("<i2")
+
+
+def create_app(config: StandInArguments):
+    app = FastAPI()
+
+    def completion_chunk(completion_id, model, delta, finish_reason=None):
+        return {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model = body.get("model", "stand-in")
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        # words keep their leading space, like the tokens of a real model
+        tokens = [word if i == 0 else f" {word}" for i, word in enumerate(config.stand_in_reply.split())]
+
+        if not body.get("stream"):
+            await asyncio.sleep((config.stand_in_llm_ttft_ms + config.stand_in_llm_token_ms * len(tokens)) / 1000)
+            return JSONResponse(
+                {
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": config.stand_in_reply},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens), "total_tokens": len(tokens)},
+                }
+            )
+
+        async def events():
+            await asyncio.sleep(config.stand_in_llm_ttft_ms / 1000)
+            yield f"data: {json.dumps(completion_chunk(completion_id, model, {'role': 'assistant', 'content': ''}))}\n\n"
+            for token in tokens:
+                yield f"data: {json.dumps(completion_chunk(completion_id, model, {'content': token}))}\n\n"
+                await asyncio.sleep(config.stand_in_llm_token_ms / 1000)
+            yield f"data: {json.dumps(completion_chunk(completion_id, model, {}, 'stop'))}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    async def tts_chunks(text):
+        audio = synthesize(text, config.stand_in_tts_chars_per_second)
+        await asyncio.sleep(config.stand_in_tts_ttfb_ms / 1000)
+        for start in range(0, len(audio), TTS_CHUNK_SAMPLES):
+            chunk = audio[start : start + TTS_CHUNK_SAMPLES]
+            yield chunk.tobytes()
+            await asyncio.sleep(len(chunk) / SAMPLE_RATE / config.stand_in_tts_speed)
+
+    @app.post("/v1/text-to-speech/{voice_id}/stream")
+    async def text_to_speech_stream(voice_id: str, request: Request):
+        body = await request.json()
+        return StreamingResponse(tts_chunks(body.get("text", "")), media_type="audio/pcm")
+
+    @app.post("/v1/text-to-speech/{voice_id}")
+    async def text_to_speech(voice_id: str, request: Request):
+        body = await request.json()
+        audio = b"".join([chunk async for chunk in tts_chunks(body.get("text", ""))])
+        return Response(content=audio, media_type="audio/pcm")
+
+    @app.websocket("/v1/text-to-speech/{voice_id}/multi-stream-input")
+    async def text_to_speech_multi_stream_input(websocket: WebSocket, voice_id: str):
+        """
+        Text sent to a context is buffered, like the real service, until it reaches the next length of the
+        `chunk_length_schedule` of the context, then its complete words are spoken. Flushing speaks what is buffered.
+        The delay before the first audio is paid once per context. Closing a context sends `isFinal` after its audio.
+        """
+        await websocket.accept()
+        # (context_id, text to speak or None to close it), spoken in order
+        requests = asyncio.Queue()
+        started = set()
+
+        async def speak():
+            while True:
+                context_id, text = await requests.get()
+                if text is None:
+                    await websocket.send_text(json.dumps({"isFinal": True, "contextId": context_id}))
+                    continue
+                if context_id not in started:
+                    started.add(context_id)
+                    await asyncio.sleep(config.stand_in_tts_ttfb_ms / 1000)
+                audio = synthesize(text, config.stand_in_tts_chars_per_second)
+                for start in range(0, len(audio), TTS_CHUNK_SAMPLES):
+                    chunk = audio[start : start + TTS_CHUNK_SAMPLES]
+                    message = {"audio": base64.b64encode(chunk.tobytes()).decode(), "contextId": context_id}
+                    await websocket.send_text(json.dumps(message))
+                    await asyncio.sleep(len(chunk) / SAMPLE_RATE / config.stand_in_tts_speed)
+
+        speaker = asyncio.create_task(speak())
+        pending = {}
+        # per context, the lengths buffered before each generation, and the number of generations so far
+        schedules = {}
+        generations = {}
+        try:
+            while True:
+                message = json.loads(await websocket.receive_text())
+                if message.get("close_socket"):
+                    await websocket.close()
+                    break
+                context_id = message.get("context_id", "default")
+                if context_id not in schedules:
+                    generation_config = message.get("generation_config") or {}
+                    schedules[context_id] = generation_config.get("chunk_length_schedule", CHUNK_LENGTH_SCHEDULE)
+                    generations[context_id] = 0
+                pending[context_id] = pending.get(context_id, "") + message.get("text", "")
+                if message.get("flush") or message.get("close_context"):
+                    text = pending.pop(context_id, "").strip()
+                else:
+                    schedule = schedules[context_id]
+                    text = ""
+                    buffered = pending[context_id]
+                    if len(buffered) >= schedule[min(generations[context_id], len(schedule) - 1)]:
+                        end = buffered.rfind(" ") + 1
+                        text, pending[context_id] = buffered[:end].strip(), buffered[end:]
+                if text:
+                    generations[context_id] += 1
+                    requests.put_nowait((context_id, text))
+                if message.get("close_context"):
+                    requests.put_nowait((context_id, None))
+        except WebSocketDisconnect:
+            pass
+        finally:
+            speaker.cancel()
+
+    @app.post("/v1/speech-to-text")
+    async def speech_to_text(request: Request):
+        # the multipart body is not parsed, its content does not change the answer
+        await request.body()
+        await asyncio.sleep(config.stand_in_stt_latency_ms / 1000)
+        return JSONResponse(
+            {
+                "language_code": "en",
+                "language_probability": 1.0,
+                "text": config.stand_in_stt_text,
+                "words": [],
+            }
+        )
+
+    return app
+
+
+def serve_stand_ins(config: StandInArguments, host="127.0.0.1", port=8765):
+    """Serves the stand-ins from a daemon thread and returns once they accept requests."""
+    server = uvicorn.Server(uvicorn.Config(create_app(config), host=host, port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    logger.info(f"API stand-ins served on http://{host}:{port}")
+    return server
+
+
+if __name__ == "__main__":
+    from transformers import HfArgumentParser
+
+    parser = HfArgumentParser(StandInArguments)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    config, args = parser.parse_args_into_dataclasses()
+    uvicorn.run(create_app(config), host=args.host, port=args.port)
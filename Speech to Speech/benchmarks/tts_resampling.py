@@ -0,0 +1,130 @@
+"""
+Benchmark of the resampling of the local TTS output to 16 kHz: `librosa.resample` called on every streamed chunk, as
+the TTS handlers used to, against the `StreamingResampler` of `utils.audio` carrying its state across chunks.
+WAV files of real TTS output are read at their own sampling rate (44.1 kHz for Parler and Melo, 24 kHz for ChatTTS)
+and cut in chunks of each of the given durations. For each, the report gives the time to resample one second of audio
+and the signal-to-noise ratio against `librosa.resample` run once on the whole file, which exposes the artifacts at
+the chunk boundaries.
+
+    python -m benchmarks.tts_resampling --resampling_wav_files parler.wav chattts.wav --resampling_chunk_ms 40 200 1000
+"""
+
+import json
+import logging
+import timeit
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import librosa
+import numpy as np
+from transformers import HfArgumentParser
+
+from utils.audio import StreamingResampler
+
+logger = logging.getLogger(__name__)
+
+TARGET_SAMPLE_RATE = 16000
+
+
+@dataclass
+class TTSResamplingArguments:
+    resampling_wav_files: List[str] = field(
+        default_factory=list,
+        metadata={"help": "WAV files of TTS output, read at their own sampling rate."},
+    )
+    resampling_chunk_ms: List[int] = field(
+        default_factory=lambda: [40, 200, 1000],
+        metadata={"help": "Durations of the streamed chunks, in milliseconds. Default is 40 200 1000."},
+    )
+    resampling_repeat: int = field(
+        default=5,
+        metadata={"help": "Number of measures per method, the best one is reported. Default is 5."},
+    )
+    resampling_output: Optional[str] = field(
+        default=None,
+        metadata={"help": "If specified, the report is also written to this JSON file."},
+    )
+
+
+def librosa_chunks(chunks, sample_rate):
+    return np.concatenate(
+        [librosa.resample(chunk, orig_sr=sample_rate, target_sr=TARGET_SAMPLE_RATE) for chunk in chunks]
+    )
+
+
+def streaming_chunks(resampler, chunks):
+    return np.concatenate(list(resampler.stream(chunks)))
+
+
+def snr_db(reference, audio):
+    n_samples = min(len(reference), len(audio))
+    reference, audio = reference[:n_samples], audio[:n_samples]
+    noise = np.sum((reference - audio) ** 2)
+    if noise == 0:
+        return float("inf")
+    return float(10 * np.log10(np.sum(reference**2) / noise))
+
+
+def measure(function, duration, repeat):
+    """Best time to resample one second of audio over `repeat` runs, in milliseconds."""
+    return min(timeit.repeat(function, number=1, repeat=repeat)) / duration * 1000
+
+
+def benchmark_file(path, chunk_ms_list, repeat):
+    audio, sample_rate = librosa.load(path, sr=None, mono=True)
+    audio = audio.astype(np.float32)
+    duration = len(audio) / sample_rate
+    reference = librosa.resample(audio, orig_sr=sample_rate, target_sr=TARGET_SAMPLE_RATE)
+    resampler = StreamingResampler(sample_rate, TARGET_SAMPLE_RATE)
+
+    results = []
+    for chunk_ms in chunk_ms_list:
+        chunk_samples = max(1, chunk_ms * sample_rate // 1000)
+        chunks = [audio[i : i + chunk_samples] for i in range(0, len(audio), chunk_samples)]
+        results.append(
+            {
+                "file": path,
+                "sample_rate": sample_rate,
+                "chunk_ms": chunk_ms,
+                "librosa_ms_per_s": measure(lambda: librosa_chunks(chunks, sample_rate), duration, repeat),
+                "streaming_ms_per_s": measure(lambda: streaming_chunks(resampler, chunks), duration, repeat),
+                "librosa_snr_db": snr_db(reference, librosa_chunks(chunks, sample_rate)),
+                "streaming_snr_db": snr_db(reference, streaming_chunks(resampler, chunks)),
+            }
+        )
+    return results
+
+
+def print_report(results):
+    print(
+        f"\n{'file':<24}{'rate':>7}{'chunk ms':>10}{'librosa ms/s':>14}{'stream ms/s':>13}"
+        f"{'speedup':>9}{'librosa SNR':>13}{'stream SNR':>12}"
+    )
+    for result in results:
+        print(
+            f"{result['file'][-24:]:<24}{result['sample_rate']:>7}{result['chunk_ms']:>10}"
+            f"{result['librosa_ms_per_s']:>14.2f}{result['streaming_ms_per_s']:>13.2f}"
+            f"{result['librosa_ms_per_s'] / result['streaming_ms_per_s']:>8.1f}x"
+            f"{result['librosa_snr_db']:>13.1f}{result['streaming_snr_db']:>12.1f}"
+        )
+
+
+def main():
+    parser = HfArgumentParser(TTSResamplingArguments)
+    (args,) = parser.parse_args_into_dataclasses()
+    logging.basicConfig(level="INFO", format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    if not args.resampling_wav_files:
+        parser.error("At least one WAV file of TTS output is needed (--resampling_wav_files).")
+
+    results = []
+    for path in args.resampling_wav_files:
+        results.extend(benchmark_file(path, args.resampling_chunk_ms, args.resampling_repeat))
+    print_report(results)
+    if args.resampling_output:
+        with open(args.resampling_output, "w") as f:
+            json.dump(results, f, indent=2)
+        logger.info(f"Report written to {args.resampling_output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""
+Load simulator for the Twilio Media Streams ingress (`connections/twilio_handler.py`).
+
+Opens concurrent WebSockets to the `/stream` endpoint of a running pipeline and plays the Twilio protocol on each:
+`connected`, `start`, then 20 ms `media` frames of base64 mu-law audio at real-time pacing, then `stop`.
+Each WAV file is a caller turn, followed by silence while the agent answers. For every concurrency level it reports:
+- the response latency, from the end of a caller turn to the first outbound media frame
+- the jitter of the outbound frames: inter-arrival gaps, and frames arriving after the previous audio has finished
+  playing, i.e. gaps the caller hears
+- the CPU used by the pipeline process per call, when `--load_server_pid` is given and psutil is installed
+
+The pipeline has to run in 'twilio' mode with `--max_sessions` at least the highest concurrency, e.g.
+
+    python -m benchmarks.twilio_load --load_wav_files turn1.wav turn2.wav --load_concurrency 1 4 16 --load_server_pid 1234
+"""
+
+import asyncio
+import base64
+import json
+import logging
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import librosa
+import websockets
+from transformers import HfArgumentParser
+
+from utils.audio import float32_to_pcm16, pcm16_to_ulaw
+from utils.metrics import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+TWILIO_SAMPLE_RATE = 8000
+# Twilio sends 20 ms frames
+FRAME_BYTES = 160
+
+
+@dataclass
+class TwilioLoadArguments:
+    load_url: str = field(
+        default="ws://127.0.0.1:8000/stream",
+        metadata={"help": "WebSocket endpoint of the TwilioHandler. Default is ws://127.0.0.1:8000/stream."},
+    )
+    load_wav_files: List[str] = field(
+        default_factory=list,
+        metadata={"help": "Caller turns played by every simulated call, in order. Resampled to 8 kHz mono."},
+    )
+    load_concurrency: List[int] = field(
+        default_factory=lambda: [1, 2, 4, 8],
+        metadata={"help": "Numbers of concurrent calls to simulate, one level after the other. Default is 1 2 4 8."},
+    )
+    load_turn_gap_s: float = field(
+        default=6.0,
+        metadata={"help": "Silence played after each caller turn, while the agent answers. Default is 6 s."},
+    )
+    load_ramp_s: float = field(
+        default=1.0,
+        metadata={"help": "Calls of a level are started over this duration, not all at once. Default is 1 s."},
+    )
+    load_server_pid: Optional[int] = field(
+        default=None,
+        metadata={"help": "PID of the pipeline process, to measure its CPU usage per call. Requires psutil."},
+    )
+    load_output: Optional[str] = field(
+        default=None,
+        metadata={"help": "If specified, the report is also written to this JSON file."},
+    )
+    log_level: str = field(
+        default="info",
+        metadata={"help": "Provide logging level. Example --log_level debug, default=info."},
+    )
+
+
+def load_mulaw(path):
+    """Reads a WAV file as 8 kHz mu-law bytes, like the audio Twilio sends."""
+    audio, _ = librosa.load(path, sr=TWILIO_SAMPLE_RATE, mono=True)
+    return pcm16_to_ulaw(float32_to_pcm16(audio))
+
+
+class CallStats:
+    """Timings of the outbound media of a simulated call."""
+
+    def __init__(self):
+        self.turn_latency = LatencyHistogram()
+        self.inter_arrival = LatencyHistogram()
+        self.frames = 0
+        self.late_frames = 0
+        self.clears = 0
+        self.turn_end = None
+        self.last_arrival = None
+        self.playout_end = 0.0
+
+    def on_media(self, payload_size):
+        now = time.perf_counter()
+        if self.turn_end is not None:
+            self.turn_latency.record(now - self.turn_end)
+            self.turn_end = None
+        if self.last_arrival is not None:
+            self.inter_arrival.record(now - self.last_arrival)
+        if now > self.playout_end and self.frames and now - self.playout_end < 1.0:
+            # the previous audio finished playing before this frame came, unless the answer was over
+            self.late_frames += 1
+        self.playout_end = max(self.playout_end, now) + payload_size / TWILIO_SAMPLE_RATE
+        self.last_arrival = now
+        self.frames += 1
+
+
+async def receive(websocket, stats):
+    async for message in websocket:
+        event = json.loads(message)
+        if event.get("event") == "media":
+            stats.on_media(len(base64.b64decode(event["media"]["payload"])))
+        elif event.get("event") == "clear":
+            stats.clears += 1
+
+
+async def simulate_call(url, turns, turn_gap_s, start_delay):
+    await asyncio.sleep(start_delay)
+    stats = CallStats()
+    stream_sid = f"MZ{uuid.uuid4().hex}"
+    call_sid = f"CA{uuid.uuid4().hex}"
+    silence = b"\xff" * int(turn_gap_s * TWILIO_SAMPLE_RATE)  # mu-law silence
+
+    async with websockets.connect(url) as websocket:
+        receiver = asyncio.create_task(receive(websocket, stats))
+        await websocket.send(json.dumps({"event": "connected", "protocol": "Call", "version": "1.0.0"}))
+        await websocket.send(
+            json.dumps(
+                {
+                    "event": "start",
+                    "sequenceNumber": "1",
+                    "streamSid": stream_sid,
+                    "start": {
+                        "streamSid": stream_sid,
+                        "callSid": call_sid,
+                        "tracks": ["inbound"],
+                        "mediaFormat": {"encoding": "audio/x-mulaw", "sampleRate": TWILIO_SAMPLE_RATE, "channels": 1},
+                    },
+                }
+            )
+        )
+
+        sequence_number = 2
+        chunk = 0
+        start = time.perf_counter()
+        for turn in turns:
+            for audio, ends_turn in ((turn, True), (silence, False)):
+                for offset in range(0, len(audio), FRAME_BYTES):
+                    # absolute schedule, so that sleeping late does not accumulate
+                    delay = start + chunk * FRAME_BYTES / TWILIO_SAMPLE_RATE - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    payload = base64.b64encode(audio[offset : offset + FRAME_BYTES]).decode("ascii")
+                    await websocket.send(
+                        json.dumps(
+                            {
+                                "event": "media",
+                                "sequenceNumber": str(sequence_number),
+                                "streamSid": stream_sid,
+                                "media": {
+                                    "track": "inbound",
+                                    "chunk": str(chunk + 1),
+                                    "timestamp": str(chunk * 20),
+                                    "payload": payload,
+                                },
+                            }
+                        )
+                    )
+                    sequence_number += 1
+                    chunk += 1
+                if ends_turn:
+                    stats.turn_end = time.perf_counter()
+
+        await websocket.send(
+            json.dumps({"event": "stop", "sequenceNumber": str(sequence_number), "streamSid": stream_sid})
+        )
+        receiver.cancel()
+    return stats
+
+
+def cpu_meter(pid):
+    if pid is None:
+        return None
+    try:
+        import psutil
+    except ImportError:
+        logger.warning("psutil is not installed, CPU usage is not measured")
+        return None
+    process = psutil.Process(pid)
+    process.cpu_percent()  # the first call only starts the measure
+    return process
+
+
+async def run_level(args, turns, concurrency):
+    meter = cpu_meter(args.load_server_pid)
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *(
+            simulate_call(args.load_url, turns, args.load_turn_gap_s, i * args.load_ramp_s / concurrency)
+            for i in range(concurrency)
+        ),
+        return_exceptions=True,
+    )
+    elapsed = time.perf_counter() - start
+    cpu_percent = meter.cpu_percent() if meter is not None else None
+
+    calls = [result for result in results if isinstance(result, CallStats)]
+    for result in results:
+        if isinstance(result, Exception):
+            logger.error(f"Call failed: {result!r}")
+
+    turn_latency, inter_arrival = LatencyHistogram(), LatencyHistogram()
+    for call in calls:
+        turn_latency.merge(call.turn_latency)
+        inter_arrival.merge(call.inter_arrival)
+    frames = sum(call.frames for call in calls)
+    return {
+        "concurrency": concurrency,
+        "calls_completed": len(calls),
+        "elapsed_s": elapsed,
+        "turns_answered": turn_latency.count,
+        "turns_played": len(calls) * len(turns),
+        "response_latency": turn_latency.summary(),
+        "frame_inter_arrival": inter_arrival.summary(),
+        "outbound_frames": frames,
+        "late_frames": sum(call.late_frames for call in calls),
+        "clears": sum(call.clears for call in calls),
+        "cpu_percent": cpu_percent,
+        "cpu_percent_per_call": cpu_percent / concurrency if cpu_percent is not None else None,
+    }
+
+
+def print_report(levels):
+    print(
+        f"\n{'calls':>6}{'answered':>10}{'resp p50':>10}{'resp p95':>10}{'resp p99':>10}"
+        f"{'gap p95':>10}{'gap p99':>10}{'late':>8}{'cpu/call':>10}"
+    )
+    for level in levels:
+        response, gaps = level["response_latency"], level["frame_inter_arrival"]
+
+        def ms(value):
+            return "-" if value is None else f"{value:.0f}"
+
+        cpu = level["cpu_percent_per_call"]
+        print(
+            f"{level['concurrency']:>6}"
+            f"{level['turns_answered']:>5}/{level['turns_played']:<4}"
+            f"{ms(response['p50_ms']):>10}{ms(response['p95_ms']):>10}{ms(response['p99_ms']):>10}"
+            f"{ms(gaps['p95_ms']):>10}{ms(gaps['p99_ms']):>10}"
+            f"{level['late_frames']:>8}{'-' if cpu is None else f'{cpu:.1f}%':>10}"
+        )
+
+
+async def main_async(args):
+    turns = [load_mulaw(path) for path in args.load_wav_files]
+    levels = []
+    for concurrency in args.load_concurrency:
+        logger.info(f"Simulating {concurrency} concurrent calls")
+        levels.append(await run_level(args, turns, concurrency))
+        # let the pipeline close the sessions of this level
+        await asyncio.sleep(2)
+    return levels
+
+
+def main():
+    parser = HfArgumentParser(TwilioLoadArguments)
+    (args,) = parser.parse_args_into_dataclasses()
+    if not args.load_wav_files:
+        parser.error("--load_wav_files is required")
+    logging.basicConfig(
+        level=args.log_level.upper(),
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+
+    levels = asyncio.run(main_async(args))
+    print_report(levels)
+    if args.load_output:
+        with open(args.load_output, "w") as f:
+            json.dump(levels, f, indent=2)
+        logger.info(f"Report written to {args.load_output}")
+
+
+if __name__ == "__main__":
+    main()
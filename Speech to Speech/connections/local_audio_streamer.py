@@ -5,6 +5,8 @@ import numpy as np
 import time
 import logging
 
+from utils.turn_trace import unwrap
+
 logger = logging.getLogger(__name__)
 
 
@@ -14,8 +16,13 @@ class LocalAudioStreamer:
         input_queue,
         output_queue,
         list_play_chunk_size=512,
+        should_listen=None,
     ):
         self.list_play_chunk_size = list_play_chunk_size
+        # set while the synthesis is idle, the turn being played is then over once the queue is drained
+        self.should_listen = should_listen
+        # trace of the turn whose audio is being played, finished once it all was
+        self.playing_trace = None
 
         self.stop_event = threading.Event()
         self.input_queue = input_queue
@@ -25,10 +32,21 @@ class LocalAudioStreamer:
         def callback(indata, outdata, frames, time, status):
             try:
                 if self.output_queue.empty():
+                    if self.playing_trace is not None and (
+                        self.should_listen is None or self.should_listen.is_set()
+                    ):
+                        self.playing_trace.finish()
+                        self.playing_trace = None
                     self.input_queue.put(indata.copy())
                     outdata[:] = 0 * outdata
                 else:
-                    audio_data = self.output_queue.get()
+                    audio_data, trace = unwrap(self.output_queue.get())
+                    if trace is not None and trace.cancelled:
+                        outdata[:] = 0 * outdata
+                        return
+                    if trace is not None and trace.mark("first_byte_sent"):
+                        trace.report()
+                    self.playing_trace = trace
                     # Ensure audio_data is a numpy array with correct shape
                     if isinstance(audio_data, bytes):
                         # Convert bytes to numpy array
@@ -2,6 +2,8 @@ import socket
 from rich.console import Console
 import logging
 
+from utils.ring_buffer import AudioRingBuffer
+
 logger = logging.getLogger(__name__)
 
 console = Console()
@@ -27,16 +29,19 @@ class SocketReceiver:
         self.chunk_size = chunk_size
         self.host = host
         self.port = port
+        # packets are received in place, the ring buffer copies them on put while a queue needs its own bytes
+        self.chunk = memoryview(bytearray(chunk_size))
+        self.copy_chunks = not isinstance(queue_out, AudioRingBuffer)
 
     def receive_full_chunk(self, conn, chunk_size):
-        data = b""
-        while len(data) < chunk_size:
-            packet = conn.recv(chunk_size - len(data))
-            if not packet:
+        received = 0
+        while received < chunk_size:
+            n_bytes = conn.recv_into(self.chunk[received:chunk_size])
+            if not n_bytes:
                 # connection closed
                 return None
-            data += packet
-        return data
+            received += n_bytes
+        return bytes(self.chunk[:chunk_size]) if self.copy_chunks else self.chunk[:chunk_size]
 
     def run(self):
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -2,6 +2,8 @@ import socket
 from rich.console import Console
 import logging
 
+from utils.turn_trace import unwrap
+
 logger = logging.getLogger(__name__)
 
 console = Console()
@@ -28,8 +30,12 @@ class SocketSender:
         logger.info("sender connected")
 
         while not self.stop_event.is_set():
-            audio_chunk = self.queue_in.get()
+            audio_chunk, trace = unwrap(self.queue_in.get())
+            if trace is not None and trace.cancelled:
+                continue
             self.conn.sendall(audio_chunk)
+            if trace is not None and trace.mark("first_byte_sent"):
+                trace.report()
             if isinstance(audio_chunk, bytes) and audio_chunk == b"END":
                 break
         self.conn.close()
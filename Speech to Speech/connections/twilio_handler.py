@@ -1,24 +1,79 @@
 import asyncio
 import base64
+import itertools
 import json
 import logging
 import threading
 from queue import Queue
-from typing import Optional, Any, Dict
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from typing import Optional, Any, Dict, List
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, status
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from twilio.rest import Client  # type: ignore[import]
 from twilio.twiml.voice_response import VoiceResponse  # type: ignore[import]
+import numpy as np
 import uvicorn
 from threading import Event
 
-# numpy is not used; removed to satisfy linters
-import audioop
+from utils.audio import (
+    StreamingResampler,
+    float32_to_pcm16,
+    pcm16_to_float32,
+    pcm16_to_ulaw,
+    resample,
+    ulaw_to_pcm16,
+)
+from utils.metrics import metrics
+from utils.ring_buffer import AudioRingBuffer
+from utils.turn_trace import unwrap
 
 logger = logging.getLogger(__name__)
 
 
+class MediaStream:
+    """
+    State of a single Twilio media stream, i.e. of one phone call.
+    In single session mode the stream uses the queues and events of the handler, with a SessionManager
+    each stream runs its own pipeline session.
+    The resamplers of both directions live as long as the stream, so that each 20 ms packet continues the filter
+    state of the previous one instead of starting from silence.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        stop_event: Event,
+        queue_in: Queue[bytes],
+        queue_out: Queue[bytes],
+        should_listen: Event,
+        session: Optional[Any] = None,
+        inbound_resampler: Optional[StreamingResampler] = None,
+        outbound_resampler: Optional[StreamingResampler] = None,
+    ):
+        self.websocket = websocket
+        self.stop_event = stop_event
+        self.queue_in = queue_in
+        self.queue_out = queue_out
+        self.should_listen = should_listen
+        self.session = session
+        self.stream_sid: Optional[str] = None
+
+        # Twilio to pipeline, None when the pipeline takes the 8 kHz audio as is
+        self.inbound_resampler = inbound_resampler
+        # pipeline to Twilio
+        self.outbound_resampler = outbound_resampler
+
+        # Audio buffering - accumulate small Twilio chunks into larger chunks for VAD,
+        # unless the VAD reads its windows from an AudioRingBuffer
+        self.audio_buffer = bytearray()
+
+        # Trace of the turn whose audio was last sent, Twilio's buffer is cleared if it gets cancelled
+        self.playing_trace = None
+        # Name of the mark sent after the last audio of `playing_trace`, Twilio echoes it once that audio is played
+        self.pending_mark: Optional[str] = None
+        self.mark_ids = itertools.count()
+
+
 class TwilioHandler:
     """
     Handles Twilio voice calls integration with the speech-to-speech pipeline.
@@ -37,6 +92,9 @@ class TwilioHandler:
         port: int = 8000,
         user_number: Optional[str] = None,
         domain: Optional[str] = None,
+        session_manager: Optional[Any] = None,
+        inbound_sample_rate: int = 16_000,
+        opener_audio: Optional[np.ndarray] = None,
     ):
         self.stop_event = stop_event
         self.queue_in: Queue[bytes] = queue_in  # Audio chunks from Twilio
@@ -48,6 +106,8 @@ class TwilioHandler:
         self.port = port
         self.user_number = user_number
         self.twilio_domain = domain
+        # When set, every media stream gets its own pipeline session on the shared models
+        self.session_manager = session_manager
 
         # Twilio client
         self.client = Client(account_sid, auth_token)
@@ -62,11 +122,16 @@ class TwilioHandler:
         # Audio format settings
         self.twilio_smaple_rate = 8_000  # Twilio uses 8kHz
         self.target_sample_rate = 16_000  # Pipeline expects 16kHz
+        # In telephony mode the VAD runs on the 8 kHz audio, only the speech it detects is upsampled
+        self.inbound_sample_rate = inbound_sample_rate
+
+        # VAD needs at least 512 samples (32 ms at 16 kHz) to work properly, 256 at 8 kHz
+        self.min_chunk_size = 1_024 if inbound_sample_rate == 16_000 else 512  # bytes
 
-        # Audio buffering - accumulate small Twilio chunks into larger chunks for VAD
-        # VAD needs at least 512 samples (32 ms at 16 kHz) to work properly
-        self.audio_buffer = b""
-        self.min_chunk_size = 1_024  # butes = 512 samples at 16 kHz (32 ms)
+        # First assistant turn rendered at startup, encoded once and sent as soon as a media stream starts
+        self.opener_payloads = (
+            self.encode_opener(opener_audio) if opener_audio is not None else []
+        )
 
         # FastAPI app for webhooks
         self.app = FastAPI()
@@ -83,33 +148,57 @@ class TwilioHandler:
         # Thread for running the FastAPI server
         self.server_thread: Optional[threading.Thread] = None
 
-    def convert_twilio_audio_to_pipeline_format(self, audio_data: bytes) -> bytes:
+    def new_resamplers(self):
+        """The (inbound, outbound) resamplers of a new media stream."""
+        inbound_resampler = None
+        if self.inbound_sample_rate != self.twilio_smaple_rate:
+            inbound_resampler = StreamingResampler(self.twilio_smaple_rate, self.inbound_sample_rate)
+        outbound_resampler = StreamingResampler(self.target_sample_rate, self.twilio_smaple_rate)
+        return inbound_resampler, outbound_resampler
+
+    def convert_twilio_audio_to_pipeline_format(self, stream: MediaStream, audio_data: bytes) -> bytes:
         try:
-            pcm_audio = audioop.ulaw2lin(audio_data, 2)  # 2 = 16-bit samples
-            resampled_audio, _ = audioop.ratecv(
-                pcm_audio,
-                2,  # sample width (2 bytes = 16 bits)
-                1,  # number of channels (mono)
-                self.twilio_smaple_rate,  # input sample rate (8kHz)
-                self.target_sample_rate,  # output sample rate (16kHz)
-                None,  # state (None or first call)
-            )
-            return resampled_audio
+            if stream.inbound_resampler is None:
+                return ulaw_to_pcm16(audio_data).tobytes()
+            # decoded to float32 straight into the resampler, in the same pass, resampled from 8kHz to 16kHz
+            resampled_audio = stream.inbound_resampler.process_ulaw(audio_data)
+            return float32_to_pcm16(resampled_audio).tobytes()
         except Exception as e:
             logger.error(f"Error converting audio format: {e}")
             return b""
 
-    def convert_pipeline_audio_to_twilio_format(self, audio_data: bytes) -> bytes:
-        try:
-            resampled_audio, _ = audioop.ratecv(
-                audio_data,
-                2,  # sample width (2 bytes = 16 bits)
-                1,  # number of channels (mono)
-                self.target_sample_rate,  # output sample rate (16kHz)
-                self.twilio_smaple_rate,  # input sample rate (8kHz)
-                None,  # state (None or first call)
+    def encode_opener(self, audio: np.ndarray) -> List[str]:
+        """The base64 mu-law payloads, of 20 ms each, of the opener audio at the pipeline sample rate."""
+        resampled_audio = resample(
+            pcm16_to_float32(audio), self.target_sample_rate, self.twilio_smaple_rate
+        )
+        mulaw_audio = pcm16_to_ulaw(float32_to_pcm16(resampled_audio))
+        packet_size = self.twilio_smaple_rate // 50
+        return [
+            base64.b64encode(mulaw_audio[i : i + packet_size]).decode("utf-8")
+            for i in range(0, len(mulaw_audio), packet_size)
+        ]
+
+    async def play_opener(self, stream: MediaStream):
+        """Send the pre-rendered opener, Twilio buffers it and plays it at once."""
+        for payload in self.opener_payloads:
+            await stream.websocket.send_text(
+                json.dumps(
+                    {
+                        "event": "media",
+                        "streamSid": stream.stream_sid,
+                        "media": {"payload": payload},
+                    }
+                )
             )
-            mulaw_audio = audioop.lin2ulaw(resampled_audio, 2)
+        if self.opener_payloads:
+            logger.debug(f"Sent the opener to Twilio: {len(self.opener_payloads)} packets")
+
+    def convert_pipeline_audio_to_twilio_format(self, stream: MediaStream, audio_data: bytes) -> bytes:
+        try:
+            # resampled from 16kHz to 8kHz
+            resampled_audio = stream.outbound_resampler.process(pcm16_to_float32(audio_data))
+            mulaw_audio = pcm16_to_ulaw(float32_to_pcm16(resampled_audio))
             return mulaw_audio
         except Exception as e:
             logger.error(f"Error converting audio to Twilio format: {e}")
@@ -171,6 +260,11 @@ class TwilioHandler:
                     status_code=500, content={"error": "Failed to initiate call"}
                 )
 
+        @self.app.get("/metrics")
+        async def get_metrics():
+            """Latency percentiles per stage and per call, and queue stats."""
+            return JSONResponse(content=metrics.snapshot())
+
         @self.app.post("/stream")
         async def handle_media_stream(request_data: Dict[str, Any]):
             """Handle media stream events."""
@@ -198,15 +292,20 @@ class TwilioHandler:
         async def websocket_endpoint(websocket: WebSocket):
             """WebSocket endpoint for bidirectional media streaming."""
             await websocket.accept()
-            self.websocket = websocket
+            try:
+                stream = self.open_media_stream(websocket)
+            except RuntimeError as e:
+                # every session is taken: an expected overload, not a crash, the call may try again later
+                logger.warning(f"Rejecting media stream: {e}")
+                await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+                return
             logger.info("WebSocket connection established")
 
+            # Start sending audio from queue
+            sender = asyncio.create_task(self.send_audio_to_twilio(stream))
             try:
-                # Start sending audio from queue
-                asyncio.create_task(self.send_audio_to_twilio())
-
                 # Listen for incoming messages
-                while not self.stop_event.is_set():
+                while not stream.stop_event.is_set():
                     try:
                         data = await websocket.receive_text()
                         message = json.loads(data)
@@ -215,11 +314,11 @@ class TwilioHandler:
                         logger.debug(f"Recieve WebSocket event: {event_type}")
 
                         if event_type == "start":
-                            self.media_stream_sid = message.get("streamSid")
-                            logger.info(
-                                f"Media stream started: {self.media_stream_sid}"
-                            )
-                            self.should_listen.set()
+                            stream.stream_sid = message.get("streamSid")
+                            self.media_stream_sid = stream.stream_sid
+                            logger.info(f"Media stream started: {stream.stream_sid}")
+                            await self.play_opener(stream)
+                            stream.should_listen.set()
 
                         elif event_type == "media":
                             # Handle incoming audio
@@ -229,20 +328,14 @@ class TwilioHandler:
                                 audio_data = base64.b64decode(payload)
                                 converted_audio = (
                                     self.convert_twilio_audio_to_pipeline_format(
-                                        audio_data
+                                        stream, audio_data
                                     )
                                 )
                                 if converted_audio:
-                                    self.audio_buffer += converted_audio
-                                    while len(self.audio_buffer) >= self.min_chunk_size:
-                                        chunk = self.audio_buffer[: self.min_chunk_size]
-                                        self.audio_buffer = self.audio_buffer[
-                                            self.min_chunk_size :
-                                        ]
-                                        self.queue_in.put(chunk)
-                                        logger.debug(
-                                            f"Sent {len(chunk)} bytes to VAD queue"
-                                        )
+                                    self.push_audio(stream, converted_audio)
+
+                        elif event_type == "mark":
+                            self.finish_playing(stream, message.get("mark", {}).get("name"))
 
                         elif event_type == "stop":
                             logger.info("Media stream stopped by Twilio")
@@ -254,30 +347,105 @@ class TwilioHandler:
                     except Exception as e:
                         logger.error(f"WebSocket error: {e}")
 
+                if stream.stop_event.is_set():
+                    # the pipeline ended the conversation, hang up this stream
+                    await websocket.close()
+
             except Exception as e:
                 logger.error(f"WebSocket connection error: {e}")
             finally:
-                self.websocket = None
+                sender.cancel()
+                await self.close_media_stream(stream)
                 logger.info("WebSocket connection closed")
 
         # Prevent linters from flagging unused local endpoint functions
         _ = (
             handle_voice_call,
             start_outbound_call,
+            get_metrics,
             handle_media_stream,
             websocket_endpoint,
         )
 
-    async def send_audio_to_twilio(self):
+    def open_media_stream(self, websocket: WebSocket) -> MediaStream:
+        """Bind a new WebSocket connection to a pipeline, opening a session if a SessionManager is used."""
+        inbound_resampler, outbound_resampler = self.new_resamplers()
+        if self.session_manager is not None:
+            session = self.session_manager.open_session()
+            return MediaStream(
+                websocket,
+                stop_event=session.stop_event,
+                queue_in=session.recv_audio_chunks_queue,
+                queue_out=session.send_audio_chunks_queue,
+                should_listen=session.should_listen,
+                session=session,
+                inbound_resampler=inbound_resampler,
+                outbound_resampler=outbound_resampler,
+            )
+
+        self.websocket = websocket
+        return MediaStream(
+            websocket,
+            stop_event=self.stop_event,
+            queue_in=self.queue_in,
+            queue_out=self.queue_out,
+            should_listen=self.should_listen,
+            inbound_resampler=inbound_resampler,
+            outbound_resampler=outbound_resampler,
+        )
+
+    async def close_media_stream(self, stream: MediaStream):
+        """Release what was bound to the stream when its WebSocket connection closes."""
+        if stream.session is not None:
+            # joining the session threads blocks, keep it off the event loop
+            await asyncio.to_thread(
+                self.session_manager.close_session, stream.session.session_id
+            )
+        else:
+            self.websocket = None
+
+    def push_audio(self, stream: MediaStream, audio: bytes):
+        """Hand PCM audio of the stream, at `inbound_sample_rate`, to the VAD."""
+        if isinstance(stream.queue_in, AudioRingBuffer):
+            # the ring copies the samples in place and cuts the VAD windows itself
+            stream.queue_in.put(audio)
+            return
+        stream.audio_buffer += audio
+        n_chunks = len(stream.audio_buffer) // self.min_chunk_size
+        for i in range(n_chunks):
+            chunk = bytes(
+                stream.audio_buffer[i * self.min_chunk_size : (i + 1) * self.min_chunk_size]
+            )
+            stream.queue_in.put(chunk)
+            logger.debug(f"Sent {len(chunk)} bytes to VAD queue")
+        del stream.audio_buffer[: n_chunks * self.min_chunk_size]
+
+    async def send_audio_to_twilio(self, stream: MediaStream):
         """Send audio from queue to Twilio via WebSocket."""
-        while not self.stop_event.is_set() and self.websocket:
+        while not stream.stop_event.is_set():
             try:
+                if stream.playing_trace is not None and stream.playing_trace.cancelled:
+                    # the user barged in, drop the audio Twilio has not played yet
+                    stream.playing_trace = None
+                    stream.pending_mark = None
+                    # the samples of the cancelled turn held back by the filter must not lead the next one
+                    stream.outbound_resampler.reset()
+                    await stream.websocket.send_text(
+                        json.dumps({"event": "clear", "streamSid": stream.stream_sid})
+                    )
+                    logger.debug("Sent clear to Twilio")
+
                 # Check if there's an audio chunk to send
-                if not self.queue_out.empty():
-                    audio_chunk: bytes = self.queue_out.get(timeout=0.1)
+                if not stream.queue_out.empty():
+                    audio_chunk, trace = unwrap(stream.queue_out.get(timeout=0.1))
+                    if trace is not None and trace.cancelled:
+                        continue
+                    stream.playing_trace = trace
+                    # the audio of the turn goes on, a mark sent before does not cover it
+                    stream.pending_mark = None
 
                     converted_audio = self.convert_pipeline_audio_to_twilio_format(
-                        audio_chunk
+                        stream, audio_chunk
                     )
 
                     if converted_audio:
@@ -287,15 +455,33 @@ class TwilioHandler:
                         # Send to Twilio
                         message = {
                             "event": "media",
-                            "streamSid": self.media_stream_sid,
+                            "streamSid": stream.stream_sid,
                             "media": {"payload": audio_b64},
                         }
 
-                        await self.websocket.send_text(json.dumps(message))
+                        await stream.websocket.send_text(json.dumps(message))
+                        if trace is not None and trace.mark("first_byte_sent"):
+                            trace.report()
                         logger.debug(
                             f"Sent {len(audio_chunk)} bytes -> {len(converted_audio)} bytes to Twilio"
                         )
                 else:
+                    if (
+                        stream.playing_trace is not None
+                        and stream.pending_mark is None
+                        and stream.should_listen.is_set()
+                    ):
+                        # the synthesis is idle and its audio was all sent, learn when Twilio has played it
+                        stream.pending_mark = f"turn-{stream.playing_trace.turn_id}-{next(stream.mark_ids)}"
+                        await stream.websocket.send_text(
+                            json.dumps(
+                                {
+                                    "event": "mark",
+                                    "streamSid": stream.stream_sid,
+                                    "mark": {"name": stream.pending_mark},
+                                }
+                            )
+                        )
                     await asyncio.sleep(0.01)
 
             except Exception as e:
@@ -303,6 +489,18 @@ class TwilioHandler:
                 # Small delay on error to prevent rapid0fire error logging
                 await asyncio.sleep(0.1)
 
+    def finish_playing(self, stream: MediaStream, mark: Optional[str]):
+        """
+        Finishes the turn being played when Twilio echoes the mark sent after its audio, so that the user speaking
+        afterwards is not taken for a barge-in. Marks sent before more audio, or cleared, are ignored.
+        """
+        if mark is None or mark != stream.pending_mark:
+            return
+        logger.debug(f"Twilio played turn {stream.playing_trace.turn_id}")
+        stream.playing_trace.finish()
+        stream.playing_trace = None
+        stream.pending_mark = None
+
     def start_server(self):
         """Start the FastAPI server in a separate thread."""
 
@@ -394,6 +592,9 @@ class TwilioHandler:
             logger.info("Stop event detected, terminating call...")
             self.terminate_call()
 
+        if self.session_manager is not None:
+            self.session_manager.stop()
+
         logger.info("Twilio handler stopped")
 
     def stop(self):
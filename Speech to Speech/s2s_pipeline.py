@@ -2,8 +2,8 @@ import logging
 import os
 import sys
 from copy import copy
+from functools import partial
 from pathlib import Path
-from queue import Queue
 from threading import Event
 from typing import Optional
 from sys import platform
@@ -35,8 +35,14 @@ from transformers import (
 from arguments_classes.elevenlabs_stt_arguments import ElevenLabsSTTHandlerArguments
 from arguments_classes.elevenlabs_tts_arguments import ElevenLabsTTSHandlerArguments
 from arguments_classes.twilio_arguments import TwilioHandlerArguments
+from arguments_classes.queue_arguments import QueueArguments
 
 
+from utils.bounded_queue import BoundedQueue, ProcessQueue
+from utils.metrics import metrics, serve_metrics
+from utils.process_manager import ProcessHandler, ProcessManager, mp_context
+from utils.ring_buffer import AudioRingBuffer
+from utils.session_manager import SessionManager
 from utils.thread_manager import ThreadManager
 
 # Ensure that the necessary NLTK resources are available
@@ -95,6 +101,7 @@ def parse_arguments():
             ElevenLabsSTTHandlerArguments,
             ElevenLabsTTSHandlerArguments,
             TwilioHandlerArguments,
+            QueueArguments,
         )
     )
 
@@ -220,15 +227,44 @@ def prepare_all_args(
     rename_args(twilio_handler_kwargs, "twilio")
 
 
-def initialize_queues_and_events():
+def initialize_queues_and_events(queue_kwargs=None, multiprocess=False, sample_rate=16000):
+    """
+    Creates the queues linking the stages of the pipeline and its events.
+    With `multiprocess`, they can be shared with stages running in worker processes.
+    `sample_rate` is the rate of the audio received for the VAD.
+    """
+
+    def make_queue(name):
+        queue_args = {}
+        if queue_kwargs is not None:
+            queue_args = {
+                "maxsize": getattr(queue_kwargs, f"{name}_maxsize"),
+                "policy": getattr(queue_kwargs, f"{name}_policy"),
+            }
+        if multiprocess:
+            return ProcessQueue(mp_context, name=name, **queue_args)
+        return BoundedQueue(name=name, **queue_args)
+
+    def make_recv_queue():
+        if queue_kwargs is None or not queue_kwargs.recv_audio_ring_buffer_ms:
+            return make_queue("recv_audio_chunks_queue")
+        # silero reads windows of 512 samples at 16 kHz, 256 at 8 kHz
+        return AudioRingBuffer(
+            capacity=queue_kwargs.recv_audio_ring_buffer_ms * sample_rate // 1000,
+            window_size=512 if sample_rate == 16000 else 256,
+            context=mp_context if multiprocess else None,
+            name="recv_audio_chunks_queue",
+        )
+
+    make_event = mp_context.Event if multiprocess else Event
     return {
-        "stop_event": Event(),
-        "should_listen": Event(),
-        "recv_audio_chunks_queue": Queue(),
-        "send_audio_chunks_queue": Queue(),
-        "spoken_prompt_queue": Queue(),
-        "text_prompt_queue": Queue(),
-        "lm_response_queue": Queue(),
+        "stop_event": make_event(),
+        "should_listen": make_event(),
+        "recv_audio_chunks_queue": make_recv_queue(),
+        "send_audio_chunks_queue": make_queue("send_audio_chunks_queue"),
+        "spoken_prompt_queue": make_queue("spoken_prompt_queue"),
+        "text_prompt_queue": make_queue("text_prompt_queue"),
+        "lm_response_queue": make_queue("lm_response_queue"),
     }
 
 
@@ -251,7 +287,33 @@ def build_pipeline(
     elevenlabs_stt_handler_kwargs, 
     elevenlabs_tts_handler_kwargs,
     twilio_handler_kwargs,
+    queue_kwargs=None,
 ):
+    process_stages = parse_process_stages(module_kwargs.process_stages)
+    if process_stages and vad_handler_kwargs.speculative:
+        # speculative turns are committed by the VAD on traces that stages in other processes only hold copies of
+        raise ValueError("Speculative endpointing is not supported with --process_stages.")
+    if process_stages and vad_handler_kwargs.barge_in:
+        # same for barge-in: the VAD cancels its own trace, the copies held by the other processes are never cancelled
+        raise ValueError("Barge-in is not supported with --process_stages.")
+    if vad_handler_kwargs.partial_interval_ms and module_kwargs.stt != "whisper":
+        raise ValueError("Partial transcription is only supported by the 'whisper' STT.")
+    opener = module_kwargs.opener or module_kwargs.opener_text is not None
+    if opener and module_kwargs.mode != "twilio":
+        raise ValueError("The call opener is only supported in 'twilio' mode.")
+    if opener and module_kwargs.tts == "elevenlabs" and getattr(elevenlabs_tts_handler_kwargs, "websocket", False):
+        # the WebSocket relays its audio to the output queue of a running session, not to the caller of `process`
+        raise ValueError("The call opener is not supported with --elevenlabs_tts_websocket.")
+    if opener and process_stages & {"llm", "tts"}:
+        # the opener is rendered by the LLM and TTS handlers of this process
+        raise ValueError("The call opener is not supported with the llm or tts stage in --process_stages.")
+    if vad_handler_kwargs.sample_rate != 16000 and module_kwargs.mode != "twilio":
+        # only telephony audio arrives at 8 kHz, the other connections send 16 kHz
+        raise ValueError("A VAD sample rate other than 16000 is only supported in 'twilio' mode.")
+
+    def factory(stage):
+        return ProcessHandler if stage in process_stages else instantiate
+
     stop_event = queues_and_events["stop_event"]
     should_listen = queues_and_events["should_listen"]
     recv_audio_chunks_queue = queues_and_events["recv_audio_chunks_queue"]
@@ -259,11 +321,58 @@ def build_pipeline(
     spoken_prompt_queue = queues_and_events["spoken_prompt_queue"]
     text_prompt_queue = queues_and_events["text_prompt_queue"]
     lm_response_queue = queues_and_events["lm_response_queue"]
+
+    vad = factory("vad")(
+        VADHandler,
+        stop_event,
+        queue_in=recv_audio_chunks_queue,
+        queue_out=spoken_prompt_queue,
+        setup_args=(should_listen,),
+        setup_kwargs=vars(vad_handler_kwargs),
+    )
+
+    stt = get_stt_handler(module_kwargs, stop_event, spoken_prompt_queue, text_prompt_queue, whisper_stt_handler_kwargs, faster_whisper_stt_handler_kwargs, paraformer_stt_handler_kwargs, elevenlabs_stt_handler_kwargs, factory=factory("stt"))
+    if module_kwargs.tts == "elevenlabs" and getattr(elevenlabs_tts_handler_kwargs, "websocket", False):
+        # the WebSocket synthesizes text as it comes, it is sent the reply word by word rather than by sentence
+        llm_handler_kwargs = {
+            "transformers": language_model_handler_kwargs,
+            "open_api": open_api_language_model_handler_kwargs,
+            "mlx-lm": mlx_language_model_handler_kwargs,
+        }.get(module_kwargs.llm)
+        if llm_handler_kwargs is not None:
+            llm_handler_kwargs.stream_deltas = True
+    lm = get_llm_handler(module_kwargs, stop_event, text_prompt_queue, lm_response_queue, language_model_handler_kwargs, open_api_language_model_handler_kwargs, mlx_language_model_handler_kwargs, factory=factory("llm"))
+    tts = get_tts_handler(module_kwargs, stop_event, lm_response_queue, send_audio_chunks_queue, should_listen, parler_tts_handler_kwargs, melo_tts_handler_kwargs, chat_tts_handler_kwargs, facebook_mms_tts_handler_kwargs, elevenlabs_tts_handler_kwargs, factory=factory("tts"))
+
+    opener_audio = None
+    if opener:
+        from utils.opener import render_opener
+
+        opener_audio = render_opener(
+            lm, tts, text=module_kwargs.opener_text, prompt=module_kwargs.opener_prompt
+        )
+
+    session_manager = None
+    if module_kwargs.max_sessions > 1:
+        if module_kwargs.mode != "twilio":
+            raise ValueError("Running multiple sessions is only supported in 'twilio' mode.")
+        if process_stages:
+            raise ValueError("Running multiple sessions is not supported with --process_stages.")
+        # the handlers above only serve as prototypes, each media stream runs forks of them
+        session_manager = SessionManager(
+            vad,
+            stt,
+            lm,
+            tts,
+            partial(initialize_queues_and_events, queue_kwargs, sample_rate=vad_handler_kwargs.sample_rate),
+            max_sessions=module_kwargs.max_sessions,
+        )
+
     if module_kwargs.mode == "local":
         from connections.local_audio_streamer import LocalAudioStreamer
 
         local_audio_streamer = LocalAudioStreamer(
-            input_queue=recv_audio_chunks_queue, output_queue=send_audio_chunks_queue
+            input_queue=recv_audio_chunks_queue, output_queue=send_audio_chunks_queue, should_listen=should_listen
         )
         comms_handlers = [local_audio_streamer]
         should_listen.set()
@@ -282,6 +391,9 @@ def build_pipeline(
                 port=twilio_handler_kwargs.port,
                 user_number=twilio_handler_kwargs.user_number,
                 domain=twilio_handler_kwargs.domain,
+                session_manager=session_manager,
+                inbound_sample_rate=vad_handler_kwargs.sample_rate,
+                opener_audio=opener_audio,
             )
         ]
     else:
@@ -305,32 +417,48 @@ def build_pipeline(
             ),
         ]
 
-    vad = VADHandler(
-        stop_event,
-        queue_in=recv_audio_chunks_queue,
-        queue_out=spoken_prompt_queue,
-        setup_args=(should_listen,),
-        setup_kwargs=vars(vad_handler_kwargs),
-    )
+    if session_manager is not None:
+        return ThreadManager(comms_handlers)
 
-    stt = get_stt_handler(module_kwargs, stop_event, spoken_prompt_queue, text_prompt_queue, whisper_stt_handler_kwargs, faster_whisper_stt_handler_kwargs, paraformer_stt_handler_kwargs, elevenlabs_stt_handler_kwargs)
-    lm = get_llm_handler(module_kwargs, stop_event, text_prompt_queue, lm_response_queue, language_model_handler_kwargs, open_api_language_model_handler_kwargs, mlx_language_model_handler_kwargs)
-    tts = get_tts_handler(module_kwargs, stop_event, lm_response_queue, send_audio_chunks_queue, should_listen, parler_tts_handler_kwargs, melo_tts_handler_kwargs, chat_tts_handler_kwargs, facebook_mms_tts_handler_kwargs, elevenlabs_tts_handler_kwargs)
+    if process_stages:
+        return ProcessManager([*comms_handlers, vad, stt, lm, tts], log_level=module_kwargs.log_level)
 
     return ThreadManager([*comms_handlers, vad, stt, lm, tts])
 
 
-def get_stt_handler(module_kwargs, stop_event, spoken_prompt_queue, text_prompt_queue, whisper_stt_handler_kwargs, faster_whisper_stt_handler_kwargs, paraformer_stt_handler_kwargs, elevenlabs_stt_handler_kwargs):
+PIPELINE_STAGES = ("vad", "stt", "llm", "tts")
+
+
+def parse_process_stages(process_stages):
+    if not process_stages:
+        return set()
+    stages = {stage.strip() for stage in process_stages.split(",") if stage.strip()}
+    unknown = stages - set(PIPELINE_STAGES)
+    if unknown:
+        raise ValueError(
+            f"Unknown stages {', '.join(sorted(unknown))} in --process_stages, expected some of {', '.join(PIPELINE_STAGES)}."
+        )
+    return stages
+
+
+def instantiate(cls, *args, **kwargs):
+    """Default handler factory, building the handler in the current process."""
+    return cls(*args, **kwargs)
+
+
+def get_stt_handler(module_kwargs, stop_event, spoken_prompt_queue, text_prompt_queue, whisper_stt_handler_kwargs, faster_whisper_stt_handler_kwargs, paraformer_stt_handler_kwargs, elevenlabs_stt_handler_kwargs, factory=instantiate):
     if module_kwargs.stt == "moonshine":
         from STT.moonshine_handler import MoonshineSTTHandler
-        return MoonshineSTTHandler(
+        return factory(
+            MoonshineSTTHandler,
             stop_event,
             queue_in=spoken_prompt_queue,
             queue_out=text_prompt_queue,
         )
     if module_kwargs.stt == "whisper":
         from STT.whisper_stt_handler import WhisperSTTHandler
-        return WhisperSTTHandler(
+        return factory(
+            WhisperSTTHandler,
             stop_event,
             queue_in=spoken_prompt_queue,
             queue_out=text_prompt_queue,
@@ -338,7 +466,8 @@ def get_stt_handler(module_kwargs, stop_event, spoken_prompt_queue, text_prompt_
         )
     elif module_kwargs.stt == "whisper-mlx":
         from STT.lightning_whisper_mlx_handler import LightningWhisperSTTHandler
-        return LightningWhisperSTTHandler(
+        return factory(
+            LightningWhisperSTTHandler,
             stop_event,
             queue_in=spoken_prompt_queue,
             queue_out=text_prompt_queue,
@@ -346,7 +475,8 @@ def get_stt_handler(module_kwargs, stop_event, spoken_prompt_queue, text_prompt_
         )
     elif module_kwargs.stt == "paraformer":
         from STT.paraformer_handler import ParaformerSTTHandler
-        return ParaformerSTTHandler(
+        return factory(
+            ParaformerSTTHandler,
             stop_event,
             queue_in=spoken_prompt_queue,
             queue_out=text_prompt_queue,
@@ -355,7 +485,8 @@ def get_stt_handler(module_kwargs, stop_event, spoken_prompt_queue, text_prompt_
     elif module_kwargs.stt == "faster-whisper":
         from STT.faster_whisper_handler import FasterWhisperSTTHandler
 
-        return FasterWhisperSTTHandler(
+        return factory(
+            FasterWhisperSTTHandler,
             stop_event,
             queue_in=spoken_prompt_queue,
             queue_out=text_prompt_queue,
@@ -363,7 +494,8 @@ def get_stt_handler(module_kwargs, stop_event, spoken_prompt_queue, text_prompt_
         )
     elif module_kwargs.stt == "elevenlabs":  # ← NEW
         from STT.elevenlabs_stt_handler import ElevenLabsSTTHandler
-        return ElevenLabsSTTHandler(
+        return factory(
+            ElevenLabsSTTHandler,
             stop_event,
             queue_in=spoken_prompt_queue,
             queue_out=text_prompt_queue,
@@ -380,11 +512,13 @@ def get_llm_handler(
     lm_response_queue, 
     language_model_handler_kwargs,
     open_api_language_model_handler_kwargs,
-    mlx_language_model_handler_kwargs
+    mlx_language_model_handler_kwargs,
+    factory=instantiate,
 ):
     if module_kwargs.llm == "transformers":
         from LLM.language_model import LanguageModelHandler
-        return LanguageModelHandler(
+        return factory(
+            LanguageModelHandler,
             stop_event,
             queue_in=text_prompt_queue,
             queue_out=lm_response_queue,
@@ -392,7 +526,8 @@ def get_llm_handler(
         )
     elif module_kwargs.llm == "open_api":
         from LLM.openai_api_language_model import OpenApiModelHandler
-        return OpenApiModelHandler(
+        return factory(
+            OpenApiModelHandler,
             stop_event,
             queue_in=text_prompt_queue,
             queue_out=lm_response_queue,
@@ -401,7 +536,8 @@ def get_llm_handler(
 
     elif module_kwargs.llm == "mlx-lm":
         from LLM.mlx_language_model import MLXLanguageModelHandler
-        return MLXLanguageModelHandler(
+        return factory(
+            MLXLanguageModelHandler,
             stop_event,
             queue_in=text_prompt_queue,
             queue_out=lm_response_queue,
@@ -412,10 +548,11 @@ def get_llm_handler(
         raise ValueError("The LLM should be either transformers or mlx-lm")
 
 
-def get_tts_handler(module_kwargs, stop_event, lm_response_queue, send_audio_chunks_queue, should_listen, parler_tts_handler_kwargs, melo_tts_handler_kwargs, chat_tts_handler_kwargs, facebook_mms_tts_handler_kwargs, elevenlabs_tts_handler_kwargs):
+def get_tts_handler(module_kwargs, stop_event, lm_response_queue, send_audio_chunks_queue, should_listen, parler_tts_handler_kwargs, melo_tts_handler_kwargs, chat_tts_handler_kwargs, facebook_mms_tts_handler_kwargs, elevenlabs_tts_handler_kwargs, factory=instantiate):
     if module_kwargs.tts == "parler":
         from TTS.parler_handler import ParlerTTSHandler
-        return ParlerTTSHandler(
+        return factory(
+            ParlerTTSHandler,
             stop_event,
             queue_in=lm_response_queue,
             queue_out=send_audio_chunks_queue,
@@ -430,7 +567,8 @@ def get_tts_handler(module_kwargs, stop_event, lm_response_queue, send_audio_chu
                 "Error importing MeloTTSHandler. You might need to run: python -m unidic download"
             )
             raise e
-        return MeloTTSHandler(
+        return factory(
+            MeloTTSHandler,
             stop_event,
             queue_in=lm_response_queue,
             queue_out=send_audio_chunks_queue,
@@ -443,7 +581,8 @@ def get_tts_handler(module_kwargs, stop_event, lm_response_queue, send_audio_chu
         except RuntimeError as e:
             logger.error("Error importing ChatTTSHandler")
             raise e
-        return ChatTTSHandler(
+        return factory(
+            ChatTTSHandler,
             stop_event,
             queue_in=lm_response_queue,
             queue_out=send_audio_chunks_queue,
@@ -452,7 +591,8 @@ def get_tts_handler(module_kwargs, stop_event, lm_response_queue, send_audio_chu
         )
     elif module_kwargs.tts == "facebookMMS":
         from TTS.facebookmms_handler import FacebookMMSTTSHandler
-        return FacebookMMSTTSHandler(
+        return factory(
+            FacebookMMSTTSHandler,
             stop_event,
             queue_in=lm_response_queue,
             queue_out=send_audio_chunks_queue,
@@ -465,7 +605,8 @@ def get_tts_handler(module_kwargs, stop_event, lm_response_queue, send_audio_chu
         except Exception as e:
             logger.error("Error importing ElevenLabsTTSHandler")
             raise e
-        return ElevenLabsTTSHandler(
+        return factory(
+            ElevenLabsTTSHandler,
             stop_event,
             queue_in=lm_response_queue,
             queue_out=send_audio_chunks_queue,
@@ -495,6 +636,7 @@ def main():
         elevenlabs_stt_handler_kwargs, 
         elevenlabs_tts_handler_kwargs,
         twilio_handler_kwargs,
+        queue_kwargs,
     ) = parse_arguments()
 
     setup_logger(module_kwargs.log_level)
@@ -516,7 +658,14 @@ def main():
         twilio_handler_kwargs,
     )
 
-    queues_and_events = initialize_queues_and_events()
+    queues_and_events = initialize_queues_and_events(
+        queue_kwargs,
+        multiprocess=bool(module_kwargs.process_stages),
+        sample_rate=vad_handler_kwargs.sample_rate,
+    )
+    metrics.register_queues(None, queues_and_events)
+    if module_kwargs.metrics_port:
+        serve_metrics(module_kwargs.metrics_port)
 
     pipeline_manager = build_pipeline(
         module_kwargs,
@@ -537,6 +686,7 @@ def main():
         elevenlabs_stt_handler_kwargs,    # ← add
         elevenlabs_tts_handler_kwargs,
         twilio_handler_kwargs,
+        queue_kwargs,
     )
 
     try:
@@ -0,0 +1,279 @@
+"""
+Audio conversions of the pipeline with NumPy, in place of `audioop` (removed in Python 3.13):
+- G.711 mu-law encoding and decoding through lookup tables, bit-exact with `audioop.lin2ulaw`/`audioop.ulaw2lin`
+- int16 and float32 conversions
+- `StreamingResampler`, a polyphase resampler carrying its state from one chunk to the next, which also decodes
+  mu-law in the same pass (`process_ulaw`)
+- `FrameBuilder`, cutting a stream of samples in frames of a fixed size, padded only at the end of the stream
+
+`benchmarks/audio_codecs.py` compares them with `audioop` on Twilio packets.
+"""
+
+from math import gcd
+
+import numpy as np
+
+
+def _ulaw_decode_table():
+    ulaw = ~np.arange(256, dtype=np.uint8)
+    exponent = (ulaw >> 4) & 0x07
+    mantissa = (ulaw & 0x0F).astype(np.int32)
+    magnitude = (((mantissa << 3) + 0x84) << exponent) - 0x84
+    return np.where(ulaw & 0x80, -magnitude, magnitude).astype(np.int16)
+
+
+def _ulaw_encode_table():
+    # indexed by the int16 sample viewed as uint16
+    pcm = np.arange(65536, dtype=np.uint16).view(np.int16).astype(np.int32) >> 2
+    mask = np.where(pcm < 0, 0x7F, 0xFF)
+    magnitude = np.minimum(np.abs(pcm), 8159) + 0x21
+    segment = np.searchsorted(np.array([0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF, 0x1FFF]), magnitude)
+    ulaw = np.where(
+        segment >= 8,
+        0x7F,
+        (np.minimum(segment, 7) << 4) | ((magnitude >> (np.minimum(segment, 7) + 1)) & 0x0F),
+    )
+    return (ulaw ^ mask).astype(np.uint8)
+
+
+ULAW_TO_PCM16 = _ulaw_decode_table()
+ULAW_TO_FLOAT32 = (ULAW_TO_PCM16 / 32768).astype(np.float32)
+PCM16_TO_ULAW = _ulaw_encode_table()
+
+
+def ulaw_to_pcm16(data):
+    """Decodes mu-law bytes to int16 samples."""
+    return ULAW_TO_PCM16[np.frombuffer(data, dtype=np.uint8)]
+
+
+def ulaw_to_float32(data):
+    """Decodes mu-law bytes straight to float32 samples in [-1, 1)."""
+    return ULAW_TO_FLOAT32[np.frombuffer(data, dtype=np.uint8)]
+
+
+def pcm16_to_ulaw(pcm):
+    """Encodes int16 samples, an array or little-endian bytes, to mu-law bytes."""
+    if not isinstance(pcm, np.ndarray):
+        pcm = np.frombuffer(pcm, dtype=np.int16)
+    return PCM16_TO_ULAW[pcm.view(np.uint16)].tobytes()
+
+
+def pcm16_to_float32(pcm, out=None):
+    """Converts int16 samples, an array or little-endian bytes, to float32 samples in [-1, 1)."""
+    if not isinstance(pcm, np.ndarray):
+        pcm = np.frombuffer(pcm, dtype=np.int16)
+    return np.multiply(pcm, 1 / 32768, out=out, dtype=np.float32, casting="unsafe")
+
+
+def float32_to_pcm16(audio, out=None):
+    """Converts float32 samples to int16, clipping those out of [-1, 1)."""
+    if out is None:
+        out = np.empty(len(audio), dtype=np.int16)
+    scaled = np.multiply(audio, 32768, dtype=np.float32)
+    np.clip(scaled, -32768, 32767, out=scaled)
+    np.rint(scaled, out=scaled)
+    out[...] = scaled
+    return out
+
+
+# above this number of phases, e.g. 44.1 kHz to 16 kHz, the outputs are computed at once rather than per phase
+MAX_CORRELATED_PHASES = 8
+
+
+class StreamingResampler:
+    """
+    Polyphase resampler of a stream cut in chunks of any size, from `orig_sr` to `target_sr`.
+    The low-pass filter, a Kaiser-windowed sinc with `half_width` zero crossings on each side at the lower of the
+    two rates, is computed once and split in its `up` phases. The last input samples and the position of the next
+    output are carried between calls, so the output does not depend on how the input is chunked.
+    Output sample n is aligned on input time n * orig_sr / target_sr: the delay of the filter is compensated,
+    and `flush` returns the outputs it still holds back at the end of the stream.
+    The input is written after the carried samples in a work buffer that only grows, so that a chunk is not copied
+    into a new array; `process_ulaw` decodes mu-law bytes straight into it.
+    """
+
+    def __init__(self, orig_sr, target_sr, half_width=8, rolloff=0.945, beta=8.6):
+        divisor = gcd(orig_sr, target_sr)
+        self.orig_sr = orig_sr
+        self.target_sr = target_sr
+        self.up = target_sr // divisor
+        self.down = orig_sr // divisor
+
+        # the filter runs at orig_sr * up, cutting at the Nyquist frequency of the lower rate
+        spacing = max(self.up, self.down)
+        n_taps = 2 * half_width * spacing + 1
+        center = (n_taps - 1) / 2
+        t = (np.arange(n_taps) - center) * rolloff / spacing
+        h = rolloff / spacing * np.sinc(t) * np.kaiser(n_taps, beta) * self.up
+        # pad to a whole number of taps per phase
+        self.taps = -(-n_taps // self.up)
+        h = np.concatenate([h, np.zeros(self.taps * self.up - n_taps)])
+        # phases[p, k] = h[p + k * up], reversed along k to be applied to input windows in time order
+        self.phases = np.ascontiguousarray(h.reshape(self.taps, self.up).T[:, ::-1]).astype(np.float32)
+        self.delay = int(center)
+        # the last taps - 1 input samples, carried to the next chunk, then the chunk
+        self.work = np.zeros(self.taps - 1, dtype=np.float32)
+        self.reset()
+
+    def reset(self):
+        self.work[: self.taps - 1] = 0
+        # number of input samples received
+        self.consumed = 0
+        # position of the next output, in samples at orig_sr * up, delayed by the filter
+        self.position = self.delay
+
+    def process(self, audio):
+        """Resamples the next chunk of the stream, float32 samples. Returns the outputs it completes."""
+        audio = np.asarray(audio).reshape(-1)
+        buffer = self._buffer(len(audio))
+        buffer[self.taps - 1 :] = audio
+        return self._resample(buffer)
+
+    def process_ulaw(self, data):
+        """
+        Decodes the next chunk of the stream, mu-law bytes, and resamples it. The lookup table writes the float32
+        samples in the work buffer, there is no intermediate decoded array.
+        """
+        codes = np.frombuffer(data, dtype=np.uint8)
+        buffer = self._buffer(len(codes))
+        np.take(ULAW_TO_FLOAT32, codes, out=buffer[self.taps - 1 :])
+        return self._resample(buffer)
+
+    def _buffer(self, n_samples):
+        """The work buffer holding the carried samples followed by room for `n_samples` new ones."""
+        size = self.taps - 1 + n_samples
+        if len(self.work) < size:
+            work = np.empty(max(size, 2 * len(self.work)), dtype=np.float32)
+            work[: self.taps - 1] = self.work[: self.taps - 1]
+            self.work = work
+        return self.work[:size]
+
+    def _resample(self, buffer):
+        n_samples = len(buffer) - (self.taps - 1)
+        # absolute index of buffer[0]
+        start = self.consumed - (self.taps - 1)
+        self.consumed += n_samples
+
+        end = self.consumed * self.up
+        n_outputs = max(0, -(-(end - self.position) // self.down))
+        positions = self.position + np.arange(n_outputs) * self.down
+        self.position += n_outputs * self.down
+
+        if n_outputs == 0:
+            # an empty or short chunk: no window to compute, but its samples are still carried
+            self.work[: self.taps - 1] = buffer[len(buffer) - (self.taps - 1) :]
+            return np.empty(0, dtype=np.float32)
+        if self.up <= MAX_CORRELATED_PHASES:
+            output = self._correlate(buffer, start, positions)
+        else:
+            # the window of output n ends at input positions[n] // up
+            last = positions // self.up - start
+            windows = np.lib.stride_tricks.sliding_window_view(buffer, self.taps)
+            output = np.einsum("nk,nk->n", windows[last - self.taps + 1], self.phases[positions % self.up])
+
+        # carried to the next chunk, numpy copies overlapping ranges safely
+        self.work[: self.taps - 1] = buffer[len(buffer) - (self.taps - 1) :]
+        return output.astype(np.float32, copy=False)
+
+    def _correlate(self, buffer, start, positions):
+        """
+        Every `up`-th output uses the same phase, on windows `down` samples apart: they are computed by a single
+        correlation of the buffer with that phase.
+        """
+        output = np.empty(len(positions), dtype=np.float32)
+        for first in range(min(self.up, len(positions))):
+            position = positions[first]
+            window_start = position // self.up - start - self.taps + 1
+            count = len(positions[first :: self.up])
+            segment = buffer[window_start : window_start + (count - 1) * self.down + self.taps]
+            output[first :: self.up] = np.correlate(segment, self.phases[position % self.up])[:: self.down]
+        return output
+
+    def flush(self):
+        """Returns the outputs held back by the delay of the filter, and resets the stream."""
+        n_outputs = -(-(self.consumed * self.up - (self.position - self.delay)) // self.down)
+        output = self.process(np.zeros(-(-self.delay // self.up) + 1, dtype=np.float32))[:n_outputs]
+        self.reset()
+        return output
+
+    def stream(self, chunks):
+        """Resamples an iterable of chunks as a new stream, the held back outputs are yielded last."""
+        self.reset()
+        for chunk in chunks:
+            yield self.process(chunk)
+        yield self.flush()
+
+    def process_all(self, audio):
+        """Resamples a whole signal as a stream of its own, reusing the filter."""
+        self.reset()
+        return np.concatenate([self.process(audio), self.flush()])
+
+
+class FrameBuilder:
+    """
+    Cuts a stream of int16 samples, arrays or little-endian bytes in chunks of any size, in frames of exactly
+    `frame_size` samples. The samples that do not fill a frame, and an odd byte, are carried over to the next chunk
+    instead of being padded, so that silence is only inserted once, by `flush` at the end of the stream.
+    Frames lying within a chunk are yielded as views of it; a frame straddling two chunks is assembled in a buffer
+    allocated once, and copied out since the frames are queued.
+    """
+
+    def __init__(self, frame_size=512):
+        self.frame_size = frame_size
+        self.pending = np.zeros(frame_size, dtype=np.int16)
+        self.reset()
+
+    def reset(self):
+        # number of samples in `pending`, and the odd byte of the last bytes chunk
+        self.filled = 0
+        self.odd_byte = b""
+
+    def push(self, chunk):
+        """Yields the frames completed by the next chunk of the stream."""
+        if not isinstance(chunk, np.ndarray):
+            chunk = self.odd_byte + bytes(chunk)
+            usable_len = len(chunk) // 2 * 2
+            self.odd_byte = chunk[usable_len:]
+            chunk = np.frombuffer(chunk[:usable_len], dtype="<i2")
+        start = 0
+        if self.filled:
+            start = min(self.frame_size - self.filled, len(chunk))
+            self.pending[self.filled : self.filled + start] = chunk[:start]
+            self.filled += start
+            if self.filled < self.frame_size:
+                return
+            self.filled = 0
+            yield self.pending.copy()
+        end = start + (len(chunk) - start) // self.frame_size * self.frame_size
+        for i in range(start, end, self.frame_size):
+            yield chunk[i : i + self.frame_size]
+        self.filled = len(chunk) - end
+        self.pending[: self.filled] = chunk[end:]
+
+    def flush(self):
+        """Yields the carried samples padded with silence to a frame, if any, and resets the stream."""
+        if self.filled:
+            self.pending[self.filled :] = 0
+            yield self.pending.copy()
+        self.reset()
+
+    def stream(self, chunks):
+        """Frames an iterable of chunks as a new stream, the padded tail is yielded last."""
+        self.reset()
+        for chunk in chunks:
+            yield from self.push(chunk)
+        yield from self.flush()
+
+
+def split_frames(audio, frame_size):
+    """Yields `audio`, int16 samples or little-endian bytes, in frames of `frame_size` samples, the last one padded with silence."""
+    frames = FrameBuilder(frame_size)
+    yield from frames.push(audio)
+    yield from frames.flush()
+
+
+def resample(audio, orig_sr, target_sr):
+    """Resamples a whole signal, float32 samples, with a StreamingResampler."""
+    if orig_sr == target_sr:
+        return np.asarray(audio, dtype=np.float32)
+    return StreamingResampler(orig_sr, target_sr).process_all(audio)
@@ -0,0 +1,272 @@
+import asyncio
+import logging
+from collections import deque
+from queue import Empty, Full, Queue
+
+from utils.turn_trace import TracedItem
+
+logger = logging.getLogger(__name__)
+
+QUEUE_POLICIES = ("block", "drop_oldest", "coalesce")
+
+
+def is_end(item):
+    return isinstance(item, bytes) and item == b"END"
+
+
+def coalesce_items(first, second):
+    """
+    Merges two text items of the pipeline, either plain strings or (text, language_code) tuples.
+    Traced items are only merged within a turn, they keep the `final` flag of the newest one.
+    Returns None when the items cannot be merged.
+    """
+    if isinstance(first, TracedItem) and isinstance(second, TracedItem):
+        if first.trace is not second.trace:
+            # the text of a cancelled or earlier turn must not leak into the next one
+            return None
+        payload = coalesce_items(first.payload, second.payload)
+        return None if payload is None else TracedItem(payload, second.trace, second.final)
+    if isinstance(first, str) and isinstance(second, str):
+        return f"{first} {second}"
+    if (
+        isinstance(first, tuple)
+        and isinstance(second, tuple)
+        and len(first) == len(second) == 2
+        and isinstance(first[0], str)
+        and isinstance(second[0], str)
+        and first[1] == second[1]
+    ):
+        return (f"{first[0]} {second[0]}", first[1])
+    return None
+
+
+class BoundedQueue(Queue):
+    """
+    Queue with a maximum size and a policy applied when a put finds it full:
+    - "block": wait for a free slot, like queue.Queue
+    - "drop_oldest": discard the oldest item, for real-time audio where late data is useless
+    - "coalesce": merge the new item into the newest queued one, for text. Blocks if they cannot be merged.
+    A maxsize of 0 means unbounded. The b"END" sentinel is never dropped nor merged.
+    Depth and drop counters are available through `stats`.
+    `async_get` and `async_put` let coroutines use the queue along with threads, without holding a thread while they wait.
+    """
+
+    def __init__(self, maxsize=0, policy="block", name=None):
+        if policy not in QUEUE_POLICIES:
+            raise ValueError(
+                f"The queue policy should be one of {', '.join(QUEUE_POLICIES)}, got '{policy}'."
+            )
+        super().__init__(maxsize)
+        self.policy = policy
+        self.name = name
+        self.puts = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.max_depth = 0
+        # futures of the coroutines waiting for an item, or for a free slot
+        self._async_getters = deque()
+        self._async_putters = deque()
+
+    def put(self, item, block=True, timeout=None):
+        if self.maxsize > 0 and self.policy != "block" and not is_end(item):
+            with self.not_full:
+                if self._qsize() >= self.maxsize:
+                    if self.policy == "drop_oldest" and self._drop_oldest():
+                        self._put(item)
+                        self.unfinished_tasks += 1
+                        self.not_empty.notify()
+                        return
+                    if self.policy == "coalesce" and self._coalesce(item):
+                        return
+        super().put(item, block, timeout)
+
+    def _put(self, item):
+        super()._put(item)
+        self.puts += 1
+        self.max_depth = max(self.max_depth, self._qsize())
+        _wake_one(self._async_getters)
+
+    def _get(self):
+        item = super()._get()
+        _wake_one(self._async_putters)
+        return item
+
+    async def async_get(self):
+        while True:
+            with self.mutex:
+                if self._qsize():
+                    item = self._get()
+                    self.not_full.notify()
+                    return item
+                waiter = asyncio.get_running_loop().create_future()
+                self._async_getters.append(waiter)
+            await waiter
+
+    async def async_put(self, item):
+        while True:
+            try:
+                # drop_oldest and coalesce make room themselves
+                self.put(item, block=False)
+                return
+            except Full:
+                with self.mutex:
+                    if self.maxsize > 0 and self._qsize() >= self.maxsize:
+                        waiter = asyncio.get_running_loop().create_future()
+                        self._async_putters.append(waiter)
+                    else:
+                        continue
+                await waiter
+
+    def _drop_oldest(self):
+        if not self.queue or is_end(self.queue[0]):
+            return False
+        self.queue.popleft()
+        # the dropped item will never be marked as done
+        self.unfinished_tasks -= 1
+        self.dropped += 1
+        if self.dropped == 1 or self.dropped % 100 == 0:
+            logger.warning(f"Queue {self.name} is full, {self.dropped} items dropped so far")
+        return True
+
+    def _coalesce(self, item):
+        if not self.queue:
+            return False
+        merged = coalesce_items(self.queue[-1], item)
+        if merged is None:
+            return False
+        self.queue[-1] = merged
+        self.coalesced += 1
+        return True
+
+    def stats(self):
+        with self.mutex:
+            return {
+                "depth": self._qsize(),
+                "max_depth": self.max_depth,
+                "maxsize": self.maxsize,
+                "policy": self.policy,
+                "puts": self.puts,
+                "dropped": self.dropped,
+                "coalesced": self.coalesced,
+            }
+
+
+class ProcessQueue:
+    """
+    Queue shared between processes, for the links of a pipeline whose stages run in worker processes
+    (see `utils.process_manager`). It wraps a multiprocessing queue and offers the BoundedQueue interface:
+    the "drop_oldest" policy is applied on put, while "coalesce" cannot reach items already sent to another process
+    and falls back to "block". Counters only cover the puts made from the current process.
+    """
+
+    def __init__(self, context, maxsize=0, policy="block", name=None):
+        if policy not in QUEUE_POLICIES:
+            raise ValueError(
+                f"The queue policy should be one of {', '.join(QUEUE_POLICIES)}, got '{policy}'."
+            )
+        if policy == "coalesce":
+            logger.warning(f"Queue {name} is shared between processes, 'coalesce' falls back to 'block'")
+        self.queue = context.Queue(maxsize)
+        self.maxsize = maxsize
+        self.policy = policy
+        self.name = name
+        self.puts = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.max_depth = 0
+
+    def put(self, item, block=True, timeout=None):
+        if self.maxsize > 0 and self.policy == "drop_oldest" and not is_end(item):
+            while True:
+                try:
+                    self.queue.put_nowait(item)
+                    break
+                except Full:
+                    self._drop_oldest()
+        else:
+            self.queue.put(item, block, timeout)
+        self.puts += 1
+        self.max_depth = max(self.max_depth, self.qsize())
+
+    def _drop_oldest(self):
+        try:
+            item = self.queue.get_nowait()
+        except Empty:
+            return
+        if is_end(item):
+            # never drop the sentinel, put it back behind the new items
+            self.queue.put(item)
+            return
+        self.dropped += 1
+        if self.dropped == 1 or self.dropped % 100 == 0:
+            logger.warning(f"Queue {self.name} is full, {self.dropped} items dropped so far")
+
+    def put_nowait(self, item):
+        self.put(item, block=False)
+
+    def get(self, block=True, timeout=None):
+        return self.queue.get(block, timeout)
+
+    def get_nowait(self):
+        return self.queue.get_nowait()
+
+    def empty(self):
+        return self.queue.empty()
+
+    def qsize(self):
+        try:
+            return self.queue.qsize()
+        except NotImplementedError:
+            # sem_getvalue is not available on macOS
+            return 0
+
+    def stats(self):
+        return {
+            "depth": self.qsize(),
+            "max_depth": self.max_depth,
+            "maxsize": self.maxsize,
+            "policy": self.policy,
+            "puts": self.puts,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+        }
+
+
+def _wake_one(waiters):
+    """Wakes the first coroutine still waiting, from any thread. Called with the queue mutex held."""
+    while waiters:
+        waiter = waiters.popleft()
+        if not waiter.done():
+            waiter.get_loop().call_soon_threadsafe(_set_done, waiter)
+            return
+
+
+def _set_done(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+async def async_get(queue):
+    """Gets an item from any queue of the pipeline from a coroutine, through a worker thread if it has no async_get."""
+    if hasattr(queue, "async_get"):
+        return await queue.async_get()
+    return await asyncio.to_thread(queue.get)
+
+
+async def async_put(queue, item):
+    """Puts an item in any queue of the pipeline from a coroutine, through a worker thread if it has no async_put."""
+    if hasattr(queue, "async_put"):
+        await queue.async_put(item)
+    else:
+        await asyncio.to_thread(queue.put, item)
+
+
+def queue_stats(queues_and_events):
+    """
+    Returns the stats of every queue of a `initialize_queues_and_events` dict, keyed by name.
+    """
+    return {
+        name: queue.stats()
+        for name, queue in queues_and_events.items()
+        if hasattr(queue, "stats")
+    }
@@ -0,0 +1,27 @@
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+_loop = None
+_lock = threading.Lock()
+
+
+def shared_event_loop():
+    """
+    Returns the event loop shared by every AsyncBaseHandler of the process, running in a daemon thread.
+    It is started on first use.
+    """
+    global _loop
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="handlers-event-loop", daemon=True).start()
+            logger.debug("Shared event loop started")
+        return _loop
+
+
+def run_on_shared_loop(coroutine):
+    """Runs `coroutine` on the shared event loop and blocks until it returns. Must not be called from the loop."""
+    return asyncio.run_coroutine_threadsafe(coroutine, shared_event_loop()).result()
@@ -0,0 +1,190 @@
+import json
+import logging
+import math
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyHistogram:
+    """
+    Streaming histogram of durations in seconds, in the spirit of HdrHistogram.
+    Values are counted in logarithmic buckets, so memory is constant whatever the number of samples
+    and any percentile is known within `precision` relative error.
+    """
+
+    def __init__(self, min_value=1e-5, max_value=1e3, precision=0.02):
+        self.min_value = min_value
+        self.max_value = max_value
+        self._log_base = math.log1p(precision)
+        self.counts = [0] * (int(math.log(max_value / min_value) / self._log_base) + 2)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = None
+
+    def _index(self, value):
+        if value <= self.min_value:
+            return 0
+        index = int(math.log(value / self.min_value) / self._log_base) + 1
+        return min(index, len(self.counts) - 1)
+
+    def _bucket_value(self, index):
+        if index == 0:
+            return self.min_value
+        # geometric middle of the bucket
+        return self.min_value * math.exp((index - 0.5) * self._log_base)
+
+    def record(self, value):
+        self.counts[self._index(value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self.last = value
+
+    def percentile(self, q):
+        if self.count == 0:
+            return None
+        target = max(1, math.ceil(q / 100 * self.count))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(self._bucket_value(index), self.max)
+        return self.max
+
+    def merge(self, other):
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def summary(self):
+        """Count, mean and percentiles, in milliseconds."""
+
+        def ms(value):
+            return None if value is None else round(value * 1000, 3)
+
+        return {
+            "count": self.count,
+            "mean_ms": ms(self.total / self.count if self.count else None),
+            "p50_ms": ms(self.percentile(50)),
+            "p95_ms": ms(self.percentile(95)),
+            "p99_ms": ms(self.percentile(99)),
+            "max_ms": ms(self.max if self.count else None),
+        }
+
+
+class MetricsRegistry:
+    """
+    Collects the latency histograms of the running handlers, the queues of the running sessions, and the counters of
+    shared components such as caches (any object with a `stats` method).
+    Histograms are registered per stage and per session (None for the single session pipeline). When a handler
+    stops, its histogram is folded into the stage totals so the per-stage view covers every call served.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.retired = {}
+        self.queues = {}
+        self.counters = {}
+
+    def register(self, stage, session_id, histogram):
+        with self.lock:
+            self.histograms[(stage, session_id)] = histogram
+
+    def unregister(self, stage, session_id):
+        with self.lock:
+            histogram = self.histograms.pop((stage, session_id), None)
+            if histogram is not None:
+                self.retired.setdefault(stage, LatencyHistogram()).merge(histogram)
+
+    def register_queues(self, session_id, queues_and_events):
+        with self.lock:
+            self.queues[session_id] = queues_and_events
+
+    def unregister_queues(self, session_id):
+        with self.lock:
+            self.queues.pop(session_id, None)
+
+    def register_counters(self, name, source):
+        with self.lock:
+            self.counters[name] = source
+
+    def unregister_session(self, session_id):
+        """Folds every histogram of the session into the stage totals and forgets its queues."""
+        with self.lock:
+            for stage, histogram_session_id in list(self.histograms):
+                if histogram_session_id == session_id:
+                    histogram = self.histograms.pop((stage, histogram_session_id))
+                    self.retired.setdefault(stage, LatencyHistogram()).merge(histogram)
+            self.queues.pop(session_id, None)
+
+    def record(self, stage, session_id, value):
+        """Records a value in a histogram owned by the registry, e.g. for measures spanning several handlers."""
+        with self.lock:
+            histogram = self.histograms.get((stage, session_id))
+            if histogram is None:
+                histogram = self.histograms[(stage, session_id)] = LatencyHistogram()
+        histogram.record(value)
+
+    def snapshot(self):
+        with self.lock:
+            histograms = dict(self.histograms)
+            retired = dict(self.retired)
+            queues = dict(self.queues)
+            counters = dict(self.counters)
+
+        stages = {}
+        for stage, histogram in retired.items():
+            stages.setdefault(stage, LatencyHistogram()).merge(histogram)
+        sessions = {}
+        for (stage, session_id), histogram in histograms.items():
+            stages.setdefault(stage, LatencyHistogram()).merge(histogram)
+            sessions.setdefault(str(session_id), {})[stage] = histogram.summary()
+
+        return {
+            "stages": {stage: histogram.summary() for stage, histogram in stages.items()},
+            "sessions": sessions,
+            "queues": {
+                str(session_id): {
+                    name: queue.stats()
+                    for name, queue in queues_and_events.items()
+                    if hasattr(queue, "stats")
+                }
+                for session_id, queues_and_events in queues.items()
+            },
+            "counters": {name: source.stats() for name, source in counters.items()},
+        }
+
+
+metrics = MetricsRegistry()
+
+
+def serve_metrics(port, host="0.0.0.0"):
+    """
+    Serves `metrics.snapshot()` as JSON on GET /metrics from a daemon thread.
+    """
+
+    class MetricsRequestHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") != "/metrics":
+                self.send_error(404)
+                return
+            body = json.dumps(metrics.snapshot()).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"Metrics served on http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,47 @@
+import inspect
+import logging
+from time import perf_counter
+
+import numpy as np
+
+from utils.turn_trace import unwrap
+
+logger = logging.getLogger(__name__)
+
+
+def run_process(handler, input):
+    """Runs `process` of a handler on one input outside of the pipeline and returns all its outputs."""
+    outputs = handler.process(input)
+    if inspect.isasyncgen(outputs):
+
+        async def collect():
+            return [output async for output in outputs]
+
+        outputs = handler.run_sync(collect())
+    return [unwrap(output)[0] for output in outputs]
+
+
+def render_opener(lm, tts, text=None, prompt=None):
+    """
+    Prepares the first assistant turn of the calls before any of them starts: its text is `text`, or is generated by
+    the LLM from the initial chat prompt and `prompt`, and it is synthesized by the TTS.
+    The text seeds the chat of the LLM, which every session forks, so the conversation follows from the opener.
+    Returns the audio, int16 samples at 16 kHz.
+    """
+    start = perf_counter()
+    if text is None:
+        checkpoint = lm.chat.checkpoint()
+        sentences = run_process(lm, prompt)
+        # the instruction is not part of the conversation, only the answer is
+        lm.chat.rollback(checkpoint)
+        text = " ".join(
+            (sentence[0] if isinstance(sentence, tuple) else sentence).strip() for sentence in sentences
+        ).strip()
+    if not text:
+        raise ValueError("The call opener is empty.")
+    lm.chat.open_with(text)
+
+    frames = run_process(tts, text)
+    audio = np.concatenate(frames).astype(np.int16, copy=False)
+    logger.info(f"Call opener rendered in {perf_counter() - start:.3f} s, {len(audio) / 16000:.1f} s of audio: {text}")
+    return audio
@@ -0,0 +1,160 @@
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text):
+    """The text of a phrase as far as the synthesis is concerned: unicode and whitespace variants are folded."""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip()
+
+
+def new_phrase_cache(directory, memory_mb=64, disk_mb=1024):
+    """A PhraseCache in `directory`, or None when no directory is set."""
+    if directory is None:
+        return None
+    return PhraseCache(directory, memory_mb=memory_mb, disk_mb=disk_mb)
+
+
+class PhraseCache:
+    """
+    Content-addressed cache of synthesized phrases, as int16 PCM, so that the lines said on every call (openers,
+    escalations) are synthesized once. Entries are keyed on the normalized text, the voice, the model and the output
+    format (`PhraseCache.key`).
+    Two tiers, each evicting its least recently used entries beyond its size: recent phrases are kept in memory, and
+    every phrase is written to `directory` as a raw PCM file, memory-mapped when it is read back. The disk tier
+    survives restarts and is shared by the sessions and the processes using the same directory.
+    """
+
+    SUFFIX = ".pcm"
+
+    def __init__(self, directory, memory_mb=64, disk_mb=1024):
+        self.directory = directory
+        self.memory_bytes = memory_mb * 2**20
+        self.disk_bytes = disk_mb * 2**20
+        self.lock = threading.Lock()
+        # key -> audio, and key -> file size, least recently used first
+        self.memory = OrderedDict()
+        self.memory_size = 0
+        self.disk = OrderedDict()
+        self.disk_size = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        os.makedirs(directory, exist_ok=True)
+        entries = []
+        for entry in os.scandir(directory):
+            if entry.name.endswith(self.SUFFIX) and entry.is_file():
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name[: -len(self.SUFFIX)], stat.st_size))
+        for _, key, size in sorted(entries):
+            self.disk[key] = size
+            self.disk_size += size
+        metrics.register_counters(self.__class__.__name__, self)
+        logger.info(f"Phrase cache in {directory}: {len(self.disk)} phrases, {self.disk_size / 2**20:.1f} MB")
+
+    @staticmethod
+    def key(text, voice, model, output_format):
+        parts = (normalize_text(text), str(voice), str(model), str(output_format))
+        return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + self.SUFFIX)
+
+    def get(self, key):
+        """The audio of a phrase, or None if it has not been synthesized yet."""
+        with self.lock:
+            audio = self.memory.get(key)
+            if audio is not None:
+                self.memory.move_to_end(key)
+                self.memory_hits += 1
+                return audio
+            if key not in self.disk:
+                self.misses += 1
+                return None
+            self.disk.move_to_end(key)
+
+        path = self.path(key)
+        try:
+            audio = np.memmap(path, dtype=np.int16, mode="r")
+            # the recency of the disk tier is that of the files, for the next start
+            os.utime(path)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Dropping unreadable cached phrase {path}: {e}")
+            with self.lock:
+                self.disk_size -= self.disk.pop(key, 0)
+                self.misses += 1
+            return None
+
+        with self.lock:
+            self.disk_hits += 1
+            self._remember(key, audio)
+        return audio
+
+    def put(self, key, audio):
+        """Caches the audio of a phrase, int16 samples."""
+        audio = np.ascontiguousarray(audio, dtype=np.int16)
+        if not len(audio):
+            return
+        # written aside then renamed, a concurrent reader never maps a partial file
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(audio.tobytes())
+            os.replace(temp_path, self.path(key))
+        except OSError as e:
+            logger.warning(f"Could not write cached phrase: {e}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+
+        with self.lock:
+            self.disk_size += audio.nbytes - self.disk.pop(key, 0)
+            self.disk[key] = audio.nbytes
+            evicted = []
+            while self.disk_size > self.disk_bytes and len(self.disk) > 1:
+                old_key, size = self.disk.popitem(last=False)
+                self.disk_size -= size
+                evicted.append(old_key)
+            self._remember(key, audio)
+
+        for old_key in evicted:
+            try:
+                os.remove(self.path(old_key))
+            except OSError:
+                pass
+
+    def _remember(self, key, audio):
+        """Adds a phrase to the memory tier, under the lock."""
+        if audio.nbytes > self.memory_bytes:
+            return
+        self.memory_size += audio.nbytes - getattr(self.memory.pop(key, None), "nbytes", 0)
+        self.memory[key] = audio
+        while self.memory_size > self.memory_bytes:
+            _, old_audio = self.memory.popitem(last=False)
+            self.memory_size -= old_audio.nbytes
+
+    def stats(self):
+        with self.lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 3) if lookups else None,
+                "memory_phrases": len(self.memory),
+                "memory_mb": round(self.memory_size / 2**20, 3),
+                "disk_phrases": len(self.disk),
+                "disk_mb": round(self.disk_size / 2**20, 3),
+            }
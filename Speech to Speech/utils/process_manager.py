@@ -0,0 +1,98 @@
+import logging
+import multiprocessing
+
+from utils.ring_buffer import AudioRingBuffer
+from utils.thread_manager import ThreadManager
+
+logger = logging.getLogger(__name__)
+
+# handlers load their models in the worker, fork would also copy CUDA and thread states of the parent
+mp_context = multiprocessing.get_context("spawn")
+
+
+class ProcessHandler:
+    """
+    A handler to be built and run in a worker process by a ProcessManager.
+    It records the handler class and its constructor arguments, which must be picklable: queues and events
+    shared with the other stages have to be ProcessQueue and multiprocessing events.
+    """
+
+    def __init__(self, cls, stop_event, *args, **kwargs):
+        self.cls = cls
+        self.stop_event = stop_event
+        self.args = args
+        self.kwargs = kwargs
+
+    @property
+    def name(self):
+        return self.cls.__name__
+
+
+def run_handler(cls, stop_event, args, kwargs, log_level):
+    """Entry point of a worker process: builds the handler, loading its model, and runs it until b"END"."""
+    logging.basicConfig(
+        level=log_level.upper(),
+        format="%(asctime)s - %(processName)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    handler = cls(stop_event, *args, **kwargs)
+    try:
+        handler.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # detach from the shared memory of the ring buffers, the main process frees it
+        for queue in (handler.queue_in, handler.queue_out):
+            if isinstance(queue, AudioRingBuffer):
+                queue.close()
+
+
+class ProcessManager:
+    """
+    Drop-in replacement for ThreadManager running each ProcessHandler in its own process, so that CPU-heavy stages
+    (VAD, STT, TTS) do not contend for the GIL. Other handlers keep running in the main process, through a ThreadManager.
+    Handlers communicate through the same `queue_in`/`queue_out` contract, over ProcessQueue.
+    Latency histograms of the worker processes are only logged by them, not served by the parent metrics registry.
+    """
+
+    def __init__(self, handlers, log_level="info", join_timeout=5):
+        self.handlers = handlers
+        self.log_level = log_level
+        self.join_timeout = join_timeout
+        self.thread_manager = ThreadManager(
+            [handler for handler in handlers if not isinstance(handler, ProcessHandler)]
+        )
+        self.processes = []
+
+    def start(self):
+        # start the workers first, their models take the longest to load
+        for handler in self.handlers:
+            if isinstance(handler, ProcessHandler):
+                process = mp_context.Process(
+                    target=run_handler,
+                    args=(handler.cls, handler.stop_event, handler.args, handler.kwargs, self.log_level),
+                    name=handler.name,
+                )
+                self.processes.append(process)
+                process.start()
+                logger.info(f"{handler.name} started in process {process.pid}")
+        self.thread_manager.start()
+
+    def stop(self):
+        for handler in self.handlers:
+            handler.stop_event.set()
+        self.thread_manager.stop()
+        for process in self.processes:
+            process.join(self.join_timeout)
+            if process.is_alive():
+                logger.warning(f"{process.name} did not stop, terminating it")
+                process.terminate()
+                process.join()
+        # no worker reads the ring buffers any more, free their shared memory
+        for handler in self.handlers:
+            if isinstance(handler, ProcessHandler):
+                queues = (handler.kwargs.get("queue_in"), handler.kwargs.get("queue_out"))
+            else:
+                queues = (getattr(handler, "queue_in", None), getattr(handler, "queue_out", None))
+            for queue in queues:
+                if isinstance(queue, AudioRingBuffer):
+                    queue.close()
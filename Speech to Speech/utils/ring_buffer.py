@@ -0,0 +1,174 @@
+import logging
+import threading
+import weakref
+from multiprocessing.shared_memory import SharedMemory
+from queue import Empty
+
+import numpy as np
+
+from utils.bounded_queue import is_end
+
+logger = logging.getLogger(__name__)
+
+# indices of the counters, absolute sample positions that never wrap
+_WRITE, _READ, _ENDED, _DROPPED = range(4)
+
+
+class AudioRingBuffer:
+    """
+    Preallocated ring buffer of int16 samples carrying the incoming audio of a stream to the VAD.
+    Connectors `put` audio of any length (bytes or int16 arrays), which is copied into the ring without allocating;
+    the VAD `get`s fixed windows of `window_size` samples, copied under the lock into a window buffer of the reader,
+    also preallocated. The first window is mirrored after the end of the ring, so that a window crossing the wrap is
+    still contiguous.
+    When the ring is full the oldest samples are dropped, real-time audio is useless once late.
+    It offers the queue interface of the pipeline links, b"END" included, so it can be used as the VAD `queue_in`.
+    With a multiprocessing `context`, samples live in shared memory and the buffer can be passed to a worker process.
+    Each process then `close`s it once done with it, the process that created it also frees the memory, at the
+    latest when it exits.
+
+    The window returned by `get` is overwritten by the next `get`: the reader must be done with it by then.
+    """
+
+    def __init__(self, capacity, window_size=512, context=None, name=None):
+        if capacity < window_size:
+            raise ValueError(f"The ring capacity ({capacity}) should hold at least one window ({window_size}).")
+        self.capacity = capacity
+        self.window_size = window_size
+        self.name = name
+        self.puts = 0
+        self.max_depth = 0
+        self._owner = context is not None
+        self._window = np.zeros(window_size, dtype=np.int16)
+        if context is None:
+            self._shm = None
+            self.counters = np.zeros(4, dtype=np.int64)
+            self.samples = np.zeros(capacity + window_size, dtype=np.int16)
+            self.condition = threading.Condition()
+        else:
+            self._shm = SharedMemory(create=True, size=4 * 8 + (capacity + window_size) * 2)
+            # frees the memory on exit if the pipeline did not stop cleanly
+            self._finalizer = weakref.finalize(self, self._shm.unlink)
+            self._attach()
+            self.counters[:] = 0
+            self.condition = context.Condition()
+
+    def _attach(self):
+        self.counters = np.ndarray(4, dtype=np.int64, buffer=self._shm.buf)
+        self.samples = np.ndarray(
+            self.capacity + self.window_size, dtype=np.int16, buffer=self._shm.buf, offset=4 * 8
+        )
+
+    def __getstate__(self):
+        if self._shm is None:
+            raise TypeError("Only a ring buffer created with a multiprocessing context can be shared with a process.")
+        state = self.__dict__.copy()
+        state["_shm"] = self._shm.name
+        state["_owner"] = False
+        state.pop("_finalizer", None)
+        del state["counters"], state["samples"], state["_window"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._shm = SharedMemory(name=state["_shm"])
+        self._window = np.zeros(self.window_size, dtype=np.int16)
+        self._attach()
+
+    def _available(self):
+        return int(self.counters[_WRITE] - self.counters[_READ])
+
+    def put(self, item, block=True, timeout=None):
+        if is_end(item):
+            with self.condition:
+                self.counters[_ENDED] = 1
+                self.condition.notify_all()
+            return
+        self.write(item)
+
+    def put_nowait(self, item):
+        self.put(item)
+
+    def write(self, audio):
+        data = audio if isinstance(audio, np.ndarray) else np.frombuffer(audio, dtype=np.int16)
+        data = data.reshape(-1)
+        n = len(data)
+        if n == 0:
+            return
+        with self.condition:
+            if n > self.capacity:
+                self.counters[_DROPPED] += n - self.capacity
+                data = data[-self.capacity :]
+                n = self.capacity
+            overflow = self._available() + n - self.capacity
+            if overflow > 0:
+                self.counters[_READ] += overflow
+                self.counters[_DROPPED] += overflow
+                dropped = int(self.counters[_DROPPED])
+                # log the first drop, then once per ring worth of dropped audio
+                if dropped == overflow or dropped // self.capacity != (dropped - overflow) // self.capacity:
+                    logger.warning(f"Ring buffer {self.name} is full, {dropped} samples dropped so far")
+
+            start = int(self.counters[_WRITE] % self.capacity)
+            first = min(n, self.capacity - start)
+            self.samples[start : start + first] = data[:first]
+            if first < n:
+                self.samples[: n - first] = data[first:]
+            if start < self.window_size or first < n:
+                # keep the mirror of the first window up to date
+                self.samples[self.capacity :] = self.samples[: self.window_size]
+            self.counters[_WRITE] += n
+
+            self.puts += 1
+            self.max_depth = max(self.max_depth, self._available() // self.window_size)
+            self.condition.notify()
+
+    def get(self, block=True, timeout=None):
+        with self.condition:
+            if block:
+                self.condition.wait_for(
+                    lambda: self._available() >= self.window_size or self.counters[_ENDED],
+                    timeout,
+                )
+            if self._available() < self.window_size:
+                if self.counters[_ENDED]:
+                    self.counters[_ENDED] = 0
+                    return b"END"
+                raise Empty
+            start = int(self.counters[_READ] % self.capacity)
+            # copied before the lock is released, a full ring would let the writer overwrite the window
+            self._window[:] = self.samples[start : start + self.window_size]
+            self.counters[_READ] += self.window_size
+        return self._window
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def qsize(self):
+        with self.condition:
+            return self._available() // self.window_size
+
+    def empty(self):
+        with self.condition:
+            return self._available() < self.window_size and not self.counters[_ENDED]
+
+    def stats(self):
+        with self.condition:
+            return {
+                "depth": self._available() // self.window_size,
+                "max_depth": self.max_depth,
+                "maxsize": self.capacity // self.window_size,
+                "policy": "drop_oldest",
+                "puts": self.puts,
+                "dropped_samples": int(self.counters[_DROPPED]),
+            }
+
+    def close(self):
+        """Releases the shared memory, if any. The process that created the buffer also frees it."""
+        if self._shm is None or self.samples is None:
+            return
+        self.counters = self.samples = None
+        self._shm.close()
+        if self._owner:
+            self._finalizer.detach()
+            self._shm.unlink()
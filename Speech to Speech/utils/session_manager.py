@@ -0,0 +1,127 @@
+import logging
+import threading
+import uuid
+
+from utils.bounded_queue import queue_stats
+from utils.metrics import metrics
+from utils.ring_buffer import AudioRingBuffer
+from utils.thread_manager import ThreadManager
+
+logger = logging.getLogger(__name__)
+
+
+class PipelineSession:
+    """
+    A single conversation running on handlers shared through a SessionManager.
+    It owns its queues and events, the handlers forked for it and the ThreadManager running them.
+    """
+
+    def __init__(self, session_id, queues_and_events, handlers):
+        self.session_id = session_id
+        self.queues_and_events = queues_and_events
+        self.handlers = handlers
+        self.thread_manager = ThreadManager(handlers)
+
+    @property
+    def stop_event(self):
+        return self.queues_and_events["stop_event"]
+
+    @property
+    def should_listen(self):
+        return self.queues_and_events["should_listen"]
+
+    @property
+    def recv_audio_chunks_queue(self):
+        return self.queues_and_events["recv_audio_chunks_queue"]
+
+    @property
+    def send_audio_chunks_queue(self):
+        return self.queues_and_events["send_audio_chunks_queue"]
+
+    def start(self):
+        self.thread_manager.start()
+
+    def stop(self):
+        # b"END" cascades through the handlers so that none of them stays blocked on its input queue
+        self.recv_audio_chunks_queue.put(b"END")
+        self.thread_manager.stop()
+        if isinstance(self.recv_audio_chunks_queue, AudioRingBuffer):
+            self.recv_audio_chunks_queue.close()
+
+
+class SessionManager:
+    """
+    Runs any number of concurrent conversations on a single set of loaded handlers.
+    The VAD, STT, LM and TTS handlers passed here are only used as prototypes: each session gets forks of them
+    (see `BaseHandler.fork`) bound to its own queues, events and chat history, while models are loaded only once.
+    """
+
+    def __init__(self, vad, stt, lm, tts, queues_factory, max_sessions=None):
+        self.vad = vad
+        self.stt = stt
+        self.lm = lm
+        self.tts = tts
+        self.queues_factory = queues_factory
+        self.max_sessions = max_sessions
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def open_session(self, session_id=None):
+        with self.lock:
+            if self.max_sessions is not None and len(self.sessions) >= self.max_sessions:
+                raise RuntimeError(
+                    f"Cannot open a new session, {self.max_sessions} sessions are already running."
+                )
+            session_id = session_id or uuid.uuid4().hex
+            queues_and_events = self.queues_factory()
+            stop_event = queues_and_events["stop_event"]
+            should_listen = queues_and_events["should_listen"]
+            handlers = [
+                self.vad.fork(
+                    stop_event,
+                    queue_in=queues_and_events["recv_audio_chunks_queue"],
+                    queue_out=queues_and_events["spoken_prompt_queue"],
+                    setup_args=(should_listen,),
+                    session_id=session_id,
+                ),
+                self.stt.fork(
+                    stop_event,
+                    queue_in=queues_and_events["spoken_prompt_queue"],
+                    queue_out=queues_and_events["text_prompt_queue"],
+                    session_id=session_id,
+                ),
+                self.lm.fork(
+                    stop_event,
+                    queue_in=queues_and_events["text_prompt_queue"],
+                    queue_out=queues_and_events["lm_response_queue"],
+                    session_id=session_id,
+                ),
+                self.tts.fork(
+                    stop_event,
+                    queue_in=queues_and_events["lm_response_queue"],
+                    queue_out=queues_and_events["send_audio_chunks_queue"],
+                    setup_args=(should_listen,),
+                    session_id=session_id,
+                ),
+            ]
+            session = PipelineSession(session_id, queues_and_events, handlers)
+            self.sessions[session_id] = session
+            metrics.register_queues(session_id, queues_and_events)
+
+        session.start()
+        logger.info(f"Session {session_id} started ({len(self.sessions)} running)")
+        return session
+
+    def close_session(self, session_id):
+        with self.lock:
+            session = self.sessions.pop(session_id, None)
+        if session is None:
+            return
+        session.stop()
+        metrics.unregister_session(session_id)
+        logger.info(f"Session {session_id} closed ({len(self.sessions)} running)")
+        logger.info(f"Session {session_id} queues: {queue_stats(session.queues_and_events)}")
+
+    def stop(self):
+        for session_id in list(self.sessions):
+            self.close_session(session_id)
@@ -1,17 +1,27 @@
+import asyncio
 import threading
 
+from baseHandler import AsyncBaseHandler
+from utils.event_loop import shared_event_loop
+
 
 class ThreadManager:
     """
     Manages multiple threads used to execute given handler tasks.
+    Async handlers are not given a thread, they run as tasks of the shared event loop.
     """
 
     def __init__(self, handlers):
         self.handlers = handlers
         self.threads = []
+        self.tasks = []
 
     def start(self):
         for handler in self.handlers:
+            if isinstance(handler, AsyncBaseHandler):
+                task = asyncio.run_coroutine_threadsafe(handler.run_async(), shared_event_loop())
+                self.tasks.append(task)
+                continue
             thread = threading.Thread(target=handler.run)
             self.threads.append(thread)
             thread.start()
@@ -21,3 +31,5 @@ class ThreadManager:
             handler.stop_event.set()
         for thread in self.threads:
             thread.join()
+        for task in self.tasks:
+            task.result()
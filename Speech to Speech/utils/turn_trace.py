@@ -0,0 +1,129 @@
+import itertools
+import logging
+import threading
+from time import perf_counter
+
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Events of a turn, in pipeline order
+TURN_EVENTS = (
+    "end_of_speech",
+    "transcript_ready",
+    "first_llm_token",
+    "first_sentence",
+    "first_tts_audio",
+    "first_byte_sent",
+)
+
+
+class TurnTrace:
+    """
+    Timestamps of a single conversation turn, from the end of the user speech to the first audio sent back.
+    The trace is created by the VAD and travels with every item derived from the utterance (see `TracedItem`),
+    so each stage can mark its own events whatever thread, or module, it runs in.
+    Cancelling the trace (e.g. when the user barges in) tells every stage to drop the work left for the turn.
+    The connection finishes the trace once the audio of the turn was played: there is nothing left to cancel.
+    A speculative turn is started before the end of speech is confirmed: stages may work on it, but nothing should
+    reach the user until it is committed. It is settled once committed or cancelled.
+    """
+
+    _ids = itertools.count()
+
+    def __init__(self, session_id=None, speculative=False):
+        self.turn_id = next(TurnTrace._ids)
+        self.session_id = session_id
+        self.timestamps = {}
+        self.cancelled = False
+        self.finished = False
+        self.speculative = speculative
+        self.committed = not speculative
+        self._settled = threading.Event()
+        if not speculative:
+            self._settled.set()
+
+    def cancel(self):
+        self.cancelled = True
+        self._settled.set()
+
+    def finish(self):
+        self.finished = True
+
+    def commit(self):
+        self.committed = True
+        self._settled.set()
+
+    @property
+    def settled(self):
+        return self._settled.is_set()
+
+    def wait_settled(self, timeout=None):
+        """Blocks until the turn is committed or cancelled. Returns False on timeout."""
+        return self._settled.wait(timeout)
+
+    def __getstate__(self):
+        # traces are copied to worker processes along with the items, where they can no longer be settled
+        state = self.__dict__.copy()
+        state["_settled"] = self._settled.is_set()
+        return state
+
+    def __setstate__(self, state):
+        settled = state.pop("_settled")
+        self.__dict__.update(state)
+        self._settled = threading.Event()
+        if settled:
+            self._settled.set()
+
+    def mark(self, event):
+        """
+        Records the time of `event` the first time it happens in the turn.
+        Returns True if this call recorded it.
+        """
+        if event in self.timestamps:
+            return False
+        self.timestamps[event] = perf_counter()
+        return True
+
+    def breakdown(self):
+        """Delay of each recorded event since the end of speech, in seconds."""
+        start = self.timestamps.get("end_of_speech")
+        if start is None:
+            return {}
+        return {
+            event: self.timestamps[event] - start
+            for event in TURN_EVENTS
+            if event in self.timestamps and event != "end_of_speech"
+        }
+
+    def report(self):
+        """Logs the breakdown of the turn and records it in the metrics registry."""
+        breakdown = self.breakdown()
+        for event, delay in breakdown.items():
+            metrics.record(f"turn.{event}", self.session_id, delay)
+        logger.info(
+            f"Turn {self.turn_id}: "
+            + ", ".join(f"{event} +{delay:.3f} s" for event, delay in breakdown.items())
+        )
+
+
+class TracedItem:
+    """
+    An item of a pipeline queue along with the trace of the turn it belongs to.
+    A turn may be sent in several segments, e.g. when the user speaks longer than `max_speech_ms`: all but the last
+    are not `final`.
+    """
+
+    __slots__ = ("payload", "trace", "final")
+
+    def __init__(self, payload, trace, final=True):
+        self.payload = payload
+        self.trace = trace
+        self.final = final
+
+
+def unwrap(item):
+    """Returns the payload of a queue item and its trace, None for items that are not traced."""
+    if isinstance(item, TracedItem):
+        return item.payload, item.trace
+    return item, None
@@ -0,0 +1,22 @@
+import itertools
+
+
+class Utterance:
+    """
+    Speech sent by the VAD to the STT when partial transcription is enabled (`partial_interval_ms`).
+    While the user speaks, the VAD regularly sends the audio of the utterance so far as a partial utterance, so the STT
+    can transcribe it incrementally; the last one is final. All of them share the `utterance_id` of the utterance.
+    """
+
+    __slots__ = ("audio", "utterance_id", "final")
+
+    _ids = itertools.count()
+
+    def __init__(self, audio, utterance_id, final=False):
+        self.audio = audio
+        self.utterance_id = utterance_id
+        self.final = final
+
+    @classmethod
+    def new_id(cls):
+        return next(cls._ids)